@@ -1,207 +1,494 @@
-from fastapi import APIRouter, Header, HTTPException
+from fastapi import (
+    APIRouter,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import PlainTextResponse
 from typing import Annotated
 from dotenv import load_dotenv
 import os
 from uuid import uuid4
 from pydantic import BaseModel, Field
 from pathlib import Path
+import asyncio
+from contextlib import asynccontextmanager
 import base64
 import numpy as np
 import cv2
-from pymongo import MongoClient
+import logging
 import shutil
 
 import subprocess
-import pandas as pd
-
-from deepface import DeepFace
-
+import threading
+import time
+from functools import partial
+
+import database
+import facs
+import models
+import motion
+from batching import EmotionBatcher
+from capture import capture_settings, decode_image
+from executor import analysis_executor
+from logs import LOG_SAMPLE_RATE, log_event
+from metrics import Callback, errors, registry, stage, stage_seconds, timed_stage
+from openface_pool import OpenFacePool
+from result_cache import create_result_cache
+from session_store import create_session_store
+from timeline import TIMELINE, Timelines, downsample
+from tracking import FACE_TRACKING, FaceTracker
 
 load_dotenv()
 
 
 AUTHORIZATION_KEY = os.getenv("AUTHORIZATION_KEY")
 
-UPLOAD_DIR = Path("./uploaded_images")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
 # Path to OpenFace FeatureExtraction executable
 OPENFACE_EXECUTABLE = os.getenv("OPENFACE_EXECUTABLE")
 
-# Create output directory for OpenFace
-OPENFACE_OUTPUT_DIR = Path("./openface_output")
+# Create output directory for OpenFace. OpenFace can only read frames from
+# files, so default to a RAM-backed tmpfs when the host has one.
+DEFAULT_OPENFACE_OUTPUT_DIR = (
+    "/dev/shm/openface_output" if Path("/dev/shm").is_dir() else "./openface_output"
+)
+OPENFACE_OUTPUT_DIR = Path(
+    os.getenv("OPENFACE_OUTPUT_DIR", DEFAULT_OPENFACE_OUTPUT_DIR)
+)
 OPENFACE_OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Streaming OpenFace worker command, see openface_pool.py. Unset by default:
+# no streaming wrapper ships with this repo, so every frame runs its own
+# FeatureExtraction process.
+OPENFACE_WORKER_COMMAND = os.getenv("OPENFACE_WORKER_COMMAND")
+OPENFACE_POOL_SIZE = int(os.getenv("OPENFACE_POOL_SIZE", "2"))
+OPENFACE_TIMEOUT = float(os.getenv("OPENFACE_TIMEOUT", "10"))
+OPENFACE_HEALTH_INTERVAL = float(os.getenv("OPENFACE_HEALTH_INTERVAL", "30"))
+
+# Batch emotion inference across concurrent requests
+EMOTION_BATCHING = os.getenv("EMOTION_BATCHING", "false").lower() == "true"
+EMOTION_MAX_BATCH = int(os.getenv("EMOTION_MAX_BATCH", "8"))
+EMOTION_MAX_WAIT_MS = float(os.getenv("EMOTION_MAX_WAIT_MS", "10"))
+
 router = APIRouter()
 
-mongo = MongoClient(os.getenv("MONGO"))
-db = mongo.data.results
+db = database.collection("data", "results")
+
+# DeepFace emotion labels
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+# Emotions map_aus_to_emotion can return
+FACS_EMOTIONS = facs.scorer.emotions + ["neutral"]
+
+sessions = create_session_store(
+    "api",
+    layout={
+        "emo": EMOTIONS,
+        "action_units": facs.ACTION_UNITS,
+        "facs_emotions": FACS_EMOTIONS,
+    },
+)
+
+# With face tracking on, analysis gets face crops and skips detection
+face_tracker = FaceTracker() if FACE_TRACKING else None
+DETECTOR_BACKEND = "skip" if FACE_TRACKING else models.DETECTOR_BACKEND
+
+emotion_batcher = EmotionBatcher(
+    partial(models.predict_emotions, detector_backend=DETECTOR_BACKEND),
+    max_batch=EMOTION_MAX_BATCH,
+    max_wait=EMOTION_MAX_WAIT_MS / 1000,
+)
+
+result_cache = create_result_cache()
+
+motion_gate = motion.MotionGate() if motion.MOTION_GATE_THRESHOLD > 0 else None
+
+# Channels of a frame in the session timeline
+TIMELINE_LAYOUT = {
+    "emotion": EMOTIONS,
+    "action_units": facs.ACTION_UNITS,
+    "facs": facs.scorer.emotions,
+}
+
+timelines = Timelines(TIMELINE_LAYOUT) if TIMELINE else None
+
+openface_pool = None
+openface_pool_lock = threading.Lock()
+
+registry.register(
+    Callback("emocean_active_sessions", "Sessions in progress", sessions.count)
+)
+registry.register(
+    Callback(
+        "emocean_analysis_pending",
+        "Frames holding an analysis slot",
+        lambda: analysis_executor.pending,
+    )
+)
+registry.register(
+    Callback(
+        "emocean_emotion_batch_queue",
+        "Frames waiting for an emotion batch",
+        emotion_batcher.queued,
+    )
+)
+registry.register(
+    Callback(
+        "emocean_openface_idle_workers",
+        "Idle OpenFace workers",
+        lambda: openface_pool.stats()["idle"] if openface_pool is not None else None,
+    )
+)
+registry.register(
+    Callback(
+        "emocean_result_cache_total",
+        "Result cache lookups and evictions",
+        lambda: (
+            {
+                "hit": result_cache.hits,
+                "miss": result_cache.misses,
+                "eviction": result_cache.evictions,
+            }
+            if result_cache is not None
+            else None
+        ),
+        type="counter",
+        label="outcome",
+    )
+)
 
-sessions = {}
 
+def start_openface_pool():
+    """
+    Starts the OpenFace worker pool, once per server process. If it cannot
+    start, frames fall back to a FeatureExtraction process each.
+    """
+    global openface_pool
+
+    if not OPENFACE_WORKER_COMMAND:
+        return None
+
+    with openface_pool_lock:
+        if openface_pool is None:
+            pool = OpenFacePool(
+                OPENFACE_WORKER_COMMAND,
+                size=OPENFACE_POOL_SIZE,
+                timeout=OPENFACE_TIMEOUT,
+                health_interval=OPENFACE_HEALTH_INTERVAL,
+            )
+            try:
+                pool.start()
+            except Exception as e:
+                pool.close()
+                log_event("openface_pool_failed", logging.ERROR, error=str(e))
+                return None
+            openface_pool = pool
+            log_event("openface_pool_ready", size=OPENFACE_POOL_SIZE)
+
+    return openface_pool
+
+
+def close_openface_pool():
+    global openface_pool
+
+    with openface_pool_lock:
+        if openface_pool is not None:
+            openface_pool.close()
+            openface_pool = None
+
+
+def encode_image(img: np.ndarray):
+    return cv2.imencode(".jpeg", img)[1].tobytes()
 
-def process_image_deepface(img_path: str):
-    result = DeepFace.analyze(img_path=img_path, actions=["emotion"])
+
+def process_image_deepface(img: np.ndarray):
+    with stage("deepface"):
+        result = models.deepface().analyze(
+            img_path=img, actions=["emotion"], detector_backend=DETECTOR_BACKEND
+        )
     return result[0]["emotion"]
 
 
-def process_image_facs(img_path: str):
+def process_image_facs(image_bytes: bytes, file_extension: str = "jpeg"):
     """
     Process an image using OpenFace to extract FACS Action Units
     """
+    # Started by the lifespan; until then, or if it failed, one process per frame
+    pool = openface_pool
+    if pool is not None:
+        try:
+            return facs_result(pool.analyze(image_bytes))
+        except Exception as e:
+            return {"error": f"OpenFace processing failed: {str(e)}"}
+
     if not OPENFACE_EXECUTABLE or not Path(OPENFACE_EXECUTABLE).exists():
-        print(f"OpenFace executable not found at: {OPENFACE_EXECUTABLE}")
+        log_event("openface_not_found", logging.ERROR, executable=OPENFACE_EXECUTABLE)
         return {"error": "OpenFace executable not configured correctly"}
 
-    base_filename = Path(img_path).stem
-    os.mkdir(OPENFACE_OUTPUT_DIR / base_filename)
-    output_file = (OPENFACE_OUTPUT_DIR / base_filename) / f"{base_filename}.csv"
+    base_filename = str(uuid4())
+    frame_dir = OPENFACE_OUTPUT_DIR / base_filename
+    os.mkdir(frame_dir)
+    output_file = frame_dir / f"{base_filename}.csv"
+
+    # Hand OpenFace the original encoded bytes, no re-encode
+    img_path = frame_dir / f"{base_filename}.{file_extension}"
+    with stage("file_write"):
+        img_path.write_bytes(image_bytes)
 
     # Execute OpenFace
     command = [
         OPENFACE_EXECUTABLE,
         "-f",
-        img_path,
+        str(img_path),
         "-out_dir",
-        str(OPENFACE_OUTPUT_DIR / base_filename),
+        str(frame_dir),
         "-au_static",
         "true",
     ]
 
     try:
-        result = subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
+        with stage("openface"):
+            result = subprocess.run(
+                command,
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
 
         # Read the output CSV file
         if output_file.exists():
-            df = pd.read_csv(str(output_file))
-
-            # Extract AU intensity values (AU*_r columns)
-            au_columns = [
-                col for col in df.columns if col.startswith("AU") and col.endswith("_r")
-            ]
-            au_values = {
-                col.split("_")[0]: float(df[col].iloc[0])
-                for col in au_columns
-                if not pd.isna(df[col].iloc[0])
-            }
-
-            emotion = map_aus_to_emotion(au_values)
+            with stage("csv_parse"):
+                au_values = facs.au_reader.read_csv(str(output_file))
+            if not len(au_values):
+                return {"error": "OpenFace processing failed - no face found"}
 
-            try:
-                shutil.rmtree(
-                    str(OPENFACE_OUTPUT_DIR / base_filename), ignore_errors=True
-                )
-            except Exception as e:
-                pass
-
-            return {
-                "action_units": au_values,
-                "emotion": emotion,
-                "confidence": max(au_values.values()) if au_values else 0.0,
-            }
+            return facs_result(au_values[0])
         else:
             return {"error": "OpenFace processing failed - no output file"}
     except Exception as e:
         return {"error": f"OpenFace processing failed: {str(e)}"}
+    finally:
+        shutil.rmtree(str(frame_dir), ignore_errors=True)
+
+
+async def analyze_frame(
+    image_bytes: bytes, file_extension: str = "jpeg", session_id: str = None
+):
+    """
+    Decodes a frame and runs DeepFace and OpenFace on it concurrently, off the
+    event loop. Returns (emotion, FACS result, skipped), where skipped means
+    the frame barely differed from the session's last analyzed frame and got
+    its result.
+    """
+    im = await timed_stage("imdecode", analysis_executor.run(decode_image, image_bytes))
+
+    if im is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
+    gated = motion_gate is not None and session_id is not None
+    if gated:
+        thumb = await analysis_executor.run(motion.thumbnail, im)
+        previous = motion_gate.check(session_id, thumb)
+        if previous is not None:
+            return (*previous, True)
+
+    result = await analyze_image(im, image_bytes, file_extension, session_id)
+
+    if gated and "error" not in result[1]:
+        motion_gate.record(session_id, thumb, result)
+
+    return (*result, False)
+
+
+async def analyze_image(
+    im: np.ndarray, image_bytes: bytes, file_extension: str, session_id: str = None
+):
+    if result_cache is not None:
+        keys, cached = await asyncio.to_thread(result_cache.lookup, im, session_id)
+        if cached is not None:
+            return cached
+
+    if face_tracker is not None:
+        face = await asyncio.to_thread(face_tracker.locate, session_id, im)
+        if face is None:
+            raise ValueError("Face could not be detected in the frame")
+
+        # Both analyzers get the same tracked crop
+        im = face
+        image_bytes = await analysis_executor.run(encode_image, face)
+        file_extension = "jpeg"
+
+    # Process with DeepFace for emotion detection
+    if EMOTION_BATCHING:
+        # Includes waiting for the batch to fill
+        emotion_task = timed_stage("deepface", emotion_batcher.submit(im))
+    else:
+        emotion_task = analysis_executor.run(process_image_deepface, im)
+
+    # Process with OpenFace for FACS analysis
+    facs_task = analysis_executor.run(process_image_facs, image_bytes, file_extension)
+
+    result = await asyncio.gather(emotion_task, facs_task)
+
+    # Failed OpenFace runs are retried rather than cached
+    if result_cache is not None and "error" not in result[1]:
+        await asyncio.to_thread(result_cache.put, keys, result)
+
+    return result
+
+
+def facs_result(au_vector: np.ndarray):
+    au_values = facs.au_reader.to_dict(au_vector)
+    scores = facs.scorer.score_one(au_values)
+
+    return {
+        "action_units": au_values,
+        "emotion": facs.scorer.dominant_one(scores),
+        "scores": dict(zip(facs.scorer.emotions, scores)),
+        "confidence": max(au_values.values()) if au_values else 0.0,
+    }
 
 
 def map_aus_to_emotion(aus):
     """
     Map Action Units to basic emotions based on FACS coding
     """
-    emotions = {
-        "happy": 0.0,
-        "sad": 0.0,
-        "angry": 0.0,
-        "fear": 0.0,
-        "disgust": 0.0,
-        "surprise": 0.0,
-        "contempt": 0.0,
+    return facs.scorer.dominant_one(facs.scorer.score_one(aus))
+
+
+def finalize_session(session_id: str):
+    """
+    Ends a session, stores its summary and returns it, or None if the session
+    does not exist
+    """
+    results = sessions.pop(session_id)
+
+    if results is None:
+        return None
+
+    if motion_gate is not None:
+        motion_gate.pop(session_id)
+    if face_tracker is not None:
+        face_tracker.pop(session_id)
+
+    records = results.pop("records", None)
+    return_dict = summarize_session(results)
+
+    document = {"session_id": session_id, **return_dict}
+    timeline = timelines.build(records) if timelines is not None else None
+    if timeline is not None:
+        document["timeline"] = timeline.summary()
+
+    # Store results in database
+    with stage("mongo_insert"):
+        db.insert_one(document)
+        if timeline is not None:
+            db.insert_many(timeline.documents(session_id))
+
+    return return_dict
+
+
+def summarize_session(results: dict):
+    """
+    The dominant DeepFace and FACS emotions of a session's aggregate
+    """
+    # Process emotion results from deepface
+    emo = dict(results.get("emo", {}))
+    if "neutral" in emo:
+        del emo["neutral"]
+
+    emotion, confidence = (
+        max(emo.items(), key=lambda x: x[1]) if emo else ("unknown", 0.0)
+    )
+
+    # Get FACS results if available
+    facs_emotion = None
+    facs_confidence = 0.0
+
+    facs_emotions = results.get("facs_emotions", {})
+    if facs_emotions:
+        facs_emotion, facs_confidence = max(facs_emotions.items(), key=lambda x: x[1])
+
+    frame_count = results.get("frames", 0)
+
+    return {
+        "emotion": emotion,
+        "confidence": confidence,
+        "facs_emotion": facs_emotion,
+        "facs_confidence": facs_confidence,
+        "frames": frame_count,
+        "skip_rate": results.get("skipped", 0) / frame_count if frame_count else 0.0,
     }
 
-    # Happiness: AU6 (cheek raiser) + AU12 (lip corner puller)
-    if "AU06" in aus and "AU12" in aus:
-        emotions["happy"] = (aus["AU06"] + aus["AU12"]) / 2
-
-    # Sadness: AU1 (inner brow raiser) + AU4 (brow lowerer) + AU15 (lip corner depressor)
-    if "AU01" in aus and "AU04" in aus and "AU15" in aus:
-        emotions["sad"] = (aus["AU01"] + aus["AU04"] + aus["AU15"]) / 3
-
-    # Anger: AU4 (brow lowerer) + AU5 (upper lid raiser) + AU7 (lid tightener) + AU23 (lip tightener)
-    if "AU04" in aus and "AU07" in aus:
-        anger_score = 0
-        count = 0
-        if "AU04" in aus:
-            anger_score += aus["AU04"]
-            count += 1
-        if "AU05" in aus:
-            anger_score += aus["AU05"]
-            count += 1
-        if "AU07" in aus:
-            anger_score += aus["AU07"]
-            count += 1
-        if "AU23" in aus:
-            anger_score += aus["AU23"]
-            count += 1
-
-        if count > 0:
-            emotions["angry"] = anger_score / count
-
-    # Fear: AU1 + AU2 + AU4 + AU5 + AU20 + AU26
-    if "AU01" in aus and "AU02" in aus and "AU04" in aus:
-        fear_score = 0
-        count = 0
-        for au in ["AU01", "AU02", "AU04", "AU05", "AU20", "AU26"]:
-            if au in aus:
-                fear_score += aus[au]
-                count += 1
-
-        if count > 0:
-            emotions["fear"] = fear_score / count
-
-    # Disgust: AU9 (nose wrinkler) + AU15 + AU17
-    if "AU09" in aus:
-        disgust_score = aus["AU09"]
-        count = 1
-        if "AU15" in aus:
-            disgust_score += aus["AU15"]
-            count += 1
-        if "AU17" in aus:
-            disgust_score += aus["AU17"]
-            count += 1
-
-        emotions["disgust"] = disgust_score / count
-
-    # Surprise: AU1 + AU2 + AU5 + AU26
-    if "AU01" in aus and "AU02" in aus:
-        surprise_score = 0
-        count = 0
-        for au in ["AU01", "AU02", "AU05", "AU26"]:
-            if au in aus:
-                surprise_score += aus[au]
-                count += 1
-
-        if count > 0:
-            emotions["surprise"] = surprise_score / count
-
-    # Contempt: AU14 (dimpler)
-    if "AU14" in aus:
-        emotions["contempt"] = aus["AU14"]
-
-    print(emotions, aus)
-
-    # Find the emotion with the highest score
-    if any(emotions.values()):
-        dominant_emotion = max(emotions.items(), key=lambda x: x[1])
-        return dominant_emotion[0]
-    else:
-        return "neutral"
+
+async def warm_up():
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(models.warm_up)
+    except Exception as e:
+        log_event("model_warmup_failed", logging.ERROR, error=str(e))
+        return
+    log_event("worker_ready", seconds=round(time.perf_counter() - start, 2))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so /ready can report progress meanwhile
+    await asyncio.to_thread(start_openface_pool)
+    warmup_task = asyncio.create_task(warm_up())
+    index_task = asyncio.create_task(database.create_indexes(["results"]))
+    yield
+    warmup_task.cancel()
+    index_task.cancel()
+    await emotion_batcher.stop()
+    close_openface_pool()
+    analysis_executor.shutdown()
+
+
+@router.get("/ready", description="Reports whether the models are warmed up")
+async def ready():
+    if not models.ready.is_set():
+        raise HTTPException(status_code=503, detail="Models are warming up")
+
+    return {"ready": True, "timings": models.timings}
+
+
+@router.get("/metrics", description="Prometheus metrics of this server process")
+async def metrics():
+    # Session counts may query SQLite or Redis
+    body = await asyncio.to_thread(registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@router.get(
+    "/stats", description="Reports cache, worker pool, tracker and stage counters"
+)
+async def stats():
+    return {
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "openface_pool": openface_pool.stats() if openface_pool is not None else None,
+        "rejected": analysis_executor.rejected,
+        "face_tracker": face_tracker.stats() if face_tracker is not None else None,
+        "stages": stage_seconds.summary("stage"),
+    }
+
+
+@router.get("/capture", description="Capture settings at the current load")
+async def capture(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: Annotated[str, Header(alias="SessionId")],
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not await asyncio.to_thread(sessions.exists, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return capture_settings(analysis_executor.pending / analysis_executor.max_pending)
 
 
 @router.put("/start", description="Starts processor")
@@ -212,15 +499,16 @@ async def start(
         return HTTPException(status_code=401, detail="Unauthorized")
 
     session_id = str(uuid4())
-    sessions[session_id] = {
-        "io": [],
-        "emo": {},
-        "facs": {"action_units": {}, "emotions": {}},
-    }
+    await asyncio.to_thread(sessions.start, session_id)
 
-    return_dict = {"SessionId": session_id}
+    return_dict = {
+        "SessionId": session_id,
+        "capture": capture_settings(
+            analysis_executor.pending / analysis_executor.max_pending
+        ),
+    }
 
-    print(return_dict)
+    log_event("session_started", session_id=session_id)
     return return_dict
 
 
@@ -232,57 +520,133 @@ async def stop(
     if authorization != AUTHORIZATION_KEY:
         return HTTPException(status_code=401, detail="Unauthorized")
 
-    if session_id not in sessions:
+    return_dict = await asyncio.to_thread(finalize_session, session_id)
+
+    if return_dict is None:
         return HTTPException(status_code=404, detail="Session not found")
 
-    results = sessions[session_id]
-    del sessions[session_id]
+    log_event("session_stopped", session_id=session_id, **return_dict)
+    return return_dict
 
-    if not results:
-        raise HTTPException(status_code=400, detail="No results found")
 
-    # Process emotion results from deepface
-    if "neutral" in results["emo"]:
-        del results["emo"]["neutral"]
+@router.get(
+    "/timeline", description="Downsampled emotion timeline of a stopped session"
+)
+async def timeline(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: Annotated[str, Header(alias="SessionId")],
+    points: Annotated[int, Query(ge=1, le=10000)] = 100,
+    group: Annotated[list[str], Query()] = None,
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
 
-    emotion, confidence = (
-        max(results["emo"].items(), key=lambda x: x[1])
-        if results["emo"]
-        else ("unknown", 0.0)
-    )
+    if group and not set(group) <= TIMELINE_LAYOUT.keys():
+        raise HTTPException(status_code=400, detail="Unknown timeline group")
 
-    # Get FACS results if available
-    facs_emotion = None
-    facs_confidence = 0.0
+    result = await asyncio.to_thread(downsample, db, session_id, points, group)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Timeline not found")
+
+    return result
 
-    if results["facs"]["emotions"]:
-        facs_emotion, facs_confidence = max(
-            results["facs"]["emotions"].items(), key=lambda x: x[1]
+
+async def process_frame(session_id: str, image_bytes: bytes, file_extension: str):
+    """
+    Analyzes one frame and adds the result to the session
+    """
+    try:
+        async with analysis_executor.slot():
+            emotion_result, facs_result, skipped = await analyze_frame(
+                image_bytes, file_extension, session_id
+            )
+    except HTTPException as e:
+        errors.inc(kind="rejected" if e.status_code == 503 else "bad_frame")
+        raise
+    except Exception:
+        errors.inc(kind="analysis")
+        raise
+
+    if "error" in facs_result:
+        errors.inc(kind="openface")
+
+    maxima, return_dict = frame_result(emotion_result, facs_result)
+
+    record = None
+    if timelines is not None:
+        record = timelines.record(
+            {
+                "emotion": return_dict["emotion"],
+                "action_units": return_dict["facs"]["action_units"],
+                "facs": return_dict["facs"]["scores"],
+            }
         )
 
-    # Store results in database
-    db.insert_one(
-        {
-            "session_id": session_id,
-            "emotion": emotion,
-            "confidence": confidence,
-            "facs_emotion": facs_emotion,
-            "facs_confidence": facs_confidence,
-            # "io": results["io"],
-        }
-    )
+    # Keep the highest score seen per emotion and AU in the session, and the
+    # frame's timeline row
+    with stage("session_update"):
+        updated = await asyncio.to_thread(
+            sessions.update,
+            session_id,
+            maxima=maxima,
+            counters={"frames": 1, "skipped": int(skipped)},
+            record=record,
+        )
 
-    return_dict = {
-        "emotion": emotion,
-        "confidence": confidence,
-        "facs_emotion": facs_emotion,
-        "facs_confidence": facs_confidence,
-    }
+    if updated is None:
+        # Stopped while the frame was being analyzed
+        return HTTPException(status_code=404, detail="Session not found")
+
+    return_dict["skipped"] = skipped
 
-    print(return_dict)
     return return_dict
 
 
+def frame_result(emotion_result: dict, facs_result: dict):
+    """
+    The session maxima an analyzed frame contributes, and its response
+    """
+    # Convert numpy values to Python float
+    emotion_result = {k: float(v) for k, v in emotion_result.items()}
+    facs_aus = facs_result.get("action_units", {})
+    facs_aus = {k: float(v) for k, v in facs_aus.items()}
+
+    facs_emotions = {}
+    if "emotion" in facs_result and facs_result["emotion"] is not None:
+        facs_emotions[facs_result["emotion"]] = float(facs_result["confidence"])
+
+    maxima = {
+        "emo": emotion_result,
+        "action_units": facs_aus,
+        "facs_emotions": facs_emotions,
+    }
+    response = {
+        "emotion": emotion_result,
+        "facs": {
+            "action_units": facs_aus,
+            "emotion": facs_result.get("emotion", "unknown"),
+            "scores": facs_result.get("scores", {}),
+            "confidence": float(facs_result.get("confidence", 0.0)),
+        },
+    }
+
+    return maxima, response
+
+
+def log_frame(session_id: str, return_dict):
+    if isinstance(return_dict, HTTPException):
+        return
+    log_event(
+        "frame_processed",
+        sample=LOG_SAMPLE_RATE,
+        session_id=session_id,
+        emotion=max(return_dict["emotion"], key=return_dict["emotion"].get),
+        facs_emotion=return_dict["facs"]["emotion"],
+        skipped=return_dict["skipped"],
+    )
+
+
 class ProcessImageRequest(BaseModel):
     imageData: str = Field(
         ...,
@@ -300,83 +664,150 @@ async def process(
     if authorization != AUTHORIZATION_KEY:
         return HTTPException(status_code=401, detail="Unauthorized")
 
-    if session_id not in sessions:
+    if not await asyncio.to_thread(sessions.exists, session_id):
         return HTTPException(status_code=404, detail="Session not found")
 
+    request_start = time.perf_counter()
     image_data = request.imageData
 
-    if not image_data.startswith("data:image/"):
-        raise HTTPException(status_code=400, detail="Invalid image data format")
+    with stage("body_parse"):
+        if not image_data.startswith("data:image/"):
+            raise HTTPException(status_code=400, detail="Invalid image data format")
 
-    header, base64_str = image_data.split(",", 1)
-    image_bytes = base64.b64decode(base64_str)
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    im = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        header, base64_str = image_data.split(",", 1)
+        file_extension = header.split(";")[0].split("/")[1]
 
-    if im is None:
-        raise HTTPException(status_code=400, detail="Could not decode image")
+    with stage("base64_decode"):
+        image_bytes = base64.b64decode(base64_str)
 
-    file_extension = header.split(";")[0].split("/")[1]
-    filename = f"{session_id}-{uuid4()}.{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    cv2.imwrite(str(file_path), im)
+    return_dict = await process_frame(session_id, image_bytes, file_extension)
 
-    # Process with DeepFace for emotion detection
-    emotion_result = process_image_deepface(str(file_path))
+    models.record_first_request(time.perf_counter() - request_start)
 
-    # Process with OpenFace for FACS analysis
-    facs_result = process_image_facs(str(file_path))
+    log_frame(session_id, return_dict)
+    return return_dict
 
-    try:
-        os.remove(file_path)
-    except FileNotFoundError:
-        pass
 
-    # Store image data
-    sessions[session_id]["io"].append(image_data)
+@router.post(
+    "/process/raw",
+    description="Processes an image sent as the raw request body and saves the result",
+)
+async def process_raw(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: Annotated[str, Header(alias="SessionId")],
+    content_type: Annotated[str, Header(alias="Content-Type")],
+    request: Request,
+):
+    if authorization != AUTHORIZATION_KEY:
+        return HTTPException(status_code=401, detail="Unauthorized")
 
-    # Store emotion results from DeepFace and convert numpy values to Python float
-    emotion_result = {k: float(v) for k, v in emotion_result.items()}
-    for emotion, confidence in emotion_result.items():
-        if emotion not in sessions[session_id]["emo"]:
-            sessions[session_id]["emo"][emotion] = confidence
-        else:
-            sessions[session_id]["emo"][emotion] = max(
-                sessions[session_id]["emo"][emotion], confidence
-            )
+    if not await asyncio.to_thread(sessions.exists, session_id):
+        return HTTPException(status_code=404, detail="Session not found")
 
-    # Store FACS results
-    if "action_units" in facs_result:
-        for au, value in facs_result["action_units"].items():
-            if au not in sessions[session_id]["facs"]["action_units"]:
-                sessions[session_id]["facs"]["action_units"][au] = float(value)
-            else:
-                sessions[session_id]["facs"]["action_units"][au] = max(
-                    sessions[session_id]["facs"]["action_units"][au], float(value)
-                )
+    request_start = time.perf_counter()
 
-    if "emotion" in facs_result and facs_result["emotion"] is not None:
-        emotion = facs_result["emotion"]
-        confidence = facs_result["confidence"]
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="Expected an image body")
 
-        if emotion not in sessions[session_id]["facs"]["emotions"]:
-            sessions[session_id]["facs"]["emotions"][emotion] = float(confidence)
-        else:
-            sessions[session_id]["facs"]["emotions"][emotion] = max(
-                sessions[session_id]["facs"]["emotions"][emotion], float(confidence)
-            )
+    # Decoded straight from the body buffer, no base64 or JSON in between
+    with stage("body_parse"):
+        image_bytes = await request.body()
+    file_extension = content_type.split(";")[0].split("/")[1]
 
-    facs_aus = facs_result.get("action_units", {})
-    facs_aus = {k: float(v) for k, v in facs_aus.items()}
+    return_dict = await process_frame(session_id, image_bytes, file_extension)
 
-    return_dict = {
-        "emotion": emotion_result,
-        "facs": {
-            "action_units": facs_aus,
-            "emotion": facs_result.get("emotion", "unknown"),
-            "confidence": float(facs_result.get("confidence", 0.0)),
-        },
-    }
+    models.record_first_request(time.perf_counter() - request_start)
 
-    print(return_dict)
+    log_frame(session_id, return_dict)
     return return_dict
+
+
+@router.websocket("/stream")
+async def stream(websocket: WebSocket, authorization: str):
+    """
+    Streams a whole session over one connection. Authorization is passed as a
+    query parameter since browsers cannot set WebSocket headers.
+
+    The client sends binary JPEG frames and gets one JSON result per analyzed
+    frame. Sending the text message "stop" finishes the frame being analyzed
+    and the newest one waiting, then ends the session and returns the same
+    summary as /stop, plus the "received" and "dropped" frame counts. Frames
+    that arrive while the previous one is still being analyzed replace each
+    other, so only the newest one is analyzed.
+    """
+    if authorization != AUTHORIZATION_KEY:
+        await websocket.close(code=1008, reason="Unauthorized")
+        return
+
+    await websocket.accept()
+
+    session_id = str(uuid4())
+    await asyncio.to_thread(sessions.start, session_id)
+    await websocket.send_json({"SessionId": session_id})
+
+    latest = None
+    received = 0
+    dropped = 0
+    stopping = False
+    frame_ready = asyncio.Event()
+
+    async def analyze():
+        nonlocal latest, dropped
+        while True:
+            if latest is None:
+                # Nothing left to analyze once the client asked to stop
+                if stopping:
+                    return
+                await frame_ready.wait()
+                frame_ready.clear()
+                continue
+            image_bytes, frame, latest = latest, received, None
+
+            try:
+                result = await process_frame(session_id, image_bytes, "jpeg")
+            except HTTPException as e:
+                if e.status_code == 503:
+                    # Analysis is saturated, treat the frame as dropped
+                    dropped += 1
+                    continue
+                result = {"error": e.detail}
+            except Exception as e:
+                result = {"error": str(e)}
+
+            if isinstance(result, HTTPException):
+                result = {"error": result.detail}
+            await websocket.send_json({**result, "frame": frame, "dropped": dropped})
+
+    analyzer = asyncio.create_task(analyze())
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                received += 1
+                if latest is not None:
+                    # Coalesce, the unanalyzed older frame is dropped
+                    dropped += 1
+                latest = message["bytes"]
+                frame_ready.set()
+            elif message.get("text") == "stop":
+                # Let the frames already received count towards the summary
+                stopping = True
+                frame_ready.set()
+                await asyncio.gather(analyzer, return_exceptions=True)
+                return_dict = await asyncio.to_thread(finalize_session, session_id)
+                await websocket.send_json(
+                    {**(return_dict or {}), "received": received, "dropped": dropped}
+                )
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        analyzer.cancel()
+
+    # The client went away without "stop", the result is still stored
+    await asyncio.to_thread(finalize_session, session_id)
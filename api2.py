@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Header, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from typing import Annotated
+import asyncio
+from contextlib import asynccontextmanager
+import base64
+import binascii
 from dotenv import load_dotenv
 import os
 from uuid import uuid4
 from pydantic import BaseModel, Field
-from pymongo import MongoClient
 
+import database
+from capture import CAPTURE_MAX_IN_FLIGHT, capture_settings
+from frame_store import FrameStore
+from logs import log_event
+from metrics import Callback, registry, stage
+from session_store import create_session_store
+from write_behind import (
+    WRITE_BEHIND_BACKOFF_MS,
+    WRITE_BEHIND_MAX_DOCS,
+    WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_MAX_WAIT_MS,
+    WRITE_BEHIND_RETRIES,
+    WriteBehindBuffer,
+)
 
 load_dotenv()
 
@@ -14,11 +32,70 @@ AUTHORIZATION_KEY = os.getenv("AUTHORIZATION_KEY")
 
 router = APIRouter()
 
-mongo = MongoClient(os.getenv("MONGO"))
-db = mongo.data.images
-db2 = mongo.data.questions
+db = database.collection("data", "images")
+db2 = database.collection("data", "questions")
 
-sessions = {}
+frame_store = FrameStore(database.database("data"))
+
+sessions = create_session_store("api2")
+
+# Frame documents are batched per session and inserted off the event loop
+frame_writer = WriteBehindBuffer(
+    db,
+    WRITE_BEHIND_MAX_DOCS,
+    WRITE_BEHIND_MAX_WAIT_MS / 1000,
+    WRITE_BEHIND_RETRIES,
+    WRITE_BEHIND_BACKOFF_MS / 1000,
+    WRITE_BEHIND_MAX_PENDING,
+)
+
+# Frames being stored right now, the load capture settings adapt to
+uploads_in_flight = 0
+
+
+registry.register(
+    Callback("emocean_capture_sessions", "Capture sessions in progress", sessions.count)
+)
+registry.register(
+    Callback(
+        "emocean_uploads_in_flight",
+        "Frames being written to the frame store",
+        lambda: uploads_in_flight,
+    )
+)
+registry.register(
+    Callback(
+        "emocean_write_behind_pending",
+        "Frame documents waiting to be inserted",
+        lambda: sum(len(docs) for docs in list(frame_writer.pending.values())),
+    )
+)
+registry.register(
+    Callback(
+        "emocean_write_behind_total",
+        "Frame documents inserted and dropped, and insert batches that failed",
+        lambda: {
+            "inserted": frame_writer.inserted,
+            "dropped": frame_writer.dropped,
+            "failed": frame_writer.errors,
+        },
+        type="counter",
+        label="outcome",
+    )
+)
+
+
+def current_capture_settings():
+    return capture_settings(min(1.0, uploads_in_flight / CAPTURE_MAX_IN_FLIGHT))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    index_task = asyncio.create_task(database.create_indexes(["images", "questions"]))
+    yield
+    index_task.cancel()
+    # Store frames still waiting in the write-behind buffer
+    await asyncio.to_thread(frame_writer.close)
 
 
 class StartRequest(BaseModel):
@@ -35,14 +112,36 @@ async def start(
         return HTTPException(status_code=401, detail="Unauthorized")
 
     session_id = str(uuid4())
-    sessions[session_id] = {"count": 0, "name": request.name, "key": request.key}
+    await asyncio.to_thread(
+        sessions.start, session_id, {"name": request.name, "key": request.key}
+    )
 
-    return_dict = {"SessionId": session_id}
+    return_dict = {"SessionId": session_id, "capture": current_capture_settings()}
 
-    print(return_dict)
+    log_event("capture_started", session_id=session_id, name=request.name)
     return return_dict
 
 
+@router.get("/metrics", description="Prometheus metrics of this server process")
+async def metrics():
+    body = await asyncio.to_thread(registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/capture", description="Capture settings at the current load")
+async def capture(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: Annotated[str, Header(alias="SessionId")],
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not await asyncio.to_thread(sessions.exists, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return current_capture_settings()
+
+
 @router.delete("/stop", description="Stops processor and returns the result")
 async def stop(
     authorization: Annotated[str, Header(alias="Authorization")],
@@ -51,13 +150,23 @@ async def stop(
     if authorization != AUTHORIZATION_KEY:
         return HTTPException(status_code=401, detail="Unauthorized")
 
-    if session_id not in sessions:
+    if not await asyncio.to_thread(sessions.exists, session_id):
         return HTTPException(status_code=404, detail="Session not found")
 
-    results = sessions[session_id]
-    del sessions[session_id]
+    # Make sure every frame of the session is stored before answering; the
+    # session stays open so the client can stop it again
+    unwritten = await asyncio.to_thread(frame_writer.flush, session_id)
+    if unwritten:
+        raise HTTPException(
+            status_code=503, detail=f"{unwritten} frames not stored yet, try again"
+        )
+
+    results = await asyncio.to_thread(sessions.pop, session_id)
+
+    if results is None:
+        return HTTPException(status_code=404, detail="Session not found")
 
-    print(results)
+    log_event("capture_stopped", session_id=session_id, frames=results.get("count", 0))
     return 200
 
 
@@ -78,7 +187,7 @@ async def process(
     if authorization != AUTHORIZATION_KEY:
         return HTTPException(status_code=401, detail="Unauthorized")
 
-    if session_id not in sessions:
+    if not await asyncio.to_thread(sessions.exists, session_id):
         return HTTPException(status_code=404, detail="Session not found")
 
     image_data = request.imageData
@@ -86,16 +195,67 @@ async def process(
     if not image_data.startswith("data:image/"):
         raise HTTPException(status_code=400, detail="Invalid image data format")
 
-    sessions[session_id]["count"] += 1
+    header, base64_str = image_data.split(",", 1)
+    content_type = header.split(";")[0].split(":")[1]
+
+    try:
+        image_bytes = base64.b64decode(base64_str)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid image data format")
+
+    return await save_frame(session_id, image_bytes, content_type)
+
+
+@router.post("/process/raw", description="Saves an image sent as the raw request body")
+async def process_raw(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: Annotated[str, Header(alias="SessionId")],
+    content_type: Annotated[str, Header(alias="Content-Type")],
+    request: Request,
+):
+    if authorization != AUTHORIZATION_KEY:
+        return HTTPException(status_code=401, detail="Unauthorized")
+
+    if not await asyncio.to_thread(sessions.exists, session_id):
+        return HTTPException(status_code=404, detail="Session not found")
+
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="Expected an image body")
+
+    image_bytes = await request.body()
+
+    return await save_frame(session_id, image_bytes, content_type.split(";")[0])
 
-    db.insert_one(
+
+async def save_frame(session_id: str, image_bytes: bytes, content_type: str):
+    global uploads_in_flight
+
+    session = await asyncio.to_thread(
+        sessions.update, session_id, counters={"count": 1}
+    )
+
+    if session is None:
+        return HTTPException(status_code=404, detail="Session not found")
+
+    # The raw bytes go to the frame store, the document only references them
+    uploads_in_flight += 1
+    try:
+        with stage("frame_store_put"):
+            blob = await asyncio.to_thread(frame_store.put, image_bytes, content_type)
+    finally:
+        uploads_in_flight -= 1
+
+    frame_writer.add(
+        session_id,
         {
             "session_id": session_id,
-            "count": sessions[session_id]["count"],
-            "name": sessions[session_id]["name"],
-            "key": sessions[session_id]["key"],
-            "image": image_data,
-        }
+            "count": session["count"],
+            "name": session["name"],
+            "key": session["key"],
+            "blob": blob,
+            "content_type": content_type,
+            "size": len(image_bytes),
+        },
     )
 
     return 200
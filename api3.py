@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
+import gzip
+import hashlib
 import os
 from fastapi.templating import Jinja2Templates
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 router = APIRouter()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
+# Pages only change with a deploy; the ETag lets browsers revalidate after
+RECORD_CACHE_CONTROL = os.getenv("RECORD_CACHE_CONTROL", "public, max-age=300")
+
 
 TEXTS = {
     "happy": """It was a typical Saturday morning for Sarah - laundry, breakfast, and a bit of gardening. She had given up hope of seeing her brother, Jack, anytime soon; he was still deployed overseas, and his return was uncertain.
@@ -125,23 +135,76 @@ QUESTIONS = {
 }
 
 
+class Page:
+    """
+    A page rendered once, with its ETag and precompressed variants
+    """
+
+    def __init__(self, html: str):
+        self.body = html.encode()
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body, quality=11)
+
+    def encoding(self, accept_encoding: str):
+        """
+        The smallest precompressed variant the client accepts, or None
+        """
+        accepted = set()
+        for item in accept_encoding.lower().split(","):
+            coding, _, params = item.partition(";")
+            params = params.replace(" ", "")
+            if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+                # Explicitly refused
+                continue
+            accepted.add(coding.strip())
+
+        for coding in ("br", "gzip"):
+            if coding in self.encoded and (coding in accepted or "*" in accepted):
+                return coding
+        return None
+
+    def response(self, request: Request):
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": RECORD_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in if_none_match or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        coding = self.encoding(request.headers.get("accept-encoding", ""))
+        if coding is None:
+            return Response(self.body, media_type="text/html", headers=headers)
+
+        headers["Content-Encoding"] = coding
+        return Response(self.encoded[coding], media_type="text/html", headers=headers)
+
+
+def render_page(template: str, **context):
+    return Page(templates.get_template(template).render(**context))
+
+
+# Every page body is known up front; the reader's name is read from the URL
+# by the page itself
+INDEX_PAGE = render_page("index.html")
+RECORD_PAGES = {
+    text: render_page("record.html", text=TEXTS[text], questions=QUESTIONS[text])
+    for text in TEXTS
+}
+
+
 @router.get("/")
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return INDEX_PAGE.response(request)
 
 
 @router.get("/record")
 async def get_record(request: Request, name: str, text: str):
-    if text.lower() not in TEXTS:
+    if text.lower() not in RECORD_PAGES:
         return "Invalid text type"
 
-    return templates.TemplateResponse(
-        "record.html",
-        {
-            "request": request,
-            "name": name,
-            "text": TEXTS[text.lower()],
-            "key": text,
-            "questions": QUESTIONS[text.lower()],
-        },
-    )
+    return RECORD_PAGES[text.lower()].response(request)
@@ -0,0 +1,191 @@
+"""
+Read endpoints over stored sessions, for analysis outside the service.
+
+A session is found by its first frame in data.images (count 1) and joined with
+its results in data.results and the answers submitted to data.questions.
+Frames are returned without their image: the capture metadata, the frame
+store reference and the analysis written by reanalyze.py.
+
+Lists are paged by cursor: a page's "next" is passed back as `after` for the
+following page, and is null on the last one. With format=ndjson the list is
+streamed to its end instead, one JSON document per line, for exports.
+"""
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Literal
+import asyncio
+from dotenv import load_dotenv
+import json
+import os
+
+import database
+
+load_dotenv()
+
+
+AUTHORIZATION_KEY = os.getenv("AUTHORIZATION_KEY")
+
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+QUERY_MAX_PAGE_SIZE = int(os.getenv("QUERY_MAX_PAGE_SIZE", "1000"))
+# Documents read per round trip while streaming an export
+QUERY_EXPORT_BATCH = int(os.getenv("QUERY_EXPORT_BATCH", "1000"))
+
+router = APIRouter()
+
+images = database.collection("data", "images")
+results = database.collection("data", "results")
+questions = database.collection("data", "questions")
+
+SESSION_FIELDS = {"_id": 0, "session_id": 1, "name": 1, "key": 1}
+# Frames stored before the frame store carry the image inline
+FRAME_FIELDS = {"_id": 0, "image": 0}
+RESULT_FIELDS = {"_id": 0}
+ANSWER_FIELDS = {"_id": 0, "session_id": 1, "answers": 1}
+
+
+def join_sessions(firsts: list):
+    """
+    Sessions of their first frames, with their results and answers
+    """
+    sessions = {
+        first["session_id"]: {
+            "session_id": first["session_id"],
+            "name": first.get("name"),
+            "key": first.get("key"),
+            "results": [],
+            "answers": [],
+        }
+        for first in firsts
+    }
+    ids = list(sessions)
+    # Session results only, not their timeline buckets
+    for result in results.find(
+        {"session_id": {"$in": ids}, "type": None}, RESULT_FIELDS
+    ):
+        sessions[result["session_id"]]["results"].append(result)
+    for submission in questions.find({"session_id": {"$in": ids}}, ANSWER_FIELDS):
+        sessions[submission["session_id"]]["answers"].append(submission["answers"])
+    return list(sessions.values())
+
+
+def session_page(filters: dict, after: str, limit: int):
+    """
+    (sessions matching `filters` after session id `after`, next cursor)
+    """
+    query = {"count": 1, **filters}
+    if after is not None:
+        query["session_id"] = {"$gt": after}
+    firsts = list(images.find(query, SESSION_FIELDS).sort("session_id", 1).limit(limit))
+    sessions = join_sessions(firsts)
+    return sessions, sessions[-1]["session_id"] if len(sessions) == limit else None
+
+
+def session_detail(session_id: str):
+    first = images.find_one(
+        {"session_id": session_id}, SESSION_FIELDS, sort=[("count", 1)]
+    )
+    if first is None:
+        return None
+    session = join_sessions([first])[0]
+    session["frames"] = images.count_documents({"session_id": session_id})
+    return session
+
+
+def frame_page(session_id: str, after: int, limit: int):
+    """
+    (frames of a session after frame count `after`, next cursor)
+
+    Frame counts come from the session's counter, so they are unique within
+    a session.
+    """
+    query = {"session_id": session_id}
+    if after is not None:
+        query["count"] = {"$gt": after}
+    frames = list(images.find(query, FRAME_FIELDS).sort("count", 1).limit(limit))
+    return frames, frames[-1]["count"] if len(frames) == limit else None
+
+
+def export(page, after):
+    """
+    NDJSON lines of every page from `after` on, a batch of documents per chunk
+    """
+    while True:
+        documents, after = page(after, QUERY_EXPORT_BATCH)
+        if documents:
+            yield "".join(
+                json.dumps(document, default=str) + "\n" for document in documents
+            )
+        if after is None:
+            return
+
+
+def ndjson(page, after):
+    # A sync iterator, which Starlette runs in its thread pool
+    return StreamingResponse(export(page, after), media_type="application/x-ndjson")
+
+
+@router.get("/sessions", description="Stored sessions with their results and answers")
+async def list_sessions(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    name: str = None,
+    key: str = None,
+    after: str = None,
+    limit: Annotated[int, Query(ge=1, le=QUERY_MAX_PAGE_SIZE)] = QUERY_PAGE_SIZE,
+    format: Literal["json", "ndjson"] = "json",
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    filters = {field: value for field, value in (("name", name), ("key", key)) if value}
+
+    def page(after, limit):
+        return session_page(filters, after, limit)
+
+    if format == "ndjson":
+        return ndjson(page, after)
+
+    sessions, next_cursor = await asyncio.to_thread(page, after, limit)
+    return {"sessions": sessions, "next": next_cursor}
+
+
+@router.get(
+    "/sessions/{session_id}", description="A stored session and its frame count"
+)
+async def get_session(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: str,
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    session = await asyncio.to_thread(session_detail, session_id)
+
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return session
+
+
+@router.get(
+    "/sessions/{session_id}/frames",
+    description="Frame metadata and analyses of a stored session, without images",
+)
+async def list_frames(
+    authorization: Annotated[str, Header(alias="Authorization")],
+    session_id: str,
+    after: int = None,
+    limit: Annotated[int, Query(ge=1, le=QUERY_MAX_PAGE_SIZE)] = QUERY_PAGE_SIZE,
+    format: Literal["json", "ndjson"] = "json",
+):
+    if authorization != AUTHORIZATION_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    def page(after, limit):
+        return frame_page(session_id, after, limit)
+
+    if format == "ndjson":
+        return ndjson(page, after)
+
+    frames, next_cursor = await asyncio.to_thread(page, after, limit)
+    return {"frames": frames, "next": next_cursor}
@@ -0,0 +1,86 @@
+"""
+Builds the FastAPI apps from configuration.
+
+An app serves a list of router modules, taken from APP_ROUTERS (e.g.
+"api2,api3") or else from the APP_PROFILE:
+
+    analysis  api            DeepFace + OpenFace analysis (main.py)
+    capture   api2, api3,    frame capture, reading pages and reads of the
+              api4           stored sessions (main2.py)
+
+Only the listed modules are imported, so the capture server starts without
+TensorFlow, OpenCV or pymongo. The analysis models load in the lifespan
+warm-up, and Mongo connects on first use (see database.py).
+
+A router module may define `lifespan(app)`, an async context manager run for
+the lifetime of the app; they are entered in order and exited in reverse.
+
+    gunicorn -k uvicorn.workers.UvicornWorker 'app_factory:create_app()'
+"""
+
+import importlib
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+import profiling
+from logs import log_event
+from metrics import RequestMetrics
+
+APP_PROFILES = {
+    "analysis": ["api"],
+    "capture": ["api2", "api3", "api4"],
+}
+APP_PROFILE = os.getenv("APP_PROFILE", "capture")
+APP_ROUTERS = [name for name in os.getenv("APP_ROUTERS", "").split(",") if name]
+
+
+def router_names(profile: str = None, routers: list = None):
+    if routers:
+        return list(routers)
+    if profile is None and APP_ROUTERS:
+        return APP_ROUTERS
+    profile = profile or APP_PROFILE
+    if profile not in APP_PROFILES:
+        raise ValueError(
+            f"Unknown app profile {profile!r}, expected one of {list(APP_PROFILES)}"
+        )
+    return APP_PROFILES[profile]
+
+
+def create_app(profile: str = None, routers: list = None):
+    """
+    An app serving the routers of `profile`, or the router modules named in
+    `routers`
+    """
+    names = router_names(profile, routers)
+    modules = [importlib.import_module(name) for name in names]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        log_event("app_starting", routers=names)
+        async with AsyncExitStack() as stack:
+            for module in modules:
+                if hasattr(module, "lifespan"):
+                    await stack.enter_async_context(module.lifespan(app))
+            yield
+            log_event("app_stopping", routers=names)
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(RequestMetrics)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    for module in modules:
+        app.include_router(module.router)
+    profiling.install(app)
+
+    return app
@@ -0,0 +1,88 @@
+"""
+Micro-batching of emotion inference across concurrent /process requests
+"""
+
+import asyncio
+
+
+class EmotionBatcher:
+    """
+    Collects frames for up to `max_wait` seconds or `max_batch` frames, runs
+    them through `predict_batch` in one call and resolves each request with
+    its own result.
+
+    `predict_batch` takes a list of images and returns one entry per image,
+    either the result or the exception raised for that image.
+    """
+
+    def __init__(self, predict_batch, max_batch: int = 8, max_wait: float = 0.01):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.frames = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, img):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((img, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect()
+            images = [img for img, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(None, self.predict_batch, images)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            self.batches += 1
+            self.frames += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    # The request was cancelled while waiting
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
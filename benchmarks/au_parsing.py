@@ -0,0 +1,128 @@
+"""
+Parsing OpenFace output with pandas, as api.py used to, against
+facs.AUReader. Uses CSVs with the full FeatureExtraction column layout
+(landmarks, gaze, pose, AU intensities and presences) for a single image and
+a multi-frame video, checks both parsers agree, and compares the import cost
+of pandas with that of the reader.
+
+    python -m benchmarks.au_parsing --rows 3000
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from facs import ACTION_UNITS, AUReader
+
+
+def openface_header():
+    columns = ["frame", "face_id", "timestamp", "confidence", "success"]
+    columns += [f"gaze_{i}_{axis}" for i in range(2) for axis in "xyz"]
+    columns += ["gaze_angle_x", "gaze_angle_y"]
+    columns += [f"eye_lmk_{axis}_{i}" for axis in "xyXYZ" for i in range(56)]
+    columns += [f"pose_{t}{axis}" for t in "TR" for axis in "xyz"]
+    columns += [f"{axis}_{i}" for axis in "xyXYZ" for i in range(68)]
+    columns += ["p_scale", "p_rx", "p_ry", "p_rz", "p_tx", "p_ty"]
+    columns += [f"p_{i}" for i in range(34)]
+    columns += [f"{au}_r" for au in ACTION_UNITS]
+    columns += [f"{au}_c" for au in ACTION_UNITS + ["AU28"]]
+    return ", ".join(columns)
+
+
+def write_csv(path: Path, header: str, rows: int, rng):
+    width = header.count(",") + 1
+    values = rng.random((rows, width)) * 5
+    with open(path, "w") as f:
+        f.write(header + "\n")
+        for row in values:
+            f.write(", ".join(f"{v:.3f}" for v in row) + "\n")
+
+
+def pandas_parse(path: str):
+    """
+    The previous per-frame parse in api.process_image_facs. OpenFace
+    separates columns with ", ", which that parse did not strip, so it is
+    given skipinitialspace here to find the AU columns at all.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(str(path), skipinitialspace=True)
+    au_columns = [
+        col for col in df.columns if col.startswith("AU") and col.endswith("_r")
+    ]
+    return {
+        col.split("_")[0]: float(df[col].iloc[0])
+        for col in au_columns
+        if not pd.isna(df[col].iloc[0])
+    }
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def import_time(module: str):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    header = openface_header()
+    reader = AUReader()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        frame_csv = Path(tmp) / "frame.csv"
+        video_csv = Path(tmp) / "video.csv"
+        write_csv(frame_csv, header, 1, rng)
+        write_csv(video_csv, header, args.rows, rng)
+        line = frame_csv.read_text().splitlines()[1]
+
+        expected = pandas_parse(frame_csv)
+        assert reader.to_dict(reader.read_csv(frame_csv)[0]) == expected
+        assert reader.to_dict(reader.parse_line(header, line)) == expected
+        df = pd.read_csv(video_csv, skipinitialspace=True)
+        assert np.allclose(
+            reader.read_csv(video_csv), df[[f"{au}_r" for au in ACTION_UNITS]]
+        )
+
+        pandas_frame = timed(lambda: pandas_parse(frame_csv), args.repeat)
+        reader_frame = timed(lambda: reader.read_csv(frame_csv), args.repeat)
+        reader_line = timed(lambda: reader.parse_line(header, line), args.repeat)
+        print(
+            f"1 frame CSV:    pandas {pandas_frame * 1e6:8.1f} us  "
+            f"reader {reader_frame * 1e6:8.1f} us  "
+            f"streamed line {reader_line * 1e6:6.1f} us"
+        )
+
+        pandas_video = timed(lambda: pd.read_csv(video_csv, skipinitialspace=True), 5)
+        reader_video = timed(lambda: reader.read_csv(video_csv), 5)
+        print(
+            f"{args.rows} frame CSV: pandas {pandas_video * 1000:8.1f} ms  "
+            f"reader {reader_video * 1000:8.1f} ms"
+        )
+
+    print(
+        f"import:         pandas {import_time('pandas') * 1000:8.1f} ms  "
+        f"facs {import_time('facs') * 1000:8.1f} ms (including interpreter start)"
+    )
+
+
+if __name__ == "__main__":
+    main()
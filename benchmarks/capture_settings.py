@@ -0,0 +1,117 @@
+"""
+Bandwidth and /process/raw latency per frame for the capture settings of
+each load tier, against the old client behaviour of sending frames at the
+webcam's native size with the browser's default JPEG quality (0.92). Also
+times decoding a large frame at full size, at full size and then downscaled,
+and with the reduced decode.
+
+    python -m benchmarks.capture_settings --native-width 1920 --frames 30
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+import capture  # noqa: E402
+
+
+def encode(im: np.ndarray, width: int, quality: float):
+    height = round(im.shape[0] * width / im.shape[1])
+    resized = cv2.resize(im, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.imencode(
+        ".jpeg", resized, [cv2.IMWRITE_JPEG_QUALITY, int(quality * 100)]
+    )[1].tobytes()
+
+
+async def post_frames(client, headers, frame: bytes, frames: int):
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        response = await client.post("/process/raw", headers=headers, content=frame)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return timings
+
+
+def full_then_resize(frame: bytes, max_width: int):
+    """
+    Downscaling without the reduced decode: full decode, then INTER_AREA
+    """
+    im = capture.decode_image(frame, 0)
+    height = round(im.shape[0] * max_width / im.shape[1])
+    return cv2.resize(im, (max_width, height), interpolation=cv2.INTER_AREA)
+
+
+def timed(fn, *args, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main(args):
+    api.db = fakes.FakeCollection()
+    api.start_openface_pool()
+    source = cv2.imread(args.image)
+    native = cv2.resize(
+        source,
+        (
+            args.native_width,
+            round(source.shape[0] * args.native_width / source.shape[1]),
+        ),
+        interpolation=cv2.INTER_CUBIC,
+    )
+
+    settings = [("native", args.native_width, 0.92, 1000)]
+    for load in (0.0, 0.5, 0.8):
+        tier = capture.capture_settings(load)
+        settings.append(
+            (f"load {load}", tier["maxWidth"], tier["jpegQuality"], tier["intervalMs"])
+        )
+
+    app = FastAPI()
+    app.include_router(api.router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers = {"Authorization": api.AUTHORIZATION_KEY}
+        session_id = (await client.put("/start", headers=headers)).json()["SessionId"]
+        headers.update({"SessionId": session_id, "Content-Type": "image/jpeg"})
+
+        for name, width, quality, interval in settings:
+            frame = encode(native, width, quality)
+            timings = await post_frames(client, headers, frame, args.frames)
+            print(
+                f"{name:>8}: {width:4d}px q{quality:.2f} every {interval:4d} ms  "
+                f"{len(frame) / 1024:7.1f} KiB/frame  "
+                f"{len(frame) * 8 / interval:7.1f} kbit/s  "
+                f"p50 {statistics.median(timings):6.1f} ms"
+            )
+
+    frame = encode(native, args.native_width, 0.92)
+    max_width = capture.ANALYSIS_MAX_WIDTH
+    print(
+        f"decode {args.native_width}px: full {timed(capture.decode_image, frame, 0):6.2f} ms  "
+        f"full + resize to {max_width}px "
+        f"{timed(full_then_resize, frame, max_width):6.2f} ms  "
+        f"reduced decode to {max_width}px {timed(capture.decode_image, frame, max_width):6.2f} ms"
+    )
+    api.close_openface_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--native-width", type=int, default=1920)
+    parser.add_argument("--frames", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""
+Load test for batched emotion inference. Simulates concurrent sessions that
+each send a frame at a fixed interval, and compares running the model once
+per frame against the EmotionBatcher.
+
+By default the model is a stub whose cost is a fixed per-call overhead plus a
+smaller per-frame cost, which is how a batch-size-1 forward pass behaves.
+Pass --real to use the DeepFace models instead.
+
+    python -m benchmarks.emotion_batching --sessions 32 --seconds 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+from batching import EmotionBatcher
+
+
+def stub_predict(call_overhead: float, per_frame: float):
+    def predict_batch(images: list):
+        time.sleep(call_overhead + per_frame * len(images))
+        return [{"happy": 100.0} for _ in images]
+
+    return predict_batch
+
+
+async def session(submit, frame, interval: float, until: float, latencies: list):
+    # Latency is measured from when the client meant to send the frame, so
+    # time spent waiting behind a blocked event loop is counted too
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time()
+    while scheduled < until:
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        await submit(frame)
+        latencies.append((loop.time() - scheduled) * 1000)
+        scheduled = max(scheduled + interval, loop.time())
+
+
+async def run(name: str, submit, args, frame):
+    latencies = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    until = start + args.seconds
+    await asyncio.gather(
+        *(
+            session(submit, frame, args.interval, until, latencies)
+            for _ in range(args.sessions)
+        )
+    )
+    elapsed = loop.time() - start
+
+    latencies.sort()
+    print(
+        f"{name:>10}: {len(latencies) / elapsed:7.1f} frames/s  "
+        f"p50 {statistics.median(latencies):8.1f} ms  "
+        f"p99 {latencies[int(len(latencies) * 0.99)]:8.1f} ms"
+    )
+
+
+async def main(args):
+    if args.real:
+        import models
+
+        predict_batch = models.predict_emotions
+        frame = (np.random.default_rng(0).random((480, 640, 3)) * 255).astype(np.uint8)
+    else:
+        predict_batch = stub_predict(args.call_ms / 1000, args.frame_ms / 1000)
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    # Today's path: one forward pass per request, one at a time
+    async def per_frame(img):
+        return predict_batch([img])[0]
+
+    await run("per-frame", per_frame, args, frame)
+
+    batcher = EmotionBatcher(
+        predict_batch, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000
+    )
+    await run("batched", batcher.submit, args, frame)
+    await batcher.stop()
+    print(f"mean batch size {batcher.frames / max(batcher.batches, 1):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--call-ms", type=float, default=25)
+    parser.add_argument("--frame-ms", type=float, default=3)
+    parser.add_argument("--real", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,114 @@
+"""
+Checks that /start stays fast while /process is under load. Runs api.py
+in-process against stubbed DeepFace/OpenFace with the analysis inline on the
+event loop (the old behaviour) and in the thread executor.
+
+    python -m benchmarks.event_loop --clients 8 --seconds 5
+"""
+
+import argparse
+import asyncio
+import base64
+import statistics
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+from executor import AnalysisExecutor  # noqa: E402
+
+
+def sample_frame(path: str, width: int = 640):
+    im = cv2.imread(path)
+    height = int(im.shape[0] * width / im.shape[1])
+    im = cv2.resize(im, (width, height), interpolation=cv2.INTER_AREA)
+    _, buf = cv2.imencode(".jpeg", im)
+    return "data:image/jpeg;base64," + base64.b64encode(buf).decode()
+
+
+async def start_latencies(client, headers, until: float):
+    latencies = []
+    while time.perf_counter() < until:
+        start = time.perf_counter()
+        response = await client.put("/start", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        api.sessions.pop(response.json()["SessionId"])
+        await asyncio.sleep(0.02)
+    return sorted(latencies)
+
+
+async def process_load(client, headers, frame, until: float, statuses: list):
+    session_id = (await client.put("/start", headers=headers)).json()["SessionId"]
+    headers = {**headers, "SessionId": session_id}
+    while time.perf_counter() < until:
+        response = await client.post(
+            "/process", headers=headers, json={"imageData": frame}
+        )
+        statuses.append(response.status_code)
+        if response.status_code == 503:
+            # Back off the way a client honouring Retry-After would, scaled down
+            await asyncio.sleep(0.05)
+
+
+async def run(name: str, app, args, frame):
+    headers = {"Authorization": api.AUTHORIZATION_KEY}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        idle = await start_latencies(client, headers, time.perf_counter() + 1)
+
+        statuses = []
+        until = time.perf_counter() + args.seconds
+        results = await asyncio.gather(
+            start_latencies(client, headers, until),
+            *(
+                process_load(client, headers, frame, until, statuses)
+                for _ in range(args.clients)
+            ),
+        )
+        loaded = results[0]
+
+    p99 = lambda values: values[int(len(values) * 0.99)]  # noqa: E731
+    print(
+        f"{name:>7}: /start idle p50 {statistics.median(idle):6.1f} ms "
+        f"p99 {p99(idle):6.1f} ms | under load p50 {statistics.median(loaded):6.1f} "
+        f"ms p99 {p99(loaded):6.1f} ms | /process ok {statuses.count(200)} "
+        f"busy {statuses.count(503)}"
+    )
+    return idle, loaded
+
+
+async def main(args):
+    api.db = fakes.FakeCollection()
+    api.start_openface_pool()
+    app = FastAPI()
+    app.include_router(api.router)
+    frame = sample_frame(args.image)
+
+    api.analysis_executor = AnalysisExecutor("inline")
+    await run("inline", app, args, frame)
+
+    api.analysis_executor = AnalysisExecutor("thread", args.workers, args.max_pending)
+    idle, loaded = await run("thread", app, args, frame)
+    api.analysis_executor.shutdown()
+    api.close_openface_pool()
+
+    limit = max(idle[int(len(idle) * 0.99)] * 5, 50)
+    assert (
+        loaded[int(len(loaded) * 0.99)] < limit
+    ), f"/start p99 under load exceeded {limit:.1f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Per-stage timings of /process with face detection on every frame against the
+per-session face tracker, on a recording of a seated subject that drifts a
+few pixels per frame. DeepFace is stubbed (DEEPFACE_STUB_MS per analyze, of
+which DETECTOR_STUB_MS is detection) and OpenFace is the mock worker.
+
+    python -m benchmarks.face_tracking --frames 60 --detect-every 10
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+import metrics  # noqa: E402
+import models  # noqa: E402
+import tracking  # noqa: E402
+
+
+def recording(path: str, frames: int, rng):
+    im = cv2.resize(cv2.imread(path), (640, 480), interpolation=cv2.INTER_AREA)
+    offset = np.zeros(2)
+    for _ in range(frames):
+        offset = np.clip(offset + rng.normal(0, 2, 2), -30, 30)
+        shift = np.float32([[1, 0, offset[0]], [0, 1, offset[1]]])
+        moved = cv2.warpAffine(im, shift, (640, 480), borderMode=cv2.BORDER_REPLICATE)
+        yield cv2.imencode(".jpeg", moved)[1].tobytes()
+
+
+async def run(name: str, tracker, frames: list):
+    api.face_tracker = tracker
+    api.DETECTOR_BACKEND = "skip" if tracker is not None else models.DETECTOR_BACKEND
+    with metrics.stage_seconds.lock:
+        metrics.stage_seconds.series.clear()
+
+    app = FastAPI()
+    app.include_router(api.router)
+    headers = {"Authorization": api.AUTHORIZATION_KEY}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.put("/start", headers=headers)).json()["SessionId"]
+        headers = {**headers, "SessionId": session_id, "Content-Type": "image/jpeg"}
+
+        start = time.perf_counter()
+        for frame in frames:
+            response = await client.post("/process/raw", headers=headers, content=frame)
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/stats")).json()
+
+    stages = "  ".join(
+        f"{stage} {timing['mean_ms']:5.1f} ms x{timing['count']}"
+        for stage, timing in stats["stages"].items()
+    )
+    print(f"{name:>8}: {1000 * elapsed / len(frames):6.1f} ms/frame  {stages}")
+    if stats["face_tracker"]:
+        print(f"{'':>8}  {stats['face_tracker']}")
+
+
+async def main(args):
+    api.db = fakes.FakeCollection()
+    api.start_openface_pool()
+    rng = np.random.default_rng(0)
+    frames = list(recording(args.image, args.frames, rng))
+
+    await run("detect", None, frames)
+    await run(
+        "tracked",
+        tracking.FaceTracker(detect_every=args.detect_every, min_score=args.min_score),
+        frames,
+    )
+    api.close_openface_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--detect-every", type=int, default=10)
+    parser.add_argument("--min-score", type=float, default=0.6)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+Golden check and microbenchmark for the table-driven FACS scorer. Compares
+every emotion score and the dominant emotion against the previous chain of
+if-branches on random frames with random missing AUs, then times scoring one
+frame (score_one, and the matrices on one vector) and a (frames x AUs) array.
+
+    python -m benchmarks.facs_scoring --frames 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from facs import ACTION_UNITS, scorer
+
+
+def legacy_map_aus_to_emotion(aus):
+    """
+    map_aus_to_emotion as it was before the scoring became table-driven,
+    returning the scores too
+    """
+    emotions = {
+        "happy": 0.0,
+        "sad": 0.0,
+        "angry": 0.0,
+        "fear": 0.0,
+        "disgust": 0.0,
+        "surprise": 0.0,
+        "contempt": 0.0,
+    }
+
+    # Happiness: AU6 (cheek raiser) + AU12 (lip corner puller)
+    if "AU06" in aus and "AU12" in aus:
+        emotions["happy"] = (aus["AU06"] + aus["AU12"]) / 2
+
+    # Sadness: AU1 (inner brow raiser) + AU4 (brow lowerer) + AU15 (lip corner depressor)
+    if "AU01" in aus and "AU04" in aus and "AU15" in aus:
+        emotions["sad"] = (aus["AU01"] + aus["AU04"] + aus["AU15"]) / 3
+
+    # Anger: AU4 (brow lowerer) + AU5 (upper lid raiser) + AU7 (lid tightener) + AU23 (lip tightener)
+    if "AU04" in aus and "AU07" in aus:
+        anger_score = 0
+        count = 0
+        if "AU04" in aus:
+            anger_score += aus["AU04"]
+            count += 1
+        if "AU05" in aus:
+            anger_score += aus["AU05"]
+            count += 1
+        if "AU07" in aus:
+            anger_score += aus["AU07"]
+            count += 1
+        if "AU23" in aus:
+            anger_score += aus["AU23"]
+            count += 1
+
+        if count > 0:
+            emotions["angry"] = anger_score / count
+
+    # Fear: AU1 + AU2 + AU4 + AU5 + AU20 + AU26
+    if "AU01" in aus and "AU02" in aus and "AU04" in aus:
+        fear_score = 0
+        count = 0
+        for au in ["AU01", "AU02", "AU04", "AU05", "AU20", "AU26"]:
+            if au in aus:
+                fear_score += aus[au]
+                count += 1
+
+        if count > 0:
+            emotions["fear"] = fear_score / count
+
+    # Disgust: AU9 (nose wrinkler) + AU15 + AU17
+    if "AU09" in aus:
+        disgust_score = aus["AU09"]
+        count = 1
+        if "AU15" in aus:
+            disgust_score += aus["AU15"]
+            count += 1
+        if "AU17" in aus:
+            disgust_score += aus["AU17"]
+            count += 1
+
+        emotions["disgust"] = disgust_score / count
+
+    # Surprise: AU1 + AU2 + AU5 + AU26
+    if "AU01" in aus and "AU02" in aus:
+        surprise_score = 0
+        count = 0
+        for au in ["AU01", "AU02", "AU05", "AU26"]:
+            if au in aus:
+                surprise_score += aus[au]
+                count += 1
+
+        if count > 0:
+            emotions["surprise"] = surprise_score / count
+
+    # Contempt: AU14 (dimpler)
+    if "AU14" in aus:
+        emotions["contempt"] = aus["AU14"]
+
+    # Find the emotion with the highest score
+    if any(emotions.values()):
+        dominant_emotion = max(emotions.items(), key=lambda x: x[1])
+        return dominant_emotion[0], emotions
+    else:
+        return "neutral", emotions
+
+
+def random_frames(rng, count: int):
+    values = rng.random((count, len(ACTION_UNITS))) * 5
+    # Drop AUs at random so every required/optional branch is exercised
+    values[rng.random(values.shape) < 0.3] = np.nan
+    return values
+
+
+def as_dict(frame: np.ndarray):
+    return {au: float(v) for au, v in zip(ACTION_UNITS, frame) if not np.isnan(v)}
+
+
+def golden(frames: np.ndarray):
+    scores = scorer.score(frames)
+    dominant = scorer.dominant(scores)
+    for frame, frame_scores, frame_dominant in zip(frames, scores, dominant):
+        expected_dominant, expected = legacy_map_aus_to_emotion(as_dict(frame))
+        assert np.allclose(
+            frame_scores, [expected[e] for e in scorer.emotions], rtol=1e-12
+        ), (frame, frame_scores, expected)
+        assert frame_dominant == expected_dominant, (frame, expected_dominant)
+        one = scorer.score_one(as_dict(frame))
+        assert np.allclose(one, frame_scores, rtol=1e-12), (frame, one)
+        assert scorer.dominant_one(one) == expected_dominant, (frame, one)
+
+    # Edge cases: nothing detected, and only AUs no rule uses
+    assert scorer.dominant(scorer.score(scorer.vector({}))) == "neutral"
+    assert scorer.dominant(scorer.score(scorer.vector({"AU45": 3.0}))) == "neutral"
+    assert scorer.dominant_one(scorer.score_one({})) == "neutral"
+    assert scorer.dominant_one(scorer.score_one({"AU45": 3.0})) == "neutral"
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=100_000)
+    parser.add_argument("--golden", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    golden(random_frames(rng, args.golden))
+    print(f"golden: {args.golden} random frames match the previous scoring")
+
+    frames = random_frames(rng, args.frames)
+    one = as_dict(frames[0])
+    dicts = [as_dict(frame) for frame in frames]
+
+    legacy_one = timed(lambda: legacy_map_aus_to_emotion(one), 2000)
+    table_one = timed(lambda: scorer.dominant(scorer.score(scorer.vector(one))), 2000)
+    fast_one = timed(lambda: scorer.dominant_one(scorer.score_one(one)), 2000)
+    print(
+        f"1 frame:  legacy {legacy_one * 1e6:8.1f} us  score_one {fast_one * 1e6:8.1f} us"
+        f"  matrices {table_one * 1e6:8.1f} us"
+    )
+
+    legacy_all = timed(lambda: [legacy_map_aus_to_emotion(d) for d in dicts], 1)
+    table_all = timed(lambda: scorer.dominant(scorer.score(frames)), 5)
+    print(
+        f"{args.frames} frames: legacy {legacy_all * 1000:8.1f} ms  "
+        f"table {table_all * 1000:8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Offline stand-ins for DeepFace and MongoDB so the API modules can be imported
+and driven without TensorFlow, model weights or a database.
+
+Call install() before importing api / api2.
+"""
+
+import os
+import sys
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+# Simulated cost of one DeepFace.analyze call, and of the face detection
+# within it
+DEEPFACE_STUB_SECONDS = float(os.getenv("DEEPFACE_STUB_MS", "30")) / 1000
+DETECTOR_STUB_SECONDS = float(os.getenv("DETECTOR_STUB_MS", "20")) / 1000
+
+
+def fake_emotion(img):
+    # Deterministic per frame so repeated frames give repeated results
+    seed = int(np.asarray(img, dtype=np.uint8).ravel()[::4096].sum())
+    scores = np.random.default_rng(seed).random(len(EMOTION_LABELS))
+    scores = 100 * scores / scores.sum()
+    return {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+
+
+class FakeEmotionModel:
+    class model:
+        @staticmethod
+        def predict(batch, verbose=0):
+            time.sleep(DEEPFACE_STUB_SECONDS)
+            return np.full((len(batch), len(EMOTION_LABELS)), 1 / len(EMOTION_LABELS))
+
+
+class FakeDeepFace:
+    @staticmethod
+    def build_model(model_name, task="facial_recognition"):
+        return FakeEmotionModel()
+
+    @staticmethod
+    def analyze(img_path, actions=("emotion",), detector_backend="opencv", **kwargs):
+        if detector_backend == "skip":
+            time.sleep(max(0.0, DEEPFACE_STUB_SECONDS - DETECTOR_STUB_SECONDS))
+        else:
+            time.sleep(DEEPFACE_STUB_SECONDS)
+        return [{"emotion": fake_emotion(img_path)}]
+
+    @staticmethod
+    def extract_faces(img_path, detector_backend="opencv", **kwargs):
+        img = np.asarray(img_path)
+        height, width = img.shape[:2]
+        if detector_backend == "skip":
+            x, y, w, h = 0, 0, width, height
+        else:
+            # A face in the middle of the frame, eyes level
+            time.sleep(DETECTOR_STUB_SECONDS)
+            w = h = min(width, height) // 2
+            x, y = (width - w) // 2, (height - h) // 2
+        face = img[y : y + h, x : x + w, ::-1].astype(np.float32) / 255
+        facial_area = {
+            "x": x,
+            "y": y,
+            "w": w,
+            "h": h,
+            "left_eye": (x + 2 * w // 3, y + h // 3),
+            "right_eye": (x + w // 3, y + h // 3),
+        }
+        return [{"face": face, "facial_area": facial_area, "confidence": 1.0}]
+
+
+class FakeInsertResult:
+    def __init__(self, ids):
+        self.inserted_id = ids[0] if ids else None
+        self.inserted_ids = ids
+
+
+class FakeCursor(list):
+    def sort(self, key, direction=1):
+        return FakeCursor(
+            sorted(self, key=lambda document: document[key], reverse=direction < 0)
+        )
+
+    def limit(self, count):
+        return FakeCursor(self[:count]) if count else self
+
+
+class FakeCollection:
+    """
+    In-process collection with the subset of the pymongo API the service uses.
+    `latency` simulates a network round trip per call.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.documents = []
+        self.calls = 0
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert_one(self, document):
+        self._round_trip()
+        document.setdefault("_id", len(self.documents))
+        self.documents.append(document)
+        return FakeInsertResult([document["_id"]])
+
+    def insert_many(self, documents, ordered=True):
+        self._round_trip()
+        ids = []
+        for document in documents:
+            document.setdefault("_id", len(self.documents))
+            self.documents.append(document)
+            ids.append(document["_id"])
+        return FakeInsertResult(ids)
+
+    def find(self, query=None, projection=None):
+        self._round_trip()
+        query = query or {}
+        return FakeCursor(
+            document
+            for document in self.documents
+            if all(document.get(key) == value for key, value in query.items())
+        )
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def find_one(self, query=None, projection=None):
+        found = self.find(query, projection)
+        return found[0] if found else None
+
+
+def install():
+    """
+    Registers the fake deepface package and points the mock OpenFace worker at
+    the API unless a real one is configured
+    """
+    deepface = types.ModuleType("deepface")
+    deepface.DeepFace = FakeDeepFace
+
+    emotion = types.ModuleType("deepface.models.demography.Emotion")
+    emotion.labels = EMOTION_LABELS
+
+    preprocessing = types.ModuleType("deepface.modules.preprocessing")
+    preprocessing.resize_image = lambda img, target_size: np.asarray(
+        img, dtype=np.float32
+    )[np.newaxis]
+
+    sys.modules["deepface"] = deepface
+    sys.modules["deepface.models"] = types.ModuleType("deepface.models")
+    sys.modules["deepface.models.demography"] = types.ModuleType(
+        "deepface.models.demography"
+    )
+    sys.modules["deepface.models.demography.Emotion"] = emotion
+    sys.modules["deepface.modules"] = types.ModuleType("deepface.modules")
+    sys.modules["deepface.modules.preprocessing"] = preprocessing
+
+    mock_openface = Path(__file__).with_name("mock_openface.py")
+    os.environ.setdefault(
+        "OPENFACE_WORKER_COMMAND", f"{sys.executable} {mock_openface} --serve"
+    )
+    os.environ.setdefault("MOCK_OPENFACE_LOAD_DELAY", "0")
+    os.environ.setdefault("AUTHORIZATION_KEY", "benchmark")
+    os.environ.setdefault("MONGO_INDEXES", "0")
@@ -0,0 +1,119 @@
+"""
+Per-frame cost of the /process decode path, before and after the in-memory
+pipeline. The analyzers themselves are left out so only the decode and file
+I/O that surrounds them is measured.
+
+    python -m benchmarks.frame_pipeline --frames 50 --image img.jpeg
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import cv2
+import numpy as np
+
+
+def legacy_frame(image_data: str, upload_dir: Path, openface_dir: Path):
+    """
+    The old path: decode, re-encode to disk, then decode again per analyzer
+    """
+    header, base64_str = image_data.split(",", 1)
+    image_bytes = base64.b64decode(base64_str)
+    im = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    file_path = upload_dir / f"{uuid4()}.jpeg"
+    cv2.imwrite(str(file_path), im)
+    written = file_path.stat().st_size
+
+    # DeepFace.analyze(img_path=...) reads the file back with cv2.imread
+    cv2.imread(str(file_path))
+
+    # OpenFace reads the same file again from its own output directory
+    frame_dir = openface_dir / file_path.stem
+    os.mkdir(frame_dir)
+    cv2.imread(str(file_path))
+
+    os.rmdir(frame_dir)
+    os.remove(file_path)
+    return written
+
+
+def in_memory_frame(image_data: str, openface_dir: Path):
+    """
+    The new path: decode once, share the array, hand OpenFace the original bytes
+    """
+    header, base64_str = image_data.split(",", 1)
+    image_bytes = base64.b64decode(base64_str)
+    im = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    frame_dir = openface_dir / str(uuid4())
+    os.mkdir(frame_dir)
+    img_path = frame_dir / "frame.jpeg"
+    img_path.write_bytes(image_bytes)
+
+    # OpenFace decodes its copy itself; DeepFace receives `im` directly
+    cv2.imread(str(img_path))
+
+    os.remove(img_path)
+    os.rmdir(frame_dir)
+    return im.shape
+
+
+def summarize(name: str, timings: list, disk_bytes: int, frames: int):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{name:>10}: mean {statistics.mean(timings):7.2f} ms  "
+        f"p50 {statistics.median(timings):7.2f} ms  p99 {p99:7.2f} ms  "
+        f"disk writes {disk_bytes / frames / 1024:8.1f} KiB/frame"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--width", type=int, default=640)
+    args = parser.parse_args()
+
+    # Shrink the sample to a typical webcam frame before encoding it the way
+    # record.html does
+    im = cv2.imread(args.image)
+    height = int(im.shape[0] * args.width / im.shape[1])
+    im = cv2.resize(im, (args.width, height), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpeg", im)
+    image_data = "data:image/jpeg;base64," + base64.b64encode(buf).decode()
+
+    shm = Path("/dev/shm") if Path("/dev/shm").is_dir() else None
+
+    with tempfile.TemporaryDirectory(dir=".") as disk_dir, tempfile.TemporaryDirectory(
+        dir=shm
+    ) as ram_dir:
+        disk_dir = Path(disk_dir)
+        ram_dir = Path(ram_dir)
+
+        legacy, legacy_bytes = [], 0
+        for _ in range(args.frames):
+            start = time.perf_counter()
+            legacy_bytes += legacy_frame(image_data, disk_dir, disk_dir)
+            legacy.append((time.perf_counter() - start) * 1000)
+
+        in_memory = []
+        for _ in range(args.frames):
+            start = time.perf_counter()
+            in_memory_frame(image_data, ram_dir)
+            in_memory.append((time.perf_counter() - start) * 1000)
+
+    print(f"{args.frames} frames of {im.shape[1]}x{im.shape[0]}, {len(buf)} bytes")
+    summarize("legacy", legacy, legacy_bytes, args.frames)
+    summarize("in-memory", in_memory, 0 if shm else len(buf) * args.frames, args.frames)
+
+
+if __name__ == "__main__":
+    main()
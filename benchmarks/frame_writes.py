@@ -0,0 +1,83 @@
+"""
+Frame document inserts per second: one insert_one per frame, as api2 used to
+do inside its handler, against the write-behind buffer. Runs against an
+in-process fake collection with a simulated round trip, or a real mongod
+with --mongo-url.
+
+    python -m benchmarks.frame_writes --sessions 20 --frames 50
+    python -m benchmarks.frame_writes --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.fakes import FakeCollection
+from write_behind import WriteBehindBuffer
+
+
+def documents(args, frame: str):
+    for count in range(1, args.frames + 1):
+        for session in range(args.sessions):
+            yield f"session-{session}", {
+                "session_id": f"session-{session}",
+                "count": count,
+                "name": "bench",
+                "key": "happy",
+                "image": frame,
+            }
+
+
+def get_collection(args, name: str):
+    if not args.mongo_url:
+        return FakeCollection(latency=args.latency_ms / 1000)
+
+    from pymongo import MongoClient
+
+    collection = MongoClient(args.mongo_url).benchmark[name]
+    collection.drop()
+    return collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--frame-kb", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--max-docs", type=int, default=50)
+    parser.add_argument("--mongo-url")
+    args = parser.parse_args()
+
+    frame = (
+        "data:image/jpeg;base64,"
+        + os.urandom(args.frame_kb * 768).hex()[: args.frame_kb * 1024]
+    )
+    total = args.sessions * args.frames
+
+    collection = get_collection(args, "insert_one")
+    start = time.perf_counter()
+    for _, document in documents(args, frame):
+        collection.insert_one(document)
+    elapsed = time.perf_counter() - start
+    print(f"insert_one:   {total / elapsed:8.0f} inserts/s")
+
+    collection = get_collection(args, "write_behind")
+    buffer = WriteBehindBuffer(collection, max_docs=args.max_docs, max_wait=0.5)
+    start = time.perf_counter()
+    handler_time = 0.0
+    for key, document in documents(args, frame):
+        added = time.perf_counter()
+        buffer.add(key, document)
+        handler_time += time.perf_counter() - added
+    buffer.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"write-behind: {total / elapsed:8.0f} inserts/s, "
+        f"{handler_time / total * 1e6:.1f} us per frame in the handler"
+    )
+    assert buffer.inserted == total, f"only {buffer.inserted} of {total} stored"
+
+
+if __name__ == "__main__":
+    main()
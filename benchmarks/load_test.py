@@ -0,0 +1,304 @@
+"""
+End-to-end load test of main:app and main2:app. Each simulated session runs
+/start, N x /process and /stop; sessions run concurrently in every worker
+process, the way gunicorn runs one app instance per worker.
+
+Runs offline: DeepFace is stubbed (DEEPFACE_STUB_MS), OpenFace is the mock
+worker and Mongo is the in-process fake collection. Requests go through the
+ASGI app in the worker's own event loop, so latencies include the client's
+share of that loop but no network.
+
+Prints a JSON report (throughput, latency percentiles per endpoint, memory
+per worker) that can be saved with --output and compared across commits:
+
+    python -m benchmarks.load_test --sessions 16 --frames 20 --workers 2
+    python -m benchmarks.load_test --app main --output before.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Endpoints whose latencies are reported, per app
+ENDPOINTS = ("/start", "/process", "/stop")
+
+
+def encoded_frames(path: str, width: int, count: int, raw: bool):
+    """
+    `count` JPEG frames of `path` drifting a few pixels apart, so frames of a
+    session differ the way webcam frames do
+    """
+    import cv2
+    import numpy as np
+
+    im = cv2.imread(path)
+    height = round(im.shape[0] * width / im.shape[1])
+    im = cv2.resize(im, (width, height), interpolation=cv2.INTER_AREA)
+
+    frames = []
+    for i in range(count):
+        shift = np.float32([[1, 0, i % 5], [0, 1, i % 3]])
+        moved = cv2.warpAffine(
+            im, shift, (width, height), borderMode=cv2.BORDER_REPLICATE
+        )
+        jpeg = cv2.imencode(".jpeg", moved)[1].tobytes()
+        if raw:
+            frames.append(jpeg)
+        else:
+            frames.append("data:image/jpeg;base64," + base64.b64encode(jpeg).decode())
+    return frames
+
+
+def load_app(name: str, frames_dir: str):
+    """
+    Imports `name`:app against the offline fakes
+    """
+    from benchmarks import fakes
+
+    fakes.install()
+
+    if name == "main":
+        import api
+        import main
+
+        api.db = fakes.FakeCollection()
+        return main.app
+
+    import api2
+    import main2
+    from frame_store import FrameStore
+
+    api2.db = fakes.FakeCollection()
+    api2.db2 = fakes.FakeCollection()
+    api2.frame_writer.collection = api2.db
+    api2.frame_store = FrameStore(None, kind="disk", root=frames_dir)
+    return main2.app
+
+
+async def session(client, args, frames, start_body, latencies, statuses):
+    headers = {"Authorization": os.environ["AUTHORIZATION_KEY"]}
+
+    async def timed(endpoint, method, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, kwargs.pop("url", endpoint), **kwargs)
+        latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        statuses[endpoint][response.status_code] = (
+            statuses[endpoint].get(response.status_code, 0) + 1
+        )
+        return response
+
+    response = await timed("/start", "PUT", headers=headers, json=start_body)
+    headers["SessionId"] = response.json()["SessionId"]
+
+    for i in range(args.frames):
+        frame = frames[i % len(frames)]
+        if args.raw:
+            await timed(
+                "/process",
+                "POST",
+                url="/process/raw",
+                headers={**headers, "Content-Type": "image/jpeg"},
+                content=frame,
+            )
+        else:
+            await timed("/process", "POST", headers=headers, json={"imageData": frame})
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+
+    await timed("/stop", "DELETE", headers=headers)
+
+
+async def drive(app, args, sessions: int, frames: list, start_body):
+    import httpx
+
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    statuses = {endpoint: {} for endpoint in ENDPOINTS}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", timeout=None
+        ) as client:
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    session(client, args, frames, start_body, latencies, statuses)
+                    for _ in range(sessions)
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+    return latencies, statuses, elapsed
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def worker(name: str, args, sessions: int):
+    """
+    Runs `sessions` concurrent sessions against a fresh instance of the app
+    in this process
+    """
+    # The report is the only thing the parent writes to stdout
+    sys.stdout = open(os.devnull, "w")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with tempfile.TemporaryDirectory() as frames_dir:
+        app = load_app(name, frames_dir)
+        baseline = rss_mb()
+        frames = encoded_frames(args.image, args.width, 10, args.raw)
+        start_body = {"name": "load-test", "key": "happy"} if name == "main2" else None
+        latencies, statuses, elapsed = asyncio.run(
+            drive(app, args, sessions, frames, start_body)
+        )
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return {
+        "pid": os.getpid(),
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "latencies": latencies,
+        "statuses": statuses,
+        "memory": {
+            "rss_after_import_mb": baseline,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_mb,
+        },
+    }
+
+
+def percentiles(values: list):
+    if not values:
+        return None
+    if len(values) == 1:
+        cuts = values * 99
+    else:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values), 2),
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+        "max_ms": round(max(values), 2),
+    }
+
+
+def run_app(name: str, args):
+    shares = [
+        args.sessions // args.workers + (i < args.sessions % args.workers)
+        for i in range(args.workers)
+    ]
+    shares = [share for share in shares if share]
+
+    # Fresh interpreters, as gunicorn workers would be, rather than forks of
+    # this one
+    with ProcessPoolExecutor(len(shares), mp_context=get_context("spawn")) as pool:
+        futures = [pool.submit(worker, name, args, share) for share in shares]
+        results = [future.result() for future in futures]
+
+    elapsed = max(result["elapsed_s"] for result in results)
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        latencies = [
+            value for result in results for value in result["latencies"][endpoint]
+        ]
+        statuses = {}
+        for result in results:
+            for status, count in result["statuses"][endpoint].items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+        endpoints[endpoint] = {"latency": percentiles(latencies), "statuses": statuses}
+
+    frames = endpoints["/process"]["latency"]["count"]
+    return {
+        "sessions": sum(shares),
+        "frames": frames,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_s": round(frames / elapsed, 2),
+        "sessions_per_s": round(sum(shares) / elapsed, 2),
+        "endpoints": endpoints,
+        "workers": [
+            {
+                "pid": result["pid"],
+                "sessions": result["sessions"],
+                **{
+                    key: round(value, 1) if value is not None else None
+                    for key, value in result["memory"].items()
+                },
+            }
+            for result in results
+        ],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    apps = ["main", "main2"] if args.app == "both" else [args.app]
+    report = {
+        "revision": git_revision(),
+        "timestamp": round(time.time()),
+        "python": platform.python_version(),
+        "settings": {
+            "sessions": args.sessions,
+            "frames": args.frames,
+            "workers": args.workers,
+            "width": args.width,
+            "raw": args.raw,
+            "think_ms": args.think_ms,
+            "deepface_stub_ms": float(os.getenv("DEEPFACE_STUB_MS", "30")),
+            "detector_stub_ms": float(os.getenv("DETECTOR_STUB_MS", "20")),
+        },
+        "apps": {name: run_app(name, args) for name in apps},
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--app", choices=("main", "main2", "both"), default="both")
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument(
+        "--raw", action="store_true", help="send frames to /process/raw"
+    )
+    parser.add_argument("--think-ms", type=float, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    main(parser.parse_args())
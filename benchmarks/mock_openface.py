@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Stand-in for OpenFace so the FACS path can be exercised without the real
+binary. AU intensities are derived from a hash of the frame bytes, so the same
+frame always gets the same result.
+
+One-shot mode mimics FeatureExtraction (use as OPENFACE_EXECUTABLE):
+
+    mock_openface.py -f frame.jpeg -out_dir out/ -au_static true
+
+Streaming mode speaks the openface_pool protocol (use in
+OPENFACE_WORKER_COMMAND):
+
+    mock_openface.py --serve
+
+MOCK_OPENFACE_LOAD_DELAY and MOCK_OPENFACE_FRAME_DELAY (seconds) simulate
+model loading and per-frame work. MOCK_OPENFACE_CRASH_AFTER makes a streaming
+worker exit after that many frames.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+AU_INTENSITIES = [
+    "AU01",
+    "AU02",
+    "AU04",
+    "AU05",
+    "AU06",
+    "AU07",
+    "AU09",
+    "AU10",
+    "AU12",
+    "AU14",
+    "AU15",
+    "AU17",
+    "AU20",
+    "AU23",
+    "AU25",
+    "AU26",
+    "AU45",
+]
+
+HEADER = ", ".join(
+    ["frame", "face_id", "timestamp", "confidence", "success"]
+    + [f"{au}_r" for au in AU_INTENSITIES]
+)
+
+LOAD_DELAY = float(os.getenv("MOCK_OPENFACE_LOAD_DELAY", "0.5"))
+FRAME_DELAY = float(os.getenv("MOCK_OPENFACE_FRAME_DELAY", "0.01"))
+CRASH_AFTER = int(os.getenv("MOCK_OPENFACE_CRASH_AFTER", "0"))
+
+
+def frame_row(image_bytes: bytes, frame: int = 1):
+    time.sleep(FRAME_DELAY)
+    digest = hashlib.blake2b(image_bytes, digest_size=len(AU_INTENSITIES)).digest()
+    values = [f"{byte / 51:.2f}" for byte in digest]
+    return ", ".join([str(frame), "0", "0.000", "0.98", "1"] + values)
+
+
+def one_shot(image_path: str, out_dir: str):
+    time.sleep(LOAD_DELAY)
+    image_bytes = Path(image_path).read_bytes()
+    output_file = Path(out_dir) / f"{Path(image_path).stem}.csv"
+    output_file.write_text(HEADER + "\n" + frame_row(image_bytes) + "\n")
+
+
+def serve():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+
+    time.sleep(LOAD_DELAY)
+    stdout.write(HEADER.encode() + b"\n")
+    stdout.flush()
+
+    frames = 0
+    for line in iter(stdin.readline, b""):
+        command = line.strip()
+        if command == b"PING":
+            stdout.write(b"PONG\n")
+        elif command.startswith(b"FRAME "):
+            image_bytes = stdin.read(int(command[6:]))
+            frames += 1
+            if CRASH_AFTER and frames > CRASH_AFTER:
+                sys.exit(1)
+            stdout.write(frame_row(image_bytes, frames).encode() + b"\n")
+        else:
+            stdout.write(b"ERROR unknown command\n")
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("-f")
+    parser.add_argument("-out_dir")
+    parser.add_argument("-au_static")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+    else:
+        one_shot(args.f, args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
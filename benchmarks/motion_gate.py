@@ -0,0 +1,173 @@
+"""
+Offline evaluation of the motion gate: how far the /stop result of a
+recording drifts when frames below the threshold reuse the previous result,
+compared with analyzing every frame. Every frame is analyzed once, then each
+threshold is replayed over the stored per-frame results.
+
+Frames come from a video sampled at --fps, a directory of images, or, by
+default, img.jpeg with sensor noise and an occasional head movement.
+
+DeepFace and OpenFace are stubbed (benchmarks/fakes.py) unless --real is
+given, which needs DeepFace and TensorFlow installed and OpenFace configured.
+The stub's scores follow the pixels rather than the face, so real drift
+figures need --real.
+
+    python -m benchmarks.motion_gate --thresholds 1 2 4 8
+    python -m benchmarks.motion_gate --real --video recording.webm --fps 1
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+
+def video_frames(path: str, fps: float):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    step = max(1, round((capture.get(cv2.CAP_PROP_FPS) or fps) / fps))
+    index = 0
+    while True:
+        ok, im = capture.read()
+        if not ok:
+            break
+        if index % step == 0:
+            yield im
+        index += 1
+    capture.release()
+
+
+def directory_frames(path: str):
+    import cv2
+
+    for image in sorted(Path(path).iterdir()):
+        im = cv2.imread(str(image))
+        if im is not None:
+            yield im
+
+
+def synthetic_frames(path: str, count: int, rng):
+    import cv2
+
+    im = cv2.resize(cv2.imread(path), (640, 480), interpolation=cv2.INTER_AREA)
+    shift = 0
+    for _ in range(count):
+        if rng.random() < 0.1:
+            shift = int(rng.integers(-40, 40))
+        moved = np.roll(im, shift, axis=1).astype(np.float32)
+        noisy = moved + rng.normal(0, 1.5, im.shape)
+        yield np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def analyze_all(api, frames: list):
+    import cv2
+
+    results = []
+    for im in frames:
+        image_bytes = cv2.imencode(".jpeg", im)[1].tobytes()
+        emotion = api.process_image_deepface(im)
+        results.append((emotion, api.process_image_facs(image_bytes, "jpeg")))
+    return results
+
+
+def replay(api, motion, frames: list, results: list, threshold: float):
+    """
+    The session aggregate with the gate at `threshold`, and the skip rate
+    """
+    from session_store import apply_update
+
+    gate = motion.MotionGate(threshold=threshold) if threshold > 0 else None
+    session = {}
+    for im, result in zip(frames, results):
+        skipped = False
+        if gate is not None:
+            thumb = motion.thumbnail(im)
+            previous = gate.check("eval", thumb)
+            if previous is not None:
+                result, skipped = previous, True
+            else:
+                gate.record("eval", thumb, result)
+
+        emotion, facs_result = result
+        facs_emotions = {}
+        if facs_result.get("emotion") is not None:
+            facs_emotions[facs_result["emotion"]] = facs_result["confidence"]
+        apply_update(
+            session,
+            maxima={
+                "emo": {k: float(v) for k, v in emotion.items()},
+                "facs_emotions": facs_emotions,
+            },
+            counters={"frames": 1, "skipped": int(skipped)},
+        )
+    return session, api.summarize_session(session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video")
+    parser.add_argument("--frames-dir")
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--count", type=int, default=120)
+    parser.add_argument("--fps", type=float, default=1.0)
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[1.0, 2.0, 4.0, 8.0]
+    )
+    parser.add_argument(
+        "--real", action="store_true", help="use the installed DeepFace and OpenFace"
+    )
+    args = parser.parse_args()
+
+    if not args.real:
+        from benchmarks import fakes
+
+        fakes.install()
+    else:
+        try:
+            import deepface  # noqa: F401
+        except ImportError:
+            sys.exit("--real needs DeepFace installed; run without it to use the stubs")
+
+    import api
+    import motion
+
+    if args.video:
+        frames = list(video_frames(args.video, args.fps))
+    elif args.frames_dir:
+        frames = list(directory_frames(args.frames_dir))
+    else:
+        rng = np.random.default_rng(0)
+        frames = list(synthetic_frames(args.image, args.count, rng))
+    if not frames:
+        sys.exit("No frames to evaluate")
+
+    try:
+        api.start_openface_pool()
+        results = analyze_all(api, frames)
+    finally:
+        api.close_openface_pool()
+
+    baseline_session, baseline = replay(api, motion, frames, results, 0)
+    print(f"{len(frames)} frames, every frame analyzed: {baseline}")
+
+    for threshold in args.thresholds:
+        session, summary = replay(api, motion, frames, results, threshold)
+        drift = max(
+            abs(session["emo"][k] - baseline_session["emo"][k])
+            for k in baseline_session["emo"]
+        )
+        changed = [
+            key for key in ("emotion", "facs_emotion") if summary[key] != baseline[key]
+        ]
+        print(
+            f"threshold {threshold:5.1f}: skip rate {summary['skip_rate']:6.1%}  "
+            f"emotion {summary['emotion']}, facs {summary['facs_emotion']} "
+            f"({'changed: ' + ', '.join(changed) if changed else 'unchanged'})  "
+            f"max emotion score drift {drift:5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+FACS throughput of a subprocess per frame against the persistent worker pool,
+both driven by the mock OpenFace executable. Also kills workers mid-run to
+check that the pool restarts them.
+
+    python -m benchmarks.openface_pool --frames 40 --pool-size 2
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from openface_pool import OpenFacePool
+
+MOCK = Path(__file__).with_name("mock_openface.py")
+
+
+def subprocess_frame(image_bytes: bytes):
+    """
+    The per-frame FeatureExtraction path, as process_image_facs ran it
+    """
+    with tempfile.TemporaryDirectory() as out_dir:
+        img_path = Path(out_dir) / "frame.jpeg"
+        img_path.write_bytes(image_bytes)
+        subprocess.run(
+            [sys.executable, str(MOCK), "-f", str(img_path), "-out_dir", out_dir],
+            check=True,
+        )
+        return (Path(out_dir) / "frame.csv").read_text()
+
+
+def run(name: str, fn, frames: list, concurrency: int):
+    timings = []
+
+    def timed(frame):
+        start = time.perf_counter()
+        fn(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, frames))
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    print(
+        f"{name:>10}: {len(frames) / elapsed:7.1f} frames/s  "
+        f"p50 {statistics.median(timings):7.1f} ms  "
+        f"p99 {timings[int(len(timings) * 0.99)]:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    image_bytes = Path(args.image).read_bytes()
+    # Distinct frames so the mock returns distinct rows
+    frames = [image_bytes + bytes([i % 256]) for i in range(args.frames)]
+
+    run("subprocess", subprocess_frame, frames, args.pool_size)
+
+    pool = OpenFacePool(
+        f"{sys.executable} {MOCK} --serve", size=args.pool_size, health_interval=0.5
+    )
+    pool.start()
+    try:
+        run("pool", pool.analyze, frames, args.pool_size)
+
+        # Crash every worker and wait for the health check to bring them back
+        for worker in pool._workers:
+            worker.proc.kill()
+        time.sleep(1 + float(os.getenv("MOCK_OPENFACE_LOAD_DELAY", "0.5")) * 2)
+        stats = pool.stats()
+        print(f"after crash: {stats}")
+        assert stats["alive"] == args.pool_size, "workers were not restarted"
+
+        result = pool.analyze(frames[0])
+        assert np.array_equal(result, pool.analyze(frames[0]))
+        assert not np.isnan(result).any()
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Latency of the session read endpoints (api4.py) over a MongoDB seeded with
+--sessions x --frames frame documents (1M by default), first without and then
+with database.INDEXES: a page of a session's frames, one session, the
+sessions of a reader, a page of all sessions and the NDJSON export of a
+session. Also reports the index build time and what the projection saves on
+frames stored with an inline image.
+
+The data is seeded once into database --database of MONGO; --reseed drops
+and seeds it again.
+
+    MONGO=mongodb://localhost:27017 python -m benchmarks.queries
+    python -m benchmarks.queries --sessions 100 --frames 100 --repeat 20
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+os.environ.setdefault("AUTHORIZATION_KEY", "benchmark")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+
+import api3  # noqa: E402
+import api4  # noqa: E402
+import database  # noqa: E402
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+# Size of the inline image of frames stored before the frame store
+INLINE_IMAGE_BYTES = 12 * 1024
+
+HEADERS = {"Authorization": api4.AUTHORIZATION_KEY}
+
+
+def session_ids(args):
+    rng = random.Random(0)
+    return [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.sessions)]
+
+
+def seed(db, args):
+    rng = random.Random(1)
+    ids = session_ids(args)
+    keys = list(api3.TEXTS)
+    readers = max(1, args.sessions // 10)
+    inline_image = base64.b64encode(os.urandom(INLINE_IMAGE_BYTES)).decode()
+    legacy = int(args.sessions * args.legacy)
+
+    def emotion():
+        scores = [rng.random() for _ in EMOTIONS]
+        return {e: round(100 * s / sum(scores), 4) for e, s in zip(EMOTIONS, scores)}
+
+    batch = []
+    for i, session_id in enumerate(ids):
+        meta = {"name": f"reader-{i % readers}", "key": keys[i % len(keys)]}
+        for count in range(1, args.frames + 1):
+            frame = {
+                "session_id": session_id,
+                "count": count,
+                **meta,
+                "content_type": "image/jpeg",
+                "size": 18000 + rng.randrange(4000),
+                "analysis": {
+                    "emotion": emotion(),
+                    "facs": {"emotion": rng.choice(EMOTIONS[:-1]), "confidence": 0.5},
+                },
+            }
+            if i < legacy:
+                frame["image"] = inline_image
+            else:
+                frame["blob"] = f"file:{session_id[:8]}{count:06d}.jpeg"
+            batch.append(frame)
+            if len(batch) == args.batch:
+                db.images.insert_many(batch, ordered=False)
+                batch = []
+
+        db.results.insert_one(
+            {
+                "session_id": session_id,
+                "emotion": "happy",
+                "confidence": 50.0,
+                "facs_emotion": "happy",
+                "facs_confidence": 0.5,
+                "frames": args.frames,
+                "skip_rate": 0.0,
+            }
+        )
+        db.results.insert_many(
+            [
+                {"session_id": session_id, "type": "timeline", "bucket": bucket}
+                for bucket in range(args.frames // 600 + 1)
+            ]
+        )
+        if i % 5:
+            db.questions.insert_one(
+                {"session_id": session_id, **meta, "answers": {"q1": "a", "q2": "b"}}
+            )
+    if batch:
+        db.images.insert_many(batch, ordered=False)
+
+
+async def timed(client, path: str, params: dict = None):
+    start = time.perf_counter()
+    response = await client.get(path, params=params, headers=HEADERS)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.text
+    return elapsed, response
+
+
+async def run_cases(client, args):
+    rng = random.Random(2)
+    ids = session_ids(args)
+    readers = max(1, args.sessions // 10)
+
+    cases = {
+        "frames page": lambda: (
+            f"/sessions/{rng.choice(ids)}/frames",
+            {"after": rng.randrange(args.frames), "limit": 100},
+        ),
+        "session": lambda: (f"/sessions/{rng.choice(ids)}", None),
+        "reader's sessions": lambda: (
+            "/sessions",
+            {"name": f"reader-{rng.randrange(readers)}"},
+        ),
+        "sessions page": lambda: (
+            "/sessions",
+            {"after": rng.choice(ids), "limit": 100},
+        ),
+        "session export": lambda: (
+            f"/sessions/{rng.choice(ids)}/frames",
+            {"format": "ndjson"},
+        ),
+    }
+    for name, request in cases.items():
+        times = []
+        for _ in range(args.repeat):
+            elapsed, _ = await timed(client, *request())
+            times.append(elapsed * 1000)
+        print(
+            f"{name:>20}: p50 {statistics.median(times):8.1f} ms  "
+            f"max {max(times):8.1f} ms"
+        )
+
+
+async def export_all(client):
+    start = time.perf_counter()
+    lines = 0
+    async with client.stream(
+        "GET", "/sessions", params={"format": "ndjson"}, headers=HEADERS
+    ) as response:
+        async for line in response.aiter_lines():
+            lines += bool(line)
+    elapsed = time.perf_counter() - start
+    print(f"{'all sessions export':>20}: {lines / elapsed:8.0f} sessions/s")
+
+
+async def projection(client, db, args):
+    legacy_id = session_ids(args)[0]
+    query = {"session_id": legacy_id}
+    full = list(db.images.find(query, {"_id": 0}).sort("count", 1).limit(100))
+    _, response = await timed(client, f"/sessions/{legacy_id}/frames", {"limit": 100})
+    print(
+        f"{'projection':>20}: {len(response.content) / 1024:8.1f} KiB per page of "
+        f"inline-image frames ({len(json.dumps(full)) / 1024:.1f} KiB with images)"
+    )
+
+
+async def main(args):
+    db = MongoClient(args.mongo)[args.database]
+    expected = args.sessions * args.frames
+    if args.reseed or db.images.estimated_document_count() != expected:
+        for name in database.INDEXES:
+            db[name].drop()
+        start = time.perf_counter()
+        seed(db, args)
+        print(f"seeded {expected} frames in {time.perf_counter() - start:.0f} s")
+
+    api4.images, api4.results, api4.questions = db.images, db.results, db.questions
+    app = FastAPI()
+    app.include_router(api4.router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test", timeout=None
+    ) as client:
+        for name in database.INDEXES:
+            db[name].drop_indexes()
+        print("without indexes")
+        await run_cases(client, args)
+
+        start = time.perf_counter()
+        database.ensure_indexes(list(database.INDEXES), db)
+        print(f"with indexes (built in {time.perf_counter() - start:.1f} s)")
+        await run_cases(client, args)
+        await export_all(client)
+        if args.legacy:
+            await projection(client, db, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--mongo", default=os.getenv("MONGO", "mongodb://localhost:27017")
+    )
+    parser.add_argument("--database", default="emocean_bench")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--frames", type=int, default=500, help="per session")
+    parser.add_argument(
+        "--legacy", type=float, default=0.01, help="fraction of inline-image sessions"
+    )
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--reseed", action="store_true")
+    asyncio.run(main(parser.parse_args()))
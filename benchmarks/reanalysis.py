@@ -0,0 +1,99 @@
+"""
+Frames per second of reanalyze.py by worker count, over a dump of captured
+frames in a temporary directory. DeepFace is stubbed (DEEPFACE_STUB_MS) and
+OpenFace is the mock worker, one per process. Also checks that a second run
+finds nothing left to do.
+
+    python -m benchmarks.reanalysis --sessions 8 --frames 24 --workers 1 2 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import fakes
+
+fakes.install()
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from bson import ObjectId, json_util  # noqa: E402
+
+import reanalyze  # noqa: E402
+from frame_store import FrameStore  # noqa: E402
+
+
+def write_dump(path: Path, frames_dir: str, args):
+    im = cv2.imread(args.image)
+    height = round(im.shape[0] * args.width / im.shape[1])
+    im = cv2.resize(im, (args.width, height), interpolation=cv2.INTER_AREA)
+    frame_store = FrameStore(None, kind="disk", root=frames_dir)
+
+    with open(path, "w") as f:
+        for session in range(args.sessions):
+            for count in range(1, args.frames + 1):
+                shift = np.float32([[1, 0, count % 7], [0, 1, session % 5]])
+                moved = cv2.warpAffine(
+                    im, shift, (args.width, height), borderMode=cv2.BORDER_REPLICATE
+                )
+                jpeg = cv2.imencode(".jpeg", moved)[1].tobytes()
+                document = {
+                    "_id": ObjectId(),
+                    "session_id": f"session-{session}",
+                    "count": count,
+                    "name": "bench",
+                    "key": "happy",
+                    "blob": frame_store.put(jpeg, "image/jpeg"),
+                    "content_type": "image/jpeg",
+                    "size": len(jpeg),
+                }
+                f.write(json_util.dumps(document) + "\n")
+
+
+def run(dump: Path, frames_dir: str, workers: int, args):
+    source = reanalyze.DumpFrames(str(dump))
+    start = time.perf_counter()
+    analyzed, summarized = reanalyze.reanalyze(
+        source, workers, args.chunk_size, initargs=(None, frames_dir)
+    )
+    return analyzed, summarized, time.perf_counter() - start
+
+
+def main(args):
+    os.environ.setdefault("OPENFACE_POOL_SIZE", "1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        frames_dir = os.path.join(tmp, "frames")
+        total = args.sessions * args.frames
+        baseline = None
+
+        for workers in args.workers:
+            dump = Path(tmp) / f"images-{workers}.jsonl"
+            write_dump(dump, frames_dir, args)
+            analyzed, summarized, elapsed = run(dump, frames_dir, workers, args)
+            assert analyzed == total, f"analyzed {analyzed} of {total} frames"
+            assert summarized == args.sessions
+
+            rate = analyzed / elapsed
+            baseline = baseline or rate / workers
+            print(
+                f"{workers:2d} workers: {rate:7.1f} frames/s  "
+                f"{rate / baseline:4.2f}x one worker  ({elapsed:.1f} s incl. startup)"
+            )
+
+            analyzed, summarized, _ = run(dump, frames_dir, workers, args)
+            assert (analyzed, summarized) == (0, 0), "re-run was not a no-op"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=24)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    main(parser.parse_args())
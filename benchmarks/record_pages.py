@@ -0,0 +1,92 @@
+"""
+Requests per second for /record: rendering record.html through Jinja on
+every request (the old handler) against the pages pre-rendered at startup,
+uncompressed, gzip-encoded and revalidated with If-None-Match. Requests go
+through the ASGI app in-process, with --clients concurrent clients.
+
+    python -m benchmarks.record_pages --requests 2000 --clients 32
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import APIRouter, FastAPI, Request
+
+import api3
+
+
+def old_router():
+    router = APIRouter()
+
+    @router.get("/record")
+    async def get_record(request: Request, name: str, text: str):
+        if text.lower() not in api3.TEXTS:
+            return "Invalid text type"
+
+        return api3.templates.TemplateResponse(
+            "record.html",
+            {
+                "request": request,
+                "name": name,
+                "text": api3.TEXTS[text.lower()],
+                "key": text,
+                "questions": api3.QUESTIONS[text.lower()],
+            },
+        )
+
+    return router
+
+
+async def run(name: str, router, args, headers: dict):
+    app = FastAPI()
+    app.include_router(router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        sizes = []
+
+        async def reader(count: int, offset: int):
+            for i in range(count):
+                response = await client.get(
+                    "/record",
+                    params={"name": f"student-{offset + i}", "text": "happy"},
+                    headers=headers,
+                )
+                assert response.status_code in (200, 304), response.status_code
+                sizes.append(int(response.headers.get("content-length", 0)))
+
+        per_client = args.requests // args.clients
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(reader(per_client, i * per_client) for i in range(args.clients))
+        )
+        elapsed = time.perf_counter() - start
+
+    total = per_client * args.clients
+    print(
+        f"{name:>20}: {total / elapsed:8.0f} req/s  "
+        f"{sum(sizes) / len(sizes) / 1024:5.1f} KiB/response"
+    )
+
+
+async def main(args):
+    identity = {"Accept-Encoding": "identity"}
+    await run("render per request", old_router(), args, identity)
+    await run("pre-rendered", api3.router, args, identity)
+    await run("pre-rendered gzip", api3.router, args, {"Accept-Encoding": "gzip"})
+    if "br" in api3.RECORD_PAGES["happy"].encoded:
+        await run("pre-rendered br", api3.router, args, {"Accept-Encoding": "br"})
+    await run(
+        "revalidated (304)",
+        api3.router,
+        args,
+        {"If-None-Match": api3.RECORD_PAGES["happy"].etag},
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+/process throughput with and without the result cache on a stream that
+mimics a still subject on a flaky network: a share of uploads are retries of
+the previous frame, and the rest are the same scene with a little sensor
+noise, which only the perceptual key can match.
+
+Also checks which perceptual lookups hit: a noisy copy of a cached frame in
+the same session should, while the same frame in another session or with a
+changed expression (a brightened mouth-sized patch) should not.
+
+    python -m benchmarks.result_cache --frames 200 --retry-rate 0.3
+"""
+
+import argparse
+import asyncio
+import base64
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+from result_cache import MemoryResultCache  # noqa: E402
+
+
+def frame_stream(path: str, frames: int, retry_rate: float, noise: float, rng):
+    im = cv2.resize(cv2.imread(path), (640, 480), interpolation=cv2.INTER_AREA)
+    previous = None
+    for _ in range(frames):
+        if previous is None or rng.random() >= retry_rate:
+            jitter = rng.normal(0, noise, im.shape)
+            noisy = np.clip(im + jitter, 0, 255).astype(np.uint8)
+            previous = cv2.imencode(".jpeg", noisy)[1].tobytes()
+        yield "data:image/jpeg;base64," + base64.b64encode(previous).decode()
+
+
+def check_matches(args, rng):
+    im = cv2.resize(cv2.imread(args.image), (640, 480), interpolation=cv2.INTER_AREA)
+
+    def noisy(frame):
+        jitter = rng.normal(0, args.noise, frame.shape)
+        encoded = cv2.imencode(
+            ".jpeg", np.clip(frame + jitter, 0, 255).astype(np.uint8)
+        )
+        return cv2.imdecode(encoded[1], cv2.IMREAD_COLOR)
+
+    changed = im.copy()
+    changed[300:330, 280:360] = np.clip(changed[300:330, 280:360] + 40.0, 0, 255)
+
+    cache = MemoryResultCache(perceptual=True)
+    cache.put(cache.keys(noisy(im), "a"), "cached")
+    cases = {
+        "same session, noise": (noisy(im), "a", True),
+        "other session": (noisy(im), "b", False),
+        "changed expression": (noisy(changed), "a", False),
+    }
+    for name, (frame, session_id, expected) in cases.items():
+        _, value = cache.lookup(frame, session_id)
+        hit = value is not None
+        print(
+            f"{name:>20}: {'hit' if hit else 'miss':4}  (expected {'hit' if expected else 'miss'})"
+        )
+
+
+async def run(name: str, cache, frames: list):
+    api.result_cache = cache
+    app = FastAPI()
+    app.include_router(api.router)
+    headers = {"Authorization": api.AUTHORIZATION_KEY}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.put("/start", headers=headers)).json()["SessionId"]
+        headers["SessionId"] = session_id
+
+        start = time.perf_counter()
+        for frame in frames:
+            response = await client.post(
+                "/process", headers=headers, json={"imageData": frame}
+            )
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/stats")).json()["result_cache"]
+        await client.request("DELETE", "/stop", headers=headers)
+
+    print(f"{name:>10}: {len(frames) / elapsed:6.1f} frames/s  cache {stats}")
+
+
+async def main(args):
+    api.db = fakes.FakeCollection()
+    api.start_openface_pool()
+    rng = np.random.default_rng(0)
+    frames = list(
+        frame_stream(args.image, args.frames, args.retry_rate, args.noise, rng)
+    )
+
+    await run("off", None, frames)
+    await run("exact", MemoryResultCache(perceptual=False), frames)
+    await run("perceptual", MemoryResultCache(perceptual=True), frames)
+    check_matches(args, rng)
+    api.close_openface_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--retry-rate", type=float, default=0.3)
+    parser.add_argument("--noise", type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
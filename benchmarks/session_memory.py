@@ -0,0 +1,99 @@
+"""
+Memory held by many concurrent api.py sessions: the old dict layout that
+appended every base64 frame to "io", against MemorySessionStore with its
+fixed-size arrays.
+
+    python -m benchmarks.session_memory --sessions 1000 --frames 5
+"""
+
+import argparse
+import base64
+import os
+import random
+import tracemalloc
+
+from session_store import MemorySessionStore
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+ACTION_UNITS = [
+    f"AU{n:02d}" for n in (1, 2, 4, 5, 6, 7, 9, 10, 12, 14, 15, 17, 20, 23, 25, 26, 45)
+]
+FACS_EMOTIONS = ["happy", "sad", "angry", "fear", "disgust", "surprise", "contempt"]
+
+
+def frame_result(rng):
+    return (
+        {e: rng.random() * 100 for e in EMOTIONS},
+        {au: rng.random() * 5 for au in ACTION_UNITS},
+        {rng.choice(FACS_EMOTIONS): rng.random() * 5},
+    )
+
+
+def legacy(args, frame_bytes, keep_io: bool = True):
+    rng = random.Random(0)
+    sessions = {}
+    image_data = "data:image/jpeg;base64," + base64.b64encode(frame_bytes).decode()
+    for s in range(args.sessions):
+        session = sessions[str(s)] = {
+            "io": [],
+            "emo": {},
+            "facs": {"action_units": {}, "emotions": {}},
+        }
+        for _ in range(args.frames):
+            emo, aus, facs = frame_result(rng)
+            # Each request carries its own copy of the data URI
+            if keep_io:
+                session["io"].append("".join([image_data[:1], image_data[1:]]))
+            for k, v in emo.items():
+                session["emo"][k] = max(session["emo"].get(k, v), v)
+            for k, v in aus.items():
+                session["facs"]["action_units"][k] = max(
+                    session["facs"]["action_units"].get(k, v), v
+                )
+            for k, v in facs.items():
+                session["facs"]["emotions"][k] = max(
+                    session["facs"]["emotions"].get(k, v), v
+                )
+    return sessions
+
+
+def compact(args):
+    rng = random.Random(0)
+    store = MemorySessionStore(
+        {"emo": EMOTIONS, "action_units": ACTION_UNITS, "facs_emotions": FACS_EMOTIONS}
+    )
+    for s in range(args.sessions):
+        store.start(str(s))
+        for _ in range(args.frames):
+            emo, aus, facs = frame_result(rng)
+            store.update(
+                str(s), maxima={"emo": emo, "action_units": aus, "facs_emotions": facs}
+            )
+    return store
+
+
+def measure(name: str, fn, *args):
+    tracemalloc.start()
+    kept = fn(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>28}: {current / 2**20:9.1f} MiB")
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--frame-kb", type=int, default=40)
+    args = parser.parse_args()
+
+    frame_bytes = os.urandom(args.frame_kb * 1024)
+    print(f"{args.sessions} sessions x {args.frames} frames of {args.frame_kb} KiB")
+    measure("legacy dicts + io", legacy, args, frame_bytes)
+    measure("legacy dicts, aggregates only", legacy, args, frame_bytes, False)
+    measure("compact", compact, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Hammers each session backend from several workers at once and checks that no
+update is lost. The SQLite store is driven from separate processes, like
+gunicorn workers; the Redis store uses fakeredis when it is installed, or a
+real server with --redis-url.
+
+    python -m benchmarks.session_store --workers 4 --updates 500
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from multiprocessing import Process
+from pathlib import Path
+
+from session_store import MemorySessionStore, RedisSessionStore, SQLiteSessionStore
+
+
+def feed(store, worker: int, updates: int):
+    for i in range(updates):
+        store.update(
+            "bench",
+            maxima={"emo": {"happy": float(worker * updates + i)}},
+            counters={"count": 1},
+        )
+
+
+def sqlite_worker(path: str, worker: int, updates: int):
+    feed(SQLiteSessionStore(path, "bench"), worker, updates)
+
+
+def check(name: str, store, run_workers, args):
+    store.start("bench", {"name": "bench"})
+    start = time.perf_counter()
+    run_workers()
+    elapsed = time.perf_counter() - start
+
+    session = store.pop("bench")
+    total = args.workers * args.updates
+    assert session["count"] == total, f"{name}: lost {total - session['count']}"
+    assert session["emo"]["happy"] == total - 1, f"{name}: wrong maximum"
+    print(f"{name:>7}: {total / elapsed:9.0f} updates/s, no lost updates")
+
+
+def run_threads(store, args):
+    threads = [
+        threading.Thread(target=feed, args=(store, worker, args.updates))
+        for worker in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    memory = MemorySessionStore()
+    check("memory", memory, lambda: run_threads(memory, args), args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "sessions.db")
+
+        def run_processes():
+            processes = [
+                Process(target=sqlite_worker, args=(path, worker, args.updates))
+                for worker in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+        check("sqlite", SQLiteSessionStore(path, "bench"), run_processes, args)
+
+    if args.redis_url:
+        import redis
+
+        client = redis.Redis.from_url(args.redis_url)
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            print("  redis: skipped, install fakeredis or pass --redis-url")
+            return
+        client = fakeredis.FakeRedis()
+
+    redis_store = RedisSessionStore(client, "bench")
+    check("redis", redis_store, lambda: run_threads(redis_store, args), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold start of each app profile in a fresh interpreter: import time of
+building the app (python -X importtime), the packages it goes to, and
+the time from starting the process to the first response (GET /metrics,
+after the lifespan startup). Also lists which heavy packages were loaded by
+then.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --fakes   # without TensorFlow installed
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import app_factory
+
+HEAVY_MODULES = ["tensorflow", "deepface", "cv2", "pymongo", "pandas"]
+
+FAKES = "from benchmarks import fakes; fakes.install()\n"
+
+BUILD = "import app_factory; app_factory.create_app({profile!r})\n"
+
+FIRST_RESPONSE = """
+import asyncio, sys
+import httpx
+import app_factory
+
+async def main():
+    app = app_factory.create_app({profile!r})
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/metrics")
+        # Stubbed packages have no __file__
+        loaded = [
+            name for name in {heavy!r}
+            if getattr(sys.modules.get(name), "__file__", None)
+        ]
+        print("first response", response.status_code, ",".join(loaded), flush=True)
+
+asyncio.run(main())
+"""
+
+
+def import_times(code: str):
+    """
+    (total ms, [(ms, package)] of import time spent in each top-level
+    package, slowest first)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1000
+    total = sum(packages.values())
+    return total, sorted(((ms, name) for name, ms in packages.items()), reverse=True)
+
+
+def first_response(code: str):
+    """
+    (ms from process start to the first response, heavy modules loaded)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    elapsed, loaded = None, ""
+    for line in process.stdout:
+        if line.startswith("first response"):
+            elapsed = (time.perf_counter() - start) * 1000
+            loaded = line.split()[3] if len(line.split()) > 3 else ""
+    process.wait()
+    assert elapsed is not None, f"no response, exit code {process.returncode}"
+    return elapsed, loaded
+
+
+def main(args):
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    prefix = FAKES if args.fakes else ""
+
+    for profile in args.profiles:
+        total, top = import_times(prefix + BUILD.format(profile=profile))
+        elapsed, loaded = first_response(
+            prefix + FIRST_RESPONSE.format(profile=profile, heavy=HEAVY_MODULES)
+        )
+        slowest = ", ".join(f"{name} {ms:.0f}" for ms, name in top[: args.top])
+        print(
+            f"{profile:>9}: imports {total:7.0f} ms, first response {elapsed:7.0f} ms, "
+            f"heavy modules loaded: {loaded or 'none'}"
+        )
+        print(f"{'':>9}  import time by package (ms): {slowest}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", nargs="+", default=list(app_factory.APP_PROFILES))
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--fakes", action="store_true")
+    main(parser.parse_args())
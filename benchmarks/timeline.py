@@ -0,0 +1,86 @@
+"""
+Cost of the per-session timeline: time to pack a frame's record, the records'
+size in the session store against keeping every frame's result dict, time to
+build the timeline from them at stop, and /timeline latency for a long
+stopped session at a few resolutions. Results are stored in the in-process
+fake collection.
+
+    python -m benchmarks.timeline --frames 3600
+"""
+
+import argparse
+import asyncio
+import pickle
+import time
+
+from benchmarks import fakes
+
+fakes.install()
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+import facs  # noqa: E402
+from timeline import Timelines  # noqa: E402
+
+
+def frame_values(rng):
+    emotion = rng.random(len(api.EMOTIONS))
+    emotion = 100 * emotion / emotion.sum()
+    aus = rng.random(len(facs.ACTION_UNITS)) * 5
+    return {
+        "emotion": dict(zip(api.EMOTIONS, emotion.tolist())),
+        "action_units": dict(zip(facs.ACTION_UNITS, aus.tolist())),
+        "facs": dict(zip(facs.scorer.emotions, facs.scorer.score(aus).tolist())),
+    }
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    values = [frame_values(rng) for _ in range(args.frames)]
+
+    timelines = Timelines(api.TIMELINE_LAYOUT)
+    start = time.perf_counter()
+    records = b"".join(timelines.record(frame) for frame in values)
+    elapsed = time.perf_counter() - start
+    print(
+        f"record: {elapsed / args.frames * 1e6:6.1f} us/frame, "
+        f"{len(records) / 1024:7.1f} KiB per session "
+        f"(every frame's dicts: {len(pickle.dumps(values)) / 1024:7.1f} KiB)"
+    )
+
+    start = time.perf_counter()
+    timeline = timelines.build(records)
+    print(f"build: {(time.perf_counter() - start) * 1000:6.1f} ms at stop")
+
+    api.db = fakes.FakeCollection()
+    api.db.insert_many(timeline.documents("bench"))
+    buckets = len(timeline.buckets) + 1
+
+    app = FastAPI()
+    app.include_router(api.router)
+    headers = {"Authorization": api.AUTHORIZATION_KEY, "SessionId": "bench"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for points in (buckets // 2, 200, args.frames):
+            start = time.perf_counter()
+            response = await client.get(
+                "/timeline", headers=headers, params={"points": points}
+            )
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.text
+            result = response.json()
+            assert result["frames"] == args.frames
+            print(
+                f"/timeline {points:5d} points: {elapsed * 1000:6.1f} ms, "
+                f"{result['points']} returned, {len(response.content) / 1024:6.1f} KiB"
+            )
+    api.close_openface_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=3600)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Base64-in-JSON uploads against raw JPEG bodies on /process and /process/raw,
+for both routers. Analysis is stubbed out with zero cost so only the request
+handling is timed.
+
+    python -m benchmarks.upload_formats --frames 200
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DEEPFACE_STUB_MS", "0")
+os.environ.setdefault("MOCK_OPENFACE_FRAME_DELAY", "0")
+
+from benchmarks import fakes  # noqa: E402
+
+fakes.install()
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import api  # noqa: E402
+import api2  # noqa: E402
+from frame_store import FrameStore  # noqa: E402
+
+
+async def upload(client, session_id: str, path: str, frames: int, **body):
+    headers = {"Authorization": api.AUTHORIZATION_KEY, "SessionId": session_id}
+    headers.update(body.pop("headers", {}))
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        response = await client.post(path, headers=headers, **body)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return timings
+
+
+async def run(name: str, module, start_body, args, jpeg: bytes):
+    app = FastAPI()
+    app.include_router(module.router)
+    transport = httpx.ASGITransport(app=app)
+    image_data = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.put(
+            "/start", headers={"Authorization": api.AUTHORIZATION_KEY}, json=start_body
+        )
+        session_id = response.json()["SessionId"]
+
+        json_timings = await upload(
+            client, session_id, "/process", args.frames, json={"imageData": image_data}
+        )
+        raw_timings = await upload(
+            client,
+            session_id,
+            "/process/raw",
+            args.frames,
+            content=jpeg,
+            headers={"Content-Type": "image/jpeg"},
+        )
+
+    json_size = len(f'{{"imageData": "{image_data}"}}')
+    for label, timings, size in (
+        ("json", json_timings, json_size),
+        ("raw", raw_timings, len(jpeg)),
+    ):
+        print(
+            f"{name:>4} {label:>4}: {size / 1024:7.1f} KiB/frame  "
+            f"p50 {statistics.median(timings):6.2f} ms  "
+            f"mean {statistics.mean(timings):6.2f} ms"
+        )
+
+
+async def main(args):
+    im = cv2.imread(args.image)
+    height = int(im.shape[0] * args.width / im.shape[1])
+    im = cv2.resize(im, (args.width, height), interpolation=cv2.INTER_AREA)
+    jpeg = cv2.imencode(".jpeg", im)[1].tobytes()
+
+    api.db = fakes.FakeCollection()
+    api.start_openface_pool()
+    api2.db = fakes.FakeCollection()
+    api2.frame_writer.collection = api2.db
+
+    await run("api", api, None, args, jpeg)
+    with tempfile.TemporaryDirectory() as frames_dir:
+        api2.frame_store = FrameStore(None, kind="disk", root=frames_dir)
+        await run("api2", api2, {"name": "bench", "key": "happy"}, args, jpeg)
+    api.close_openface_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="img.jpeg")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=640)
+    asyncio.run(main(parser.parse_args()))
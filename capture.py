@@ -0,0 +1,106 @@
+"""
+Frame size handling on both ends of the upload.
+
+Recording clients ask the server how to capture: the largest frame width,
+the JPEG quality and the interval between frames. The answer depends on how
+busy the server is, so sessions capture smaller, less frequent frames while
+it is loaded and go back to the defaults once it is not.
+
+On the analysis side, frames wider than ANALYSIS_MAX_WIDTH are shrunk while
+they are decoded. For JPEGs the width is read from the header first so
+libjpeg can decode straight to 1/2, 1/4 or 1/8 scale. What is left to shrink
+after that is less than 2x, which INTER_LINEAR does well enough and much
+faster than INTER_AREA at a non-integer ratio.
+"""
+
+import os
+
+CAPTURE_MAX_WIDTH = int(os.getenv("CAPTURE_MAX_WIDTH", "640"))
+CAPTURE_JPEG_QUALITY = float(os.getenv("CAPTURE_JPEG_QUALITY", "0.8"))
+CAPTURE_INTERVAL_MS = int(os.getenv("CAPTURE_INTERVAL_MS", "1000"))
+# In-flight uploads at which the capture server counts as fully loaded
+CAPTURE_MAX_IN_FLIGHT = int(os.getenv("CAPTURE_MAX_IN_FLIGHT", "16"))
+
+# 0 analyzes frames at whatever size they arrive
+ANALYSIS_MAX_WIDTH = int(os.getenv("ANALYSIS_MAX_WIDTH", "640"))
+
+# (load from which the tier applies, width factor, quality factor,
+#  interval factor), load being the busy fraction of the server
+LOAD_TIERS = [
+    (0.0, 1.0, 1.0, 1.0),
+    (0.5, 0.75, 0.9, 1.5),
+    (0.8, 0.5, 0.75, 2.0),
+]
+
+# Scales libjpeg can decode to directly, as IMREAD_REDUCED_COLOR_<factor>
+REDUCED_FACTORS = [8, 4, 2]
+
+
+def capture_settings(load: float):
+    for threshold, width, quality, interval in reversed(LOAD_TIERS):
+        if load >= threshold:
+            break
+
+    return {
+        "maxWidth": int(CAPTURE_MAX_WIDTH * width),
+        "jpegQuality": round(CAPTURE_JPEG_QUALITY * quality, 2),
+        "intervalMs": int(CAPTURE_INTERVAL_MS * interval),
+        "load": round(load, 2),
+    }
+
+
+def jpeg_size(data: bytes):
+    """
+    (width, height) from the SOF segment of a JPEG, or None if `data` is not
+    a JPEG
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+
+    return None
+
+
+def decode_image(image_bytes: bytes, max_width: int = ANALYSIS_MAX_WIDTH):
+    """
+    Decodes encoded image bytes into a BGR array at most `max_width` wide
+    """
+    # Imported here so the capture server, which only needs the settings,
+    # does not load OpenCV
+    import cv2
+    import numpy as np
+
+    flag = cv2.IMREAD_COLOR
+    interpolation = cv2.INTER_AREA
+    size = jpeg_size(image_bytes) if max_width else None
+    if size is not None:
+        for factor in REDUCED_FACTORS:
+            if size[0] // factor >= max_width:
+                flag = getattr(cv2, f"IMREAD_REDUCED_COLOR_{factor}")
+                interpolation = cv2.INTER_LINEAR
+                break
+
+    im = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+
+    if im is not None and max_width and im.shape[1] > max_width:
+        height = round(im.shape[0] * max_width / im.shape[1])
+        im = cv2.resize(im, (max_width, height), interpolation=interpolation)
+
+    return im
@@ -0,0 +1,126 @@
+"""
+The MongoDB client shared by the routers, created on first use.
+
+Creating a MongoClient resolves mongodb+srv:// hosts and starts monitor
+threads, and importing pymongo alone takes a noticeable part of a worker's
+startup. Routers hold `collection(...)` / `database(...)` handles instead,
+which connect the first time they are used.
+
+The indexes the service queries by are listed in INDEXES. Each router creates
+those of the collections it writes in the background at startup (unless
+MONGO_INDEXES=0, e.g. for a user without the createIndex privilege).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+from logs import log_event
+
+MONGO_INDEXES = os.getenv("MONGO_INDEXES", "1") == "1"
+
+# Index keys per collection of the data database
+INDEXES = {
+    "images": [
+        # A session's frames in order
+        [("session_id", 1), ("count", 1)],
+        # Sessions listed by their first frame, all or by reader or text
+        [("count", 1), ("session_id", 1)],
+        [("name", 1), ("count", 1), ("session_id", 1)],
+        [("key", 1), ("count", 1), ("session_id", 1)],
+    ],
+    "questions": [
+        [("session_id", 1)],
+        [("name", 1)],
+        [("key", 1)],
+    ],
+    "results": [
+        # Session results (no type) and timeline buckets in order
+        [("session_id", 1), ("type", 1), ("bucket", 1)],
+        [("session_id", 1), ("source", 1)],
+    ],
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from pymongo import MongoClient
+
+            _client = MongoClient(os.getenv("MONGO"))
+    return _client
+
+
+class Lazy:
+    """
+    Stands in for the object `resolve` returns, calling it on first use
+    """
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._target = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._resolve()
+        return self._target
+
+    def __getattr__(self, name):
+        # Only reached for attributes Lazy itself does not have
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __getitem__(self, name):
+        return self.get()[name]
+
+
+def database(name: str):
+    return Lazy(lambda: client()[name])
+
+
+def collection(database_name: str, name: str):
+    return Lazy(lambda: client()[database_name][name])
+
+
+def resolve(handle):
+    """
+    The real object behind a Lazy handle, for APIs that check its type
+    """
+    return handle.get() if isinstance(handle, Lazy) else handle
+
+
+def ensure_indexes(names: list, db=None):
+    """
+    Creates the INDEXES of the named collections in `db` (by default the data
+    database); indexes that exist already are left as they are
+    """
+    from pymongo import IndexModel
+
+    db = resolve(db) if db is not None else client()["data"]
+    for name in names:
+        db[name].create_indexes([IndexModel(keys) for keys in INDEXES[name]])
+
+
+async def create_indexes(names: list):
+    """
+    ensure_indexes off the event loop, for a router's lifespan
+    """
+    if not MONGO_INDEXES:
+        return
+    try:
+        await asyncio.to_thread(ensure_indexes, names)
+    except Exception as e:
+        log_event(
+            "mongo_indexes_failed", logging.ERROR, collections=names, error=str(e)
+        )
+        return
+    log_event("mongo_indexes_ready", collections=names)
@@ -0,0 +1,117 @@
+"""
+Runs blocking frame analysis off the asyncio event loop with bounded
+concurrency, so cheap requests stay responsive while frames are analyzed
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from multiprocessing import get_context
+
+from fastapi import HTTPException
+
+from logs import log_event
+from metrics import observe_stages, run_recorded
+
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "thread")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", str(ANALYSIS_WORKERS * 2)))
+
+
+def init_worker():
+    """
+    Loads the analysis pipeline once per worker process, which never runs
+    the server's lifespan
+    """
+    import api
+    import models
+
+    start = time.perf_counter()
+    api.start_openface_pool()
+    try:
+        models.warm_up()
+    except Exception as e:
+        log_event("model_warmup_failed", logging.ERROR, error=str(e))
+        return
+    log_event(
+        "analysis_worker_ready",
+        pid=os.getpid(),
+        seconds=round(time.perf_counter() - start, 2),
+    )
+
+
+class AnalysisExecutor:
+    """
+    `kind` is "thread", "process", or "inline" to run on the event loop as
+    the handlers used to. At most `max_pending` requests hold a slot at once,
+    any more are turned away with 503 instead of queuing without limit.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 4, max_pending: int = 8):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "process":
+                # Fresh interpreters: TensorFlow does not survive a fork of a
+                # parent that has threads running
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=get_context("spawn"),
+                    initializer=init_worker,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="analysis"
+                )
+        return self._pool
+
+    @asynccontextmanager
+    async def slot(self):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, retry later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn, *args):
+        if self.kind == "inline":
+            return fn(*args)
+
+        loop = asyncio.get_running_loop()
+        if self.kind != "process":
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+        # Stages timed in a worker process would stay in its own metrics
+        result, stages = await loop.run_in_executor(
+            self._get_pool(), run_recorded, fn, *args
+        )
+        observe_stages(stages)
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+analysis_executor = AnalysisExecutor(
+    ANALYSIS_EXECUTOR, ANALYSIS_WORKERS, ANALYSIS_MAX_PENDING
+)
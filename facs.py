@@ -0,0 +1,220 @@
+"""
+Table-driven mapping from FACS Action Units to basic emotions.
+
+Each emotion rule lists the AUs that must all be present and a weight per AU.
+An emotion scores the weighted mean of its AUs that are present, or 0 when a
+required AU is missing. The rules are compiled into AU x emotion matrices, so
+a whole (frames x AUs) array is scored with a few NumPy operations; missing
+AUs are NaN. A single frame, as the API scores them, goes through score_one
+instead, plain Python over the same rules, which avoids NumPy's per-call
+overhead.
+
+AUReader turns OpenFace output (a streamed CSV line, a single image CSV or a
+multi-frame video CSV) into arrays in ACTION_UNITS order.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# AU intensities reported by OpenFace, in column order
+ACTION_UNITS = [
+    "AU01",
+    "AU02",
+    "AU04",
+    "AU05",
+    "AU06",
+    "AU07",
+    "AU09",
+    "AU10",
+    "AU12",
+    "AU14",
+    "AU15",
+    "AU17",
+    "AU20",
+    "AU23",
+    "AU25",
+    "AU26",
+    "AU45",
+]
+
+FACS_RULES = os.getenv("FACS_RULES", str(Path(__file__).with_name("facs_rules.json")))
+
+
+class FacsScorer:
+    def __init__(self, rules: dict, action_units: list = ACTION_UNITS):
+        self.action_units = action_units
+        self.emotions = list(rules)
+        self.index = {au: i for i, au in enumerate(action_units)}
+
+        self.weights = np.zeros((len(action_units), len(self.emotions)))
+        self.required = np.zeros((len(action_units), len(self.emotions)))
+        for j, rule in enumerate(rules.values()):
+            for au, weight in rule["weights"].items():
+                self.weights[self.index[au], j] = weight
+            for au in rule["required"]:
+                self.required[self.index[au], j] = 1
+        self.required_count = self.required.sum(axis=0)
+        self.labels = np.array(self.emotions + ["neutral"])
+
+        # Per emotion: (required AUs, (AU, weight) pairs in AU order)
+        self.rules = [
+            (
+                tuple(rule["required"]),
+                tuple(
+                    (au, float(rule["weights"][au]))
+                    for au in action_units
+                    if au in rule["weights"]
+                ),
+            )
+            for rule in rules.values()
+        ]
+
+    @classmethod
+    def from_file(cls, path: str = FACS_RULES):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def vector(self, aus: dict):
+        """
+        Turns {"AU01": 1.2, ...} into an AU vector, NaN where missing
+        """
+        values = np.full(len(self.action_units), np.nan)
+        for au, value in aus.items():
+            i = self.index.get(au)
+            if i is not None:
+                values[i] = value
+        return values
+
+    def score(self, aus: np.ndarray):
+        """
+        Scores an AU vector, or an array of them, returning one score per
+        emotion in self.emotions order
+        """
+        present = ~np.isnan(aus)
+        values = np.where(present, aus, 0.0)
+        present = present.astype(float)
+
+        total = values @ self.weights
+        weight = present @ self.weights
+        matched = (present @ self.required == self.required_count) & (weight > 0)
+        return np.where(matched, total / np.where(weight > 0, weight, 1), 0.0)
+
+    def score_one(self, aus: dict):
+        """
+        Scores one frame given as {"AU01": 1.2, ...}, as a list in
+        self.emotions order; the same scores as score(vector(aus))
+        """
+        scores = []
+        for required, weights in self.rules:
+            score = 0.0
+            for au in required:
+                value = aus.get(au)
+                if value is None or value != value:
+                    break
+            else:
+                total = weight = 0.0
+                for au, w in weights:
+                    value = aus.get(au)
+                    if value is not None and value == value:
+                        total += value * w
+                        weight += w
+                if weight > 0:
+                    score = total / weight
+            scores.append(score)
+        return scores
+
+    def dominant_one(self, scores: list):
+        """
+        dominant() of one frame's score list
+        """
+        best = max(scores)
+        if not any(scores):
+            return "neutral"
+        return self.emotions[scores.index(best)]
+
+    def dominant(self, scores: np.ndarray):
+        """
+        The highest scoring emotion per frame, "neutral" where all are zero
+        """
+        best = np.argmax(scores, axis=-1)
+        return self.labels[
+            np.where((scores != 0).any(axis=-1), best, len(self.emotions))
+        ]
+
+
+class AUReader:
+    """
+    Parses OpenFace CSV rows into AU intensity arrays. The AU*_r column
+    indices are worked out once per distinct header line and cached.
+    """
+
+    def __init__(self, action_units: list = ACTION_UNITS):
+        self.action_units = action_units
+        self._columns = {}
+
+    def columns(self, header: str):
+        """
+        Returns (field positions, AU positions, number of fields) for the AU
+        intensity columns of a header line
+        """
+        columns = self._columns.get(header)
+        if columns is None:
+            index = {au: i for i, au in enumerate(self.action_units)}
+            fields, positions = [], []
+            for i, col in enumerate(header.split(",")):
+                col = col.strip()
+                if col.startswith("AU") and col.endswith("_r"):
+                    position = index.get(col[:-2])
+                    if position is not None:
+                        fields.append(i)
+                        positions.append(position)
+            columns = (fields, positions, header.count(",") + 1)
+            self._columns[header] = columns
+        return columns
+
+    def parse_line(self, header: str, line: str):
+        """
+        One CSV row as an AU vector, NaN for AUs OpenFace did not report
+        """
+        fields, positions, width = self.columns(header)
+        row = line.split(",")
+        if len(row) != width:
+            raise ValueError(f"Malformed OpenFace row: {line[:80]}")
+
+        values = np.full(len(self.action_units), np.nan)
+        try:
+            values[positions] = np.array([row[i] for i in fields], dtype=float)
+        except ValueError:
+            # Blank fields, seen on frames where tracking failed
+            for i, position in zip(fields, positions):
+                if row[i].strip():
+                    values[position] = float(row[i])
+        return values
+
+    def read_csv(self, path: str):
+        """
+        Every row of an OpenFace CSV as a (frames x AUs) array
+        """
+        with open(path) as f:
+            header = f.readline()
+            rows = [self.parse_line(header, line) for line in f if line.strip()]
+        if not rows:
+            return np.empty((0, len(self.action_units)))
+        return np.vstack(rows)
+
+    def to_dict(self, values: np.ndarray):
+        """
+        {"AU01": 1.2, ...} for the AUs present in one AU vector
+        """
+        return {
+            au: value
+            for au, value in zip(self.action_units, values.tolist())
+            if value == value
+        }
+
+
+scorer = FacsScorer.from_file()
+au_reader = AUReader()
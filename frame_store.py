@@ -0,0 +1,103 @@
+"""
+Binary storage for captured frames. Frame documents only keep a reference
+("gridfs:<id>" or "file:<sha256>.<ext>") to the raw encoded bytes.
+
+FRAME_STORE selects where new frames go:
+
+    gridfs  the "frames" GridFS bucket of the data database (default)
+    disk    a content-addressed directory (FRAME_STORE_DIR), identical
+            frames are stored once
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from database import resolve
+
+FRAME_STORE = os.getenv("FRAME_STORE", "gridfs")
+FRAME_STORE_DIR = os.getenv("FRAME_STORE_DIR", "./frames")
+
+
+class GridFSFrameStore:
+    def __init__(self, database, bucket_name: str = "frames"):
+        import gridfs
+
+        self.bucket = gridfs.GridFSBucket(resolve(database), bucket_name=bucket_name)
+
+    def put(self, data: bytes, content_type: str = "image/jpeg"):
+        file_id = self.bucket.upload_from_stream(
+            hashlib.sha256(data).hexdigest(),
+            data,
+            metadata={"content_type": content_type},
+        )
+        return f"gridfs:{file_id}"
+
+    def open(self, ref: str):
+        """
+        Returns a file-like object that reads the frame chunk by chunk
+        """
+        from bson import ObjectId
+
+        return self.bucket.open_download_stream(ObjectId(ref.split(":", 1)[1]))
+
+
+class DiskFrameStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, name: str):
+        return self.root / name[:2] / name[2:4] / name
+
+    def put(self, data: bytes, content_type: str = "image/jpeg"):
+        extension = content_type.split("/")[-1]
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self._path(name)
+
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so readers never see a partial frame
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        return f"file:{name}"
+
+    def open(self, ref: str):
+        return open(self._path(ref.split(":", 1)[1]), "rb")
+
+
+class FrameStore:
+    """
+    Writes to the configured backend and reads references from either
+    """
+
+    def __init__(self, database, kind: str = FRAME_STORE, root: str = FRAME_STORE_DIR):
+        self.database = database
+        self.root = root
+        self.kind = kind
+        self._gridfs = None
+        self._disk = None
+
+    @property
+    def gridfs(self):
+        if self._gridfs is None:
+            self._gridfs = GridFSFrameStore(self.database)
+        return self._gridfs
+
+    @property
+    def disk(self):
+        if self._disk is None:
+            self._disk = DiskFrameStore(self.root)
+        return self._disk
+
+    def put(self, data: bytes, content_type: str = "image/jpeg"):
+        backend = self.disk if self.kind == "disk" else self.gridfs
+        return backend.put(data, content_type)
+
+    def open(self, ref: str):
+        if ref.startswith("file:"):
+            return self.disk.open(ref)
+        return self.gridfs.open(ref)
@@ -0,0 +1,63 @@
+"""
+Structured logging for the request handlers.
+
+Events are JSON lines. Handlers only put the record on a queue; formatting
+and writing happen on a background thread. Per-frame events are sampled at
+LOG_SAMPLE_RATE so a busy server does not log every frame.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        event = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.msg,
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(event, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records as they are; the stock handler formats them first, on
+    the calling thread
+    """
+
+    def prepare(self, record: logging.LogRecord):
+        return record
+
+
+logger = logging.getLogger("emocean")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+_queue = queue.SimpleQueue()
+_output = logging.StreamHandler(sys.stdout)
+_output.setFormatter(JSONFormatter())
+logger.addHandler(DeferredQueueHandler(_queue))
+_listener = logging.handlers.QueueListener(_queue, _output)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def log_event(event: str, level: int = logging.INFO, sample: float = 1.0, **fields):
+    """
+    Logs `event` with `fields`, or only a `sample` fraction of the calls
+    """
+    if sample < 1.0 and random.random() >= sample:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
@@ -1,31 +1,8 @@
-from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from api2 import router as api2
-from api3 import router as api3
+from app_factory import create_app
 
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("Starting up...")
-    yield
-    print("Shutting down...")
-
-
-app = FastAPI(lifespan=lifespan)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(api2)
-app.include_router(api3)
+app = create_app("capture")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+"""
+In-process metrics in the Prometheus text format, served on /metrics.
+
+Stage timings are histograms labelled by stage. Values that already live
+elsewhere (session counts, queue depths, cache hits) are read through
+callbacks when /metrics is scraped, so the hot path does not update them
+twice. Every server process keeps its own metrics; with several workers each
+one is scraped, or aggregated, separately.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached lookup to a slow OpenFace run
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = ""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.type = "counter"
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in values.items():
+            yield self.name + format_labels(self.labels, key), value
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.type = "histogram"
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    async def timed(self, awaitable, **labels):
+        with self.time(**labels):
+            return await awaitable
+
+    def summary(self, label: str):
+        """
+        {label value: {"count", "mean_ms"}} over one label
+        """
+        index = self.labels.index(label)
+        with self.lock:
+            return {
+                key[index]: {
+                    "count": sum(counts),
+                    "mean_ms": 1000 * total / sum(counts),
+                }
+                for key, (counts, total) in self.series.items()
+            }
+
+    def samples(self):
+        with self.lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self.series.items()
+            }
+        for key, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = format_labels(self.labels, key, f'le="{le}"')
+                yield f"{self.name}_bucket{labels}", cumulative
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels}", total
+            yield f"{self.name}_count{labels}", cumulative
+
+
+class Callback:
+    """
+    A gauge or counter whose values are read from `fn` at scrape time. `fn`
+    returns a number, or {label value: number} for a single label.
+    """
+
+    def __init__(
+        self, name: str, help: str, fn, type: str = "gauge", label: str = None
+    ):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.fn = fn
+        self.label = label
+
+    def samples(self):
+        value = self.fn()
+        if value is None:
+            return
+        if self.label is None:
+            yield self.name, value
+            return
+        for key, item in value.items():
+            yield self.name + format_labels((self.label,), (key,)), item
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(
+    Histogram(
+        "emocean_stage_seconds",
+        "Time spent in each stage of frame processing",
+        labels=("stage",),
+    )
+)
+request_seconds = registry.register(
+    Histogram(
+        "emocean_request_seconds",
+        "HTTP request latency by route and status",
+        labels=("route", "status"),
+    )
+)
+errors = registry.register(
+    Counter("emocean_errors_total", "Failed frames by cause", labels=("kind",))
+)
+
+
+# Stage timings of the current call when it runs in a worker process, see
+# recording()
+_recorded = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=name)
+        stages = getattr(_recorded, "stages", None)
+        if stages is not None:
+            stages.append((name, seconds))
+
+
+@contextmanager
+def recording():
+    """
+    Collects the (stage, seconds) timed in this thread, so a worker process
+    can hand them back to the server process that serves /metrics
+    """
+    _recorded.stages = stages = []
+    try:
+        yield stages
+    finally:
+        _recorded.stages = None
+
+
+def run_recorded(fn, *args):
+    """
+    Runs fn(*args), returning its result and the stage timings it recorded
+    """
+    with recording() as stages:
+        result = fn(*args)
+    return result, stages
+
+
+def observe_stages(stages: list):
+    for name, seconds in stages:
+        stage_seconds.observe(seconds, stage=name)
+
+
+def timed_stage(name: str, awaitable):
+    return stage_seconds.timed(awaitable, stage=name)
+
+
+class RequestMetrics:
+    """
+    ASGI middleware recording request latency per route template, so label
+    values stay bounded whatever paths clients send
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            request_seconds.observe(
+                time.perf_counter() - start,
+                route=route.path if route is not None else "unmatched",
+                status=str(status),
+            )
@@ -0,0 +1,98 @@
+"""
+Moves frames stored inline in mongo.data.images (base64 data URIs, or raw
+bytes from /process/raw) into the frame store, leaving only a reference in
+each document. Safe to interrupt and re-run: only documents that still have
+an "image" field are converted.
+
+    python migrate_frames.py --batch-size 500
+    python migrate_frames.py --store disk --dry-run
+"""
+
+import argparse
+import base64
+import os
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from frame_store import FRAME_STORE, FrameStore
+
+
+def decode_image(image):
+    """
+    Returns (bytes, content type) for an inline image field
+    """
+    if isinstance(image, str):
+        header, base64_str = image.split(",", 1)
+        return base64.b64decode(base64_str), header.split(";")[0].split(":")[1]
+    return bytes(image), "image/jpeg"
+
+
+def migrate(collection, frame_store: FrameStore, batch_size: int, dry_run: bool):
+    converted = 0
+    last_id = None
+    start = time.perf_counter()
+
+    while True:
+        # Page by _id instead of holding one cursor open across the updates
+        query = {"image": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            collection.find(query, {"image": 1, "content_type": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        updates = []
+        for document in batch:
+            image_bytes, content_type = decode_image(document["image"])
+            content_type = document.get("content_type", content_type)
+            if not dry_run:
+                blob = frame_store.put(image_bytes, content_type)
+                updates.append(
+                    UpdateOne(
+                        {"_id": document["_id"]},
+                        {
+                            "$set": {
+                                "blob": blob,
+                                "content_type": content_type,
+                                "size": len(image_bytes),
+                            },
+                            "$unset": {"image": ""},
+                        },
+                    )
+                )
+
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+
+        converted += len(batch)
+        last_id = batch[-1]["_id"]
+        elapsed = time.perf_counter() - start
+        print(f"{converted} frames converted, {converted / elapsed:.0f}/s")
+
+    return converted
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mongo", default=os.getenv("MONGO"))
+    parser.add_argument("--store", default=FRAME_STORE, choices=["gridfs", "disk"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    mongo = MongoClient(args.mongo)
+    frame_store = FrameStore(mongo.data, kind=args.store)
+    converted = migrate(mongo.data.images, frame_store, args.batch_size, args.dry_run)
+    print(f"Done, {converted} frames {'checked' if args.dry_run else 'migrated'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+DeepFace models shared by every request handled by this server process.
+
+Importing deepface loads TensorFlow, which takes seconds, so it is imported
+on first use (normally the lifespan warm-up) rather than with this module.
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from logs import log_event
+
+DETECTOR_BACKEND = os.getenv("DEEPFACE_DETECTOR", "opencv")
+
+emotion_model = None
+face_detector = None
+
+ready = threading.Event()
+warmup_lock = threading.Lock()
+timings = {}
+
+
+def deepface():
+    """
+    The DeepFace class, importing deepface the first time
+    """
+    from deepface import DeepFace
+
+    return DeepFace
+
+
+def warm_up():
+    """
+    Builds the emotion model and face detector once and runs a dummy inference
+    so the graph is traced before the first real frame arrives
+    """
+    global emotion_model, face_detector
+
+    with warmup_lock:
+        if ready.is_set():
+            return
+
+        start = time.perf_counter()
+        DeepFace = deepface()
+        emotion_model = DeepFace.build_model(
+            model_name="Emotion", task="facial_attribute"
+        )
+        face_detector = DeepFace.build_model(
+            model_name=DETECTOR_BACKEND, task="face_detector"
+        )
+        loaded = time.perf_counter()
+
+        DeepFace.analyze(
+            img_path=np.zeros((224, 224, 3), dtype=np.uint8),
+            actions=["emotion"],
+            detector_backend=DETECTOR_BACKEND,
+            enforce_detection=False,
+            silent=True,
+        )
+        warmed = time.perf_counter()
+
+        timings["model_load"] = loaded - start
+        timings["warmup_inference"] = warmed - loaded
+        ready.set()
+
+    log_event(
+        "deepface_ready",
+        seconds=round(warmed - start, 2),
+        model_load=round(timings["model_load"], 2),
+        warmup_inference=round(timings["warmup_inference"], 2),
+    )
+
+
+def record_first_request(seconds: float):
+    if "first_request" not in timings:
+        timings["first_request"] = seconds
+        log_event("first_request", ms=round(seconds * 1000))
+
+
+def emotion_input(face: np.ndarray):
+    """
+    Turns a detected RGB face into the 48x48 grayscale input of the emotion
+    model, the same way DeepFace.analyze prepares it
+    """
+    from deepface.modules.preprocessing import resize_image
+
+    img = resize_image(img=face[:, :, ::-1], target_size=(224, 224))
+    gray = cv2.cvtColor(img[0], cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (48, 48))
+
+
+def predict_emotions(images: list, detector_backend: str = None):
+    """
+    Runs face detection per image and the emotion model once over the whole
+    batch. Returns an emotion dict per image, or the exception raised for it.
+    Pass detector_backend="skip" for images that are already face crops.
+    """
+    warm_up()
+    from deepface.models.demography.Emotion import labels as EMOTION_LABELS
+
+    DeepFace = deepface()
+    results = [None] * len(images)
+    inputs = []
+    indexes = []
+    for i, img in enumerate(images):
+        try:
+            faces = DeepFace.extract_faces(
+                img_path=img,
+                detector_backend=detector_backend or DETECTOR_BACKEND,
+                align=True,
+            )
+            inputs.append(emotion_input(faces[0]["face"]))
+            indexes.append(i)
+        except Exception as e:
+            results[i] = e
+
+    if inputs:
+        batch = np.stack(inputs)[..., np.newaxis]
+        predictions = emotion_model.model.predict(batch, verbose=0)
+        predictions = 100 * predictions / predictions.sum(axis=1, keepdims=True)
+        for i, prediction in zip(indexes, predictions):
+            results[i] = {
+                label: float(value) for label, value in zip(EMOTION_LABELS, prediction)
+            }
+
+    return results
@@ -0,0 +1,95 @@
+"""
+Per-session motion gate.
+
+Consecutive webcam frames of a recording often barely differ. Each session
+keeps a small grayscale thumbnail of the last analyzed frame; a new frame
+whose mean absolute difference from it is below MOTION_GATE_THRESHOLD (on the
+0-255 scale) reuses that frame's result instead of being analyzed again. At
+most MOTION_GATE_MAX_SKIPS frames in a row are skipped, so a slow drift is
+still picked up. A threshold of 0 turns the gate off.
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from session_store import SESSION_TTL, SWEEP_INTERVAL
+
+MOTION_GATE_THRESHOLD = float(os.getenv("MOTION_GATE_THRESHOLD", "0"))
+MOTION_GATE_MAX_SKIPS = int(os.getenv("MOTION_GATE_MAX_SKIPS", "10"))
+
+THUMBNAIL_SIZE = (32, 24)
+
+
+def thumbnail(im: np.ndarray):
+    """
+    Downscaled grayscale copy of a BGR frame, for cheap comparisons
+    """
+    gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+    small = cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32)
+
+
+def difference(a: np.ndarray, b: np.ndarray):
+    return float(np.abs(a - b).mean())
+
+
+class MotionGate:
+    def __init__(
+        self,
+        threshold: float = MOTION_GATE_THRESHOLD,
+        max_skips: int = MOTION_GATE_MAX_SKIPS,
+        ttl: float = SESSION_TTL,
+    ):
+        self.threshold = threshold
+        self.max_skips = max_skips
+        self.ttl = ttl
+        # session id -> [thumbnail, result, consecutive skips, last seen]
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    def check(self, session_id: str, thumb: np.ndarray):
+        """
+        Returns the previous result if the frame has not changed enough to be
+        analyzed again, otherwise None
+        """
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None or entry[2] >= self.max_skips:
+                return None
+            if difference(entry[0], thumb) >= self.threshold:
+                return None
+            entry[2] += 1
+            entry[3] = time.monotonic()
+            return entry[1]
+
+    def record(self, session_id: str, thumb: np.ndarray, result):
+        """
+        Makes `thumb` the reference frame of the session
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.sessions[session_id] = [thumb, result, 0, now]
+
+        if now - self.last_sweep > SWEEP_INTERVAL:
+            self.evict_expired()
+
+    def pop(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            self.last_sweep = now
+            expired = [
+                session_id
+                for session_id, entry in self.sessions.items()
+                if now - entry[3] > self.ttl
+            ]
+            for session_id in expired:
+                del self.sessions[session_id]
@@ -0,0 +1,207 @@
+"""
+Long-lived OpenFace workers.
+
+Each worker is a process started from OPENFACE_WORKER_COMMAND that keeps the
+OpenFace models loaded and speaks a small line protocol over its stdio:
+
+    on startup   -> worker writes the OpenFace CSV header line
+    FRAME <n>\\n + n bytes of encoded image -> one CSV row (or "ERROR <msg>")
+    PING\\n      -> PONG
+
+The stock FeatureExtraction binary only handles one input per run, so the
+command has to be a streaming wrapper around the OpenFace libraries. No such
+wrapper ships with this repo, so the pool is off unless
+OPENFACE_WORKER_COMMAND is set, and api.py runs FeatureExtraction once per
+frame. benchmarks/mock_openface.py implements the protocol for local testing
+only.
+"""
+
+import logging
+import os
+import queue
+import select
+import shlex
+import subprocess
+import threading
+import time
+
+import facs
+from logs import log_event
+from metrics import stage
+
+
+class WorkerError(Exception):
+    pass
+
+
+class OpenFaceWorker:
+    def __init__(self, command: list, timeout: float):
+        self.command = command
+        self.timeout = timeout
+        self.proc = None
+        self.header = ""
+        self._buffer = b""
+
+    def start(self):
+        self._buffer = b""
+        self.proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        # Model loading happens before the header is written
+        self.header = self._readline(timeout=max(self.timeout, 60.0))
+        facs.au_reader.columns(self.header)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def ping(self):
+        try:
+            self._write(b"PING\n")
+            return self._readline(self.timeout) == "PONG"
+        except WorkerError:
+            return False
+
+    def analyze(self, image_bytes: bytes):
+        """
+        Returns the AU intensities (AU*_r columns) for one frame, in
+        facs.ACTION_UNITS order with NaN for missing AUs
+        """
+        with stage("openface"):
+            self._write(b"FRAME %d\n" % len(image_bytes) + image_bytes)
+            line = self._readline(self.timeout)
+        if line.startswith("ERROR"):
+            raise ValueError(line[6:] or "OpenFace could not process the frame")
+
+        try:
+            with stage("csv_parse"):
+                return facs.au_reader.parse_line(self.header, line)
+        except ValueError as e:
+            raise WorkerError(str(e))
+
+    def _write(self, data: bytes):
+        if not self.alive():
+            raise WorkerError("OpenFace worker is not running")
+        try:
+            self.proc.stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"OpenFace worker pipe closed: {e}")
+
+    def _readline(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WorkerError("OpenFace worker timed out")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise WorkerError("OpenFace worker exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode().strip()
+
+
+class OpenFacePool:
+    def __init__(
+        self,
+        command: str,
+        size: int = 2,
+        timeout: float = 10.0,
+        health_interval: float = 30.0,
+    ):
+        self.command = shlex.split(command)
+        self.size = size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.restarts = 0
+        self._workers = []
+        self._idle = queue.Queue()
+        self._closed = threading.Event()
+        self._health_thread = None
+
+    def start(self):
+        for _ in range(self.size):
+            worker = OpenFaceWorker(self.command, self.timeout)
+            worker.start()
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+        if self.health_interval > 0:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="openface-health", daemon=True
+            )
+            self._health_thread.start()
+
+    def close(self):
+        self._closed.set()
+        for worker in self._workers:
+            worker.stop()
+
+    def analyze(self, image_bytes: bytes):
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise WorkerError("No OpenFace worker available")
+
+        try:
+            return worker.analyze(image_bytes)
+        except WorkerError:
+            self._restart(worker)
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "alive": sum(worker.alive() for worker in self._workers),
+            "restarts": self.restarts,
+        }
+
+    def _restart(self, worker: OpenFaceWorker):
+        self.restarts += 1
+        try:
+            worker.restart()
+        except (WorkerError, OSError) as e:
+            # Leave it stopped, the health check will try again
+            log_event("openface_restart_failed", logging.ERROR, error=str(e))
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_interval):
+            # Only check workers that are idle right now, busy ones are
+            # checked by their own request
+            for _ in range(self._idle.qsize()):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if not worker.ping():
+                        self._restart(worker)
+                finally:
+                    self._idle.put(worker)
@@ -0,0 +1,210 @@
+"""
+Opt-in profiling of the analysis server.
+
+Nothing here is installed unless PROFILE_KEY or PROFILE_PATHS is set, so a
+server started without them runs exactly as before.
+
+- A request carrying `X-Profile: <PROFILE_KEY>` is profiled on its own.
+  `X-Profile-Mode: sample` samples every thread instead of running cProfile.
+- Every request to a route in PROFILE_PATHS (e.g. "/process,/process/raw")
+  is profiled, sampled down to PROFILE_RATE of the requests.
+- `POST /profile?seconds=30` with the same header samples every thread of
+  the worker that receives it for that window.
+
+cProfile output (.prof) loads with `pstats` or snakeviz. It only sees the
+event loop thread, where other requests' handlers interleave with the
+profiled one; DeepFace and OpenFace run on executor threads and show up as
+the awaits that wait for them. The sampler (.folded, one "frames count" line
+per stack, rooted at the thread name) covers every thread and loads into
+speedscope or flamegraph.pl.
+
+Files go to PROFILE_DIR and are named after the process id, so the workers
+gunicorn starts from app.yaml never write over each other. The response
+names the file in an `X-Profile-File` header.
+"""
+
+import asyncio
+import cProfile
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Annotated
+
+from fastapi import APIRouter, Header, HTTPException
+
+PROFILE_KEY = os.getenv("PROFILE_KEY")
+PROFILE_PATHS = [path for path in os.getenv("PROFILE_PATHS", "").split(",") if path]
+PROFILE_RATE = float(os.getenv("PROFILE_RATE", "1.0"))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "emocean-profiles")
+)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+PROFILING = bool(PROFILE_KEY or PROFILE_PATHS)
+
+# cProfile allows a single active profiler per thread, and concurrent
+# profiles of the event loop would each record the others' requests anyway
+cprofile_lock = threading.Lock()
+
+
+def profile_path(label: str, suffix: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{label}-{os.getpid()}-{int(time.time() * 1000)}{suffix}"
+    return os.path.join(PROFILE_DIR, name)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Sampler:
+    """
+    Samples the stacks of every thread in the process every `interval`
+    seconds on a background thread
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def label_for(path: str):
+    return path.strip("/").replace("/", "_") or "root"
+
+
+class ProfileRequests:
+    """
+    ASGI middleware profiling the requests selected by header or by
+    PROFILE_PATHS
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def mode(self, scope):
+        if scope["path"] == "/profile":
+            # The window endpoint runs its own sampler
+            return None
+        headers = dict(scope["headers"])
+        key = headers.get(b"x-profile")
+        if PROFILE_KEY and key is not None and key.decode() == PROFILE_KEY:
+            return headers.get(b"x-profile-mode", b"cprofile").decode()
+        if scope["path"] in PROFILE_PATHS and random.random() < PROFILE_RATE:
+            return "cprofile"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        mode = self.mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        label = label_for(scope["path"])
+        if mode == "sample":
+            profiler = Sampler().start()
+            path = profile_path(label, ".folded")
+        elif cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            path = profile_path(label, ".prof")
+        else:
+            # Another request is already under cProfile
+            return await self.app(scope, receive, send)
+
+        async def send_with_path(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", path.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_path)
+        finally:
+            if mode == "sample":
+                profiler.stop()
+                await asyncio.to_thread(profiler.dump, path)
+            else:
+                profiler.disable()
+                cprofile_lock.release()
+                await asyncio.to_thread(profiler.dump_stats, path)
+
+
+router = APIRouter()
+
+
+@router.post("/profile", description="Samples this worker for a time window")
+async def profile_window(
+    profile_key: Annotated[str, Header(alias="X-Profile")],
+    seconds: float = 30,
+):
+    if not PROFILE_KEY or profile_key != PROFILE_KEY:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]",
+        )
+
+    path = profile_path("window", ".folded")
+    sampler = Sampler().start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    await asyncio.to_thread(sampler.dump, path)
+
+    return {
+        "pid": os.getpid(),
+        "file": path,
+        "samples": sum(sampler.stacks.values()),
+    }
+
+
+def install(app):
+    """
+    Adds the profiling middleware and window endpoint to `app` if profiling
+    is configured
+    """
+    if not PROFILING:
+        return
+    app.add_middleware(ProfileRequests)
+    app.include_router(router)
@@ -0,0 +1,433 @@
+"""
+Re-runs the DeepFace + OpenFace analysis of api.py over frames captured by
+api2.py, in a pool of worker processes.
+
+Frames are read in chunks from mongo.data.images, or from a local dump of
+that collection (one extended-JSON document per line, as written by
+mongoexport). Each frame gets an "analysis" field, written back a chunk at a
+time. Every session with analyzed frames then gets a summary in
+mongo.data.results, tagged "source": "reanalysis", with the same fields /stop
+returns in the live service.
+
+With a dump, frame results are appended to <dump>.analysis.jsonl and session
+summaries written to <dump>.sessions.jsonl instead.
+
+Safe to interrupt and re-run: frames that already have an analysis are
+skipped, and sessions whose summary does not cover all of their analyzed
+frames are summarized again. Frames that failed are kept with an "error"
+and only retried with --retry-errors.
+
+    python reanalyze.py --workers 8
+    python reanalyze.py --dump images.jsonl --frames-dir ./frames
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+from bson import json_util
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from database import ensure_indexes
+from frame_store import FRAME_STORE_DIR, FrameStore
+from migrate_frames import decode_image as inline_image
+from session_store import apply_update
+
+FRAME_FIELDS = {
+    "session_id": 1,
+    "name": 1,
+    "key": 1,
+    "image": 1,
+    "blob": 1,
+    "content_type": 1,
+}
+
+# Per-process state of the pool workers, set by init_worker
+worker = {}
+
+
+def init_worker(mongo_url: str, frames_dir: str):
+    """
+    Loads the analysis pipeline once per worker process
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import api
+    import models
+
+    # Frames are independent here, so there is no tracked face to start from
+    api.DETECTOR_BACKEND = models.DETECTOR_BACKEND
+
+    database = MongoClient(mongo_url).data if mongo_url else None
+    api.start_openface_pool()
+    worker["api"] = api
+    worker["frame_store"] = FrameStore(database, root=frames_dir)
+    # Runs OpenFace while DeepFace analyzes the same frame
+    worker["facs"] = ThreadPoolExecutor(1)
+
+
+def frame_bytes(document: dict):
+    """
+    (encoded bytes, file extension) of a frame document
+    """
+    if "image" in document:
+        image_bytes, content_type = inline_image(document["image"])
+    else:
+        with worker["frame_store"].open(document["blob"]) as f:
+            image_bytes = f.read()
+        content_type = document.get("content_type", "image/jpeg")
+    return image_bytes, content_type.split("/")[-1]
+
+
+def analyze_frame(document: dict):
+    from capture import decode_image
+
+    api = worker["api"]
+
+    image_bytes, extension = frame_bytes(document)
+    im = decode_image(image_bytes)
+    if im is None:
+        return {"error": "Could not decode image"}
+
+    facs_task = worker["facs"].submit(api.process_image_facs, image_bytes, extension)
+    try:
+        emotion_result = api.process_image_deepface(im)
+    finally:
+        facs_result = facs_task.result()
+
+    maxima, analysis = api.frame_result(emotion_result, facs_result)
+    analysis["facs_emotions"] = maxima["facs_emotions"]
+    if "error" in facs_result:
+        analysis["facs_error"] = facs_result["error"]
+    return analysis
+
+
+def analyze_chunk(documents: list):
+    analyses = []
+    for document in documents:
+        try:
+            analyses.append(analyze_frame(document))
+        except Exception as e:
+            analyses.append({"error": str(e)})
+    return analyses
+
+
+def summarize_sessions(sessions: list):
+    """
+    Summary documents for [(session_id, metadata, [analysis, ...]), ...]
+    """
+    api = worker["api"]
+
+    summaries = []
+    for session_id, meta, analyses in sessions:
+        results = {}
+        for analysis in analyses:
+            if "error" in analysis:
+                continue
+            apply_update(
+                results,
+                maxima={
+                    "emo": analysis["emotion"],
+                    "action_units": analysis["facs"]["action_units"],
+                    "facs_emotions": analysis["facs_emotions"],
+                },
+                counters={"frames": 1},
+            )
+        summaries.append(
+            {
+                "session_id": session_id,
+                **meta,
+                "source": "reanalysis",
+                # Analyzed frames, failed ones included, the summary covers
+                "analyzed": len(analyses),
+                **api.summarize_session(results),
+            }
+        )
+    return summaries
+
+
+class MongoFrames:
+    def __init__(self, database, session_ids: list = None):
+        self.images = database.images
+        self.results = database.results
+        self.session_ids = session_ids
+        ensure_indexes(["images", "results"], database)
+
+    def _scope(self, query: dict):
+        if self.session_ids:
+            query["session_id"] = {"$in": self.session_ids}
+        return query
+
+    def pending(self, chunk_size: int, retry_errors: bool):
+        last_id = None
+        while True:
+            # Page by _id instead of holding one cursor open across the writes
+            todo = {"analysis": {"$exists": False}}
+            if retry_errors:
+                todo = {"$or": [todo, {"analysis.error": {"$exists": True}}]}
+            query = self._scope(todo)
+            if last_id is not None:
+                query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+            chunk = list(
+                self.images.find(query, FRAME_FIELDS).sort("_id", 1).limit(chunk_size)
+            )
+            if not chunk:
+                return
+            last_id = chunk[-1]["_id"]
+            yield chunk
+
+    def write_frames(self, documents: list, analyses: list):
+        self.images.bulk_write(
+            [
+                UpdateOne({"_id": document["_id"]}, {"$set": {"analysis": analysis}})
+                for document, analysis in zip(documents, analyses)
+            ],
+            ordered=False,
+        )
+
+    def stale_sessions(self):
+        analyzed = self.images.aggregate(
+            [
+                {"$match": self._scope({"analysis": {"$exists": True}})},
+                {"$group": {"_id": "$session_id", "analyzed": {"$sum": 1}}},
+            ]
+        )
+        summarized = {
+            summary["session_id"]: summary.get("analyzed")
+            for summary in self.results.find(
+                self._scope({"source": "reanalysis"}), {"session_id": 1, "analyzed": 1}
+            )
+        }
+        return [
+            group["_id"]
+            for group in analyzed
+            if summarized.get(group["_id"]) != group["analyzed"]
+        ]
+
+    def session_frames(self, session_id: str):
+        meta = {}
+        analyses = []
+        for document in self.images.find(
+            {"session_id": session_id, "analysis": {"$exists": True}},
+            {"name": 1, "key": 1, "analysis": 1},
+        ):
+            meta = {"name": document.get("name"), "key": document.get("key")}
+            analyses.append(document["analysis"])
+        return session_id, meta, analyses
+
+    def write_sessions(self, summaries: list):
+        self.results.bulk_write(
+            [
+                UpdateOne(
+                    {"session_id": summary["session_id"], "source": "reanalysis"},
+                    {"$set": summary},
+                    upsert=True,
+                )
+                for summary in summaries
+            ],
+            ordered=False,
+        )
+
+
+class DumpFrames:
+    def __init__(self, path: str, session_ids: list = None):
+        self.path = Path(path)
+        self.analysis_path = self.path.with_suffix(".analysis.jsonl")
+        self.sessions_path = self.path.with_suffix(".sessions.jsonl")
+        self.session_ids = set(session_ids or ())
+        self._frames = None
+
+    def _read(self, path: Path):
+        if not path.exists():
+            return
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+    def analyzed(self):
+        """
+        {frame _id: analysis line}, the last line of a frame winning
+        """
+        return {line["_id"]: line for line in self._read(self.analysis_path)}
+
+    def pending(self, chunk_size: int, retry_errors: bool):
+        done = {
+            frame_id
+            for frame_id, line in self.analyzed().items()
+            if not (retry_errors and "error" in line["analysis"])
+        }
+        chunk = []
+        for document in self._read(self.path):
+            if document["_id"] in done:
+                continue
+            if self.session_ids and document.get("session_id") not in self.session_ids:
+                continue
+            chunk.append(
+                {
+                    key: document[key]
+                    for key in ["_id", *FRAME_FIELDS]
+                    if key in document
+                }
+            )
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def write_frames(self, documents: list, analyses: list):
+        with open(self.analysis_path, "a") as f:
+            for document, analysis in zip(documents, analyses):
+                line = {
+                    "_id": document["_id"],
+                    "session_id": document.get("session_id"),
+                    "name": document.get("name"),
+                    "key": document.get("key"),
+                    "analysis": analysis,
+                }
+                f.write(json_util.dumps(line) + "\n")
+
+    def stale_sessions(self):
+        self._frames = {}
+        for line in self.analyzed().values():
+            session_id = line["session_id"]
+            if self.session_ids and session_id not in self.session_ids:
+                continue
+            self._frames.setdefault(session_id, []).append(line)
+
+        summarized = {
+            summary["session_id"]: summary.get("analyzed")
+            for summary in self._read(self.sessions_path)
+        }
+        return [
+            session_id
+            for session_id, lines in self._frames.items()
+            if summarized.get(session_id) != len(lines)
+        ]
+
+    def session_frames(self, session_id: str):
+        lines = self._frames[session_id]
+        meta = {"name": lines[-1].get("name"), "key": lines[-1].get("key")}
+        return session_id, meta, [line["analysis"] for line in lines]
+
+    def write_sessions(self, summaries: list):
+        merged = {
+            summary["session_id"]: summary for summary in self._read(self.sessions_path)
+        }
+        merged.update((summary["session_id"], summary) for summary in summaries)
+
+        # Write then rename, so an interrupted write keeps the old summaries
+        tmp = self.sessions_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for summary in merged.values():
+                f.write(json_util.dumps(summary) + "\n")
+        os.replace(tmp, self.sessions_path)
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def reanalyze(
+    source,
+    workers: int,
+    chunk_size: int,
+    retry_errors: bool = False,
+    initializer=init_worker,
+    initargs: tuple = (None, FRAME_STORE_DIR),
+):
+    """
+    Analyzes the pending frames of `source` and summarizes its stale
+    sessions. Returns (frames analyzed, sessions summarized).
+    """
+    analyzed = 0
+    start = time.perf_counter()
+
+    # Fresh interpreters: TensorFlow does not survive a fork of a parent that
+    # has threads running
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        in_flight = {}
+
+        def write_done(block: bool):
+            nonlocal analyzed
+            done, _ = wait(
+                in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                documents = in_flight.pop(future)
+                source.write_frames(documents, future.result())
+                analyzed += len(documents)
+            if done:
+                elapsed = time.perf_counter() - start
+                print(f"{analyzed} frames analyzed, {analyzed / elapsed:.1f}/s")
+
+        for chunk in source.pending(chunk_size, retry_errors):
+            # Two chunks per worker keep every worker busy without reading
+            # the whole collection ahead
+            while len(in_flight) >= 2 * workers:
+                write_done(block=True)
+            in_flight[pool.submit(analyze_chunk, chunk)] = chunk
+            write_done(block=False)
+
+        while in_flight:
+            write_done(block=True)
+
+        stale = source.stale_sessions()
+        sessions = [source.session_frames(session_id) for session_id in stale]
+        for summaries in pool.map(summarize_sessions, chunked(sessions, 50)):
+            if summaries:
+                source.write_sessions(summaries)
+
+    return analyzed, len(stale)
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mongo", default=os.getenv("MONGO"))
+    parser.add_argument("--dump", help="read frames from this file, not Mongo")
+    parser.add_argument("--frames-dir", default=FRAME_STORE_DIR)
+    parser.add_argument("--session", action="append", dest="sessions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--retry-errors", action="store_true")
+    args = parser.parse_args()
+
+    # One OpenFace worker and a few math threads per process, so the pool
+    # scales with cores rather than oversubscribing them
+    os.environ.setdefault("OPENFACE_POOL_SIZE", "1")
+    for name in ["OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]:
+        os.environ.setdefault(name, str(args.threads_per_worker))
+
+    if args.dump:
+        source = DumpFrames(args.dump, args.sessions)
+        mongo_url = None
+    else:
+        source = MongoFrames(MongoClient(args.mongo).data, args.sessions)
+        mongo_url = args.mongo
+
+    analyzed, summarized = reanalyze(
+        source,
+        args.workers,
+        args.chunk_size,
+        args.retry_errors,
+        initargs=(mongo_url, args.frames_dir),
+    )
+    print(f"Done, {analyzed} frames analyzed, {summarized} sessions summarized")
+
+
+if __name__ == "__main__":
+    main()
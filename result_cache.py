@@ -0,0 +1,219 @@
+"""
+Cache of analysis results keyed by frame content.
+
+Retried uploads and frames of a still subject are often identical, so the
+(emotion, FACS) result of a frame is kept under a hash of its decoded pixels.
+With RESULT_CACHE_PERCEPTUAL the result is also stored under a 64-bit
+difference hash (dHash) of the frame within its session, so near-identical
+frames of the same recording (sensor noise, re-encoding) share a result too.
+A dHash is coarse, so a perceptual hit also needs every pixel of a small
+thumbnail to be within RESULT_CACHE_MAX_DIFFERENCE (0-255 scale) of the cached
+frame's; content hashes are the only keys shared across sessions.
+
+RESULT_CACHE selects the backend:
+
+    off     no caching (default)
+    memory  a per-worker LRU of RESULT_CACHE_SIZE entries
+    redis   shared by every worker (RESULT_CACHE_REDIS_URL), entries expire
+            after RESULT_CACHE_TTL seconds and eviction is left to Redis
+
+Hit, miss and eviction counts are kept per worker.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import motion
+
+RESULT_CACHE = os.getenv("RESULT_CACHE", "off")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_PERCEPTUAL = os.getenv("RESULT_CACHE_PERCEPTUAL", "0") == "1"
+RESULT_CACHE_MAX_DIFFERENCE = float(os.getenv("RESULT_CACHE_MAX_DIFFERENCE", "6"))
+RESULT_CACHE_REDIS_URL = os.getenv(
+    "RESULT_CACHE_REDIS_URL", os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+)
+
+
+def content_key(im: np.ndarray):
+    """
+    Hash of the decoded pixels, so identical frames match however they were
+    encoded in transit
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(im).data, digest_size=16)
+    digest.update(str(im.shape).encode())
+    return "c:" + digest.hexdigest()
+
+
+def perceptual_key(im: np.ndarray, session_id: str):
+    """
+    dHash: the sign of horizontal gradients on a 9x8 grayscale thumbnail,
+    scoped to the session
+    """
+    gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return f"p:{session_id}:{bits.tobytes().hex()}"
+
+
+def max_difference(a: str, b: str):
+    """
+    Largest pixel difference between two thumbnails stored as hex
+    """
+    a = np.frombuffer(bytes.fromhex(a), np.uint8).astype(np.int16)
+    b = np.frombuffer(bytes.fromhex(b), np.uint8).astype(np.int16)
+    return int(np.abs(a - b).max()) if a.shape == b.shape else 255
+
+
+class ResultCache:
+    def __init__(
+        self,
+        perceptual: bool = RESULT_CACHE_PERCEPTUAL,
+        max_difference: float = RESULT_CACHE_MAX_DIFFERENCE,
+    ):
+        self.perceptual = perceptual
+        self.max_difference = max_difference
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def keys(self, im: np.ndarray, session_id: str = None):
+        """
+        Lookup keys for a frame, exact match first, as (key, thumbnail) pairs;
+        the thumbnail a perceptual hit is checked against, None for exact keys
+        """
+        keys = [(content_key(im), None)]
+        if self.perceptual and session_id is not None:
+            thumb = np.round(motion.thumbnail(im)).astype(np.uint8)
+            keys.append((perceptual_key(im, session_id), thumb.tobytes().hex()))
+        return keys
+
+    def get(self, keys: list):
+        for key, thumb in keys:
+            value = self._get(key)
+            if value is None:
+                continue
+            if thumb is not None:
+                cached_thumb, value = value
+                if max_difference(thumb, cached_thumb) > self.max_difference:
+                    continue
+            with self.lock:
+                self.hits += 1
+            return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def lookup(self, im: np.ndarray, session_id: str = None):
+        """
+        Returns the frame's keys and its cached result, or None
+        """
+        keys = self.keys(im, session_id)
+        return keys, self.get(keys)
+
+    def put(self, keys: list, value):
+        for key, thumb in keys:
+            self._put(key, value if thumb is None else [thumb, value])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get(self, key: str):
+        raise NotImplementedError
+
+    def _put(self, key: str, value):
+        raise NotImplementedError
+
+
+class MemoryResultCache(ResultCache):
+    """
+    LRU of at most `size` entries, each valid for `ttl` seconds
+    """
+
+    def __init__(
+        self,
+        size: int = RESULT_CACHE_SIZE,
+        ttl: float = RESULT_CACHE_TTL,
+        perceptual: bool = RESULT_CACHE_PERCEPTUAL,
+        max_difference: float = RESULT_CACHE_MAX_DIFFERENCE,
+    ):
+        super().__init__(perceptual, max_difference)
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def _get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.evictions += 1
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _put(self, key: str, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {**super().stats(), "entries": len(self.entries)}
+
+
+class RedisResultCache(ResultCache):
+    """
+    Results are stored as JSON with an expiry; Redis' own maxmemory policy
+    does any eviction, which is not counted here
+    """
+
+    def __init__(
+        self,
+        client=None,
+        ttl: float = RESULT_CACHE_TTL,
+        perceptual: bool = RESULT_CACHE_PERCEPTUAL,
+        max_difference: float = RESULT_CACHE_MAX_DIFFERENCE,
+    ):
+        super().__init__(perceptual, max_difference)
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(RESULT_CACHE_REDIS_URL)
+        self.client = client
+        self.ttl = int(ttl)
+
+    def _get(self, key: str):
+        value = self.client.get(f"result:{key}")
+        return None if value is None else json.loads(value)
+
+    def _put(self, key: str, value):
+        # DeepFace scores are NumPy floats
+        self.client.set(f"result:{key}", json.dumps(value, default=float), ex=self.ttl)
+
+
+def create_result_cache():
+    if RESULT_CACHE == "memory":
+        return MemoryResultCache()
+    if RESULT_CACHE == "redis":
+        return RedisResultCache()
+    return None
@@ -0,0 +1,525 @@
+"""
+Session backends shared by the API routers.
+
+A session is a flat set of metadata values given at start, integer counters,
+and groups of running maxima (e.g. the highest score seen per emotion), plus
+opaque byte records appended per update (e.g. a timeline row per frame).
+Every backend applies `update` atomically, so several gunicorn workers can
+feed the same session.
+
+SESSION_BACKEND selects the backend:
+
+    memory  per-process dict, the default and the old behaviour
+    sqlite  one SQLite file shared by every worker on the host
+            (SESSION_SQLITE_PATH)
+    redis   any Redis-compatible server (SESSION_REDIS_URL)
+
+Sessions that are never stopped expire after SESSION_TTL seconds without an
+update.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = os.getenv(
+    "SESSION_SQLITE_PATH",
+    "/dev/shm/sessions.db" if Path("/dev/shm").is_dir() else "./sessions.db",
+)
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(2 * 60 * 60)))
+
+# Expired sessions are swept at most this often
+SWEEP_INTERVAL = 60
+
+
+class SessionStore:
+    def start(self, session_id: str, meta: dict = None):
+        raise NotImplementedError
+
+    def exists(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def update(
+        self,
+        session_id: str,
+        maxima: dict = None,
+        counters: dict = None,
+        record: bytes = None,
+    ):
+        """
+        Raises each value in `maxima` ({group: {key: value}}) to at least the
+        given value, adds `counters` ({name: increment}) and appends `record`
+        to the session's records. Returns the session after the update,
+        without its records, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    def pop(self, session_id: str):
+        """
+        Removes the session and returns it, or None if it does not exist. Its
+        records, if any, are concatenated under "records" in the order they
+        were appended.
+        """
+        raise NotImplementedError
+
+    def evict_expired(self):
+        """
+        Drops sessions that have not been updated for SESSION_TTL seconds
+        """
+
+    def count(self) -> int:
+        """
+        Number of sessions in this store's namespace
+        """
+        raise NotImplementedError
+
+
+def apply_update(session: dict, maxima: dict = None, counters: dict = None):
+    for group, values in (maxima or {}).items():
+        current = session.setdefault(group, {})
+        for key, value in values.items():
+            current[key] = max(current.get(key, value), value)
+
+    for name, increment in (counters or {}).items():
+        session[name] = session.get(name, 0) + increment
+
+
+class SessionState:
+    """
+    Compact in-memory session. Maxima of the groups in the store's layout are
+    kept in one float array (NaN until a value is seen), anything else falls
+    back to dicts.
+    """
+
+    __slots__ = ("meta", "counters", "values", "extra", "records", "last_seen")
+
+    def __init__(self, meta: dict, size: int):
+        self.meta = meta
+        self.counters = {}
+        self.values = np.full(size, np.nan) if size else None
+        self.extra = None
+        self.records = None
+        self.last_seen = time.monotonic()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    `layout` maps each maxima group to its fixed list of keys, e.g. the
+    emotion labels, so every session stores them as one array
+    """
+
+    def __init__(self, layout: dict = None, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self.groups = {}
+        size = 0
+        for group, keys in (layout or {}).items():
+            self.groups[group] = (
+                keys,
+                {key: size + i for i, key in enumerate(keys)},
+                slice(size, size + len(keys)),
+            )
+            size += len(keys)
+        self.size = size
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    def _to_dict(self, state: SessionState):
+        session = dict(state.meta)
+        session.update(state.counters)
+        for group, (keys, _, span) in self.groups.items():
+            session[group] = {
+                key: float(value)
+                for key, value in zip(keys, state.values[span])
+                if not np.isnan(value)
+            }
+        for group, values in (state.extra or {}).items():
+            session.setdefault(group, {}).update(values)
+        return session
+
+    def start(self, session_id, meta=None):
+        if time.monotonic() - self.last_sweep > SWEEP_INTERVAL:
+            self.evict_expired()
+
+        with self.lock:
+            self.sessions[session_id] = SessionState(dict(meta or {}), self.size)
+
+    def exists(self, session_id):
+        return session_id in self.sessions
+
+    def count(self):
+        return len(self.sessions)
+
+    def update(self, session_id, maxima=None, counters=None, record=None):
+        with self.lock:
+            state = self.sessions.get(session_id)
+            if state is None:
+                return None
+
+            for group, values in (maxima or {}).items():
+                layout = self.groups.get(group)
+                for key, value in values.items():
+                    index = layout[1].get(key) if layout else None
+                    if index is None:
+                        if state.extra is None:
+                            state.extra = {}
+                        extra = state.extra.setdefault(group, {})
+                        extra[key] = max(extra.get(key, value), value)
+                    else:
+                        state.values[index] = np.fmax(state.values[index], value)
+
+            for name, increment in (counters or {}).items():
+                state.counters[name] = state.counters.get(name, 0) + increment
+
+            if record:
+                if state.records is None:
+                    state.records = bytearray()
+                state.records += record
+
+            state.last_seen = time.monotonic()
+            return self._to_dict(state)
+
+    def pop(self, session_id):
+        with self.lock:
+            state = self.sessions.pop(session_id, None)
+        if state is None:
+            return None
+
+        session = self._to_dict(state)
+        if state.records:
+            session["records"] = bytes(state.records)
+        return session
+
+    def evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        with self.lock:
+            self.last_sweep = time.monotonic()
+            for session_id in [
+                session_id
+                for session_id, state in self.sessions.items()
+                if state.last_seen < cutoff
+            ]:
+                del self.sessions[session_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str, namespace: str = "", ttl: float = SESSION_TTL):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = threading.local()
+        self.last_sweep = time.time()
+
+        self._connect().executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                meta TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS session_values (
+                session_id TEXT NOT NULL,
+                grp TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (session_id, grp, key)
+            );
+            CREATE TABLE IF NOT EXISTS session_records (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                record BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS session_records_session
+                ON session_records (session_id, seq);
+            """)
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode, transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    def _id(self, session_id):
+        return f"{self.namespace}:{session_id}"
+
+    def _load(self, conn, session_id):
+        row = conn.execute(
+            "SELECT meta FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        session = json.loads(row[0])
+        for grp, key, value in conn.execute(
+            "SELECT grp, key, value FROM session_values WHERE session_id = ?",
+            (session_id,),
+        ):
+            if grp == "":
+                session[key] = int(value)
+            else:
+                session.setdefault(grp, {})[key] = value
+        return session
+
+    def start(self, session_id, meta=None):
+        if time.time() - self.last_sweep > SWEEP_INTERVAL:
+            self.evict_expired()
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, meta, updated_at) VALUES (?, ?, ?)",
+            (self._id(session_id), json.dumps(meta or {}), time.time()),
+        )
+
+    def exists(self, session_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT 1 FROM sessions WHERE id = ?", (self._id(session_id),)
+        ).fetchone()
+        return row is not None
+
+    def count(self):
+        conn = self._connect()
+        return conn.execute(
+            "SELECT count(*) FROM sessions WHERE id LIKE ? AND updated_at >= ?",
+            (self._id("%"), time.time() - self.ttl),
+        ).fetchone()[0]
+
+    def update(self, session_id, maxima=None, counters=None, record=None):
+        session_id = self._id(session_id)
+        conn = self._connect()
+        # Take the write lock up front so the read below sees committed data
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE id = ?",
+                (time.time(), session_id),
+            ).rowcount:
+                conn.execute("ROLLBACK")
+                return None
+
+            conn.executemany(
+                """
+                INSERT INTO session_values (session_id, grp, key, value)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (session_id, grp, key)
+                DO UPDATE SET value = max(value, excluded.value)
+                """,
+                [
+                    (session_id, group, key, float(value))
+                    for group, values in (maxima or {}).items()
+                    for key, value in values.items()
+                ],
+            )
+            # Counters live in the unnamed group
+            conn.executemany(
+                """
+                INSERT INTO session_values (session_id, grp, key, value)
+                VALUES (?, '', ?, ?)
+                ON CONFLICT (session_id, grp, key)
+                DO UPDATE SET value = value + excluded.value
+                """,
+                [(session_id, name, inc) for name, inc in (counters or {}).items()],
+            )
+            if record:
+                conn.execute(
+                    "INSERT INTO session_records (session_id, record) VALUES (?, ?)",
+                    (session_id, record),
+                )
+            session = self._load(conn, session_id)
+            conn.execute("COMMIT")
+            return session
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pop(self, session_id):
+        session_id = self._id(session_id)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            session = self._load(conn, session_id)
+            records = b"".join(
+                record
+                for (record,) in conn.execute(
+                    "SELECT record FROM session_records WHERE session_id = ? "
+                    "ORDER BY seq",
+                    (session_id,),
+                )
+            )
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            conn.execute(
+                "DELETE FROM session_values WHERE session_id = ?", (session_id,)
+            )
+            conn.execute(
+                "DELETE FROM session_records WHERE session_id = ?", (session_id,)
+            )
+            conn.execute("COMMIT")
+            if session is not None and records:
+                session["records"] = records
+            return session
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def evict_expired(self):
+        self.last_sweep = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                DELETE FROM session_values WHERE session_id IN (
+                    SELECT id FROM sessions WHERE updated_at < ?
+                )
+                """,
+                (self.last_sweep - self.ttl,),
+            )
+            conn.execute(
+                """
+                DELETE FROM session_records WHERE session_id IN (
+                    SELECT id FROM sessions WHERE updated_at < ?
+                )
+                """,
+                (self.last_sweep - self.ttl,),
+            )
+            conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?",
+                (self.last_sweep - self.ttl,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Keeps each session in one hash. Fields are "meta:<name>" (JSON),
+    "count:<name>" and "max:<group>:<key>"; records are appended to a string
+    next to it. Updates are optimistic WATCH/MULTI transactions, so no
+    server-side scripting is needed. Expiry is left to Redis.
+    """
+
+    def __init__(self, client=None, namespace: str = "", ttl: float = SESSION_TTL):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(SESSION_REDIS_URL)
+        self.client = client
+        self.namespace = namespace
+        self.ttl = int(ttl)
+
+    def _key(self, session_id):
+        return f"session:{self.namespace}:{session_id}"
+
+    def _records_key(self, session_id):
+        return f"{self._key(session_id)}:records"
+
+    @staticmethod
+    def _decode(fields: dict):
+        session = {}
+        for field, value in fields.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            kind, _, name = field.partition(":")
+            if kind == "meta":
+                session[name] = json.loads(value)
+            elif kind == "count":
+                session[name] = int(value)
+            elif kind == "max":
+                group, _, key = name.partition(":")
+                session.setdefault(group, {})[key] = float(value)
+        return session
+
+    def start(self, session_id, meta=None):
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.delete(key, self._records_key(session_id))
+        # A placeholder field so sessions without metadata still exist
+        pipe.hset(
+            key,
+            mapping={
+                "meta:": "null",
+                **{f"meta:{k}": json.dumps(v) for k, v in (meta or {}).items()},
+            },
+        )
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def exists(self, session_id):
+        return bool(self.client.exists(self._key(session_id)))
+
+    def count(self):
+        return sum(1 for _ in self.client.scan_iter(self._key("*"), count=1000))
+
+    def update(self, session_id, maxima=None, counters=None, record=None):
+        import redis
+
+        key = self._key(session_id)
+        records_key = self._records_key(session_id)
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    fields = pipe.hgetall(key)
+                    if not fields:
+                        return None
+
+                    session = self._decode(fields)
+                    apply_update(session, maxima, counters)
+
+                    mapping = {
+                        f"max:{group}:{k}": session[group][k]
+                        for group, values in (maxima or {}).items()
+                        for k in values
+                    }
+                    mapping.update(
+                        {f"count:{name}": session[name] for name in counters or {}}
+                    )
+
+                    pipe.multi()
+                    if mapping:
+                        pipe.hset(key, mapping=mapping)
+                    pipe.expire(key, self.ttl)
+                    if record:
+                        pipe.append(records_key, record)
+                        pipe.expire(records_key, self.ttl)
+                    pipe.execute()
+                    session.pop("", None)
+                    return session
+                except redis.WatchError:
+                    # Another worker updated the session first, retry
+                    continue
+
+    def pop(self, session_id):
+        key = self._key(session_id)
+        records_key = self._records_key(session_id)
+        pipe = self.client.pipeline()
+        pipe.hgetall(key)
+        pipe.get(records_key)
+        pipe.delete(key, records_key)
+        fields, records, _ = pipe.execute()
+        if not fields:
+            return None
+
+        session = self._decode(fields)
+        session.pop("", None)
+        if records:
+            session["records"] = records
+        return session
+
+
+def create_session_store(namespace: str, layout: dict = None):
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(SESSION_SQLITE_PATH, namespace)
+    if SESSION_BACKEND == "redis":
+        return RedisSessionStore(namespace=namespace)
+    return MemorySessionStore(layout)
@@ -0,0 +1,310 @@
+"""
+Per-session emotion time series.
+
+Every analyzed frame becomes one fixed-size float32 row: the DeepFace emotion
+scores, the AU intensities and the FACS emotion scores, NaN where a value is
+missing. Rows fill buckets of TIMELINE_BUCKET_FRAMES; running statistics per
+channel (count, mean, exponential moving average with TIMELINE_EMA_ALPHA and
+a TIMELINE_BINS histogram) are updated in place, so no frame has to be kept
+around to compute them.
+
+When the session stops, each bucket is stored as one document in
+mongo.data.results ("type": "timeline") holding its frame offsets, values and
+per-channel means. Timelines are downsampled from the bucket means when few
+points are asked for, and from the values otherwise.
+
+Each frame's row is packed into a fixed-size record with its timestamp and
+kept with the session in the session store, so frames analyzed by any worker
+sharing the store end up in the timeline. The timeline is built from the
+records when the session stops.
+"""
+
+import os
+import time
+
+import numpy as np
+
+TIMELINE = os.getenv("TIMELINE", "true").lower() == "true"
+TIMELINE_BUCKET_FRAMES = int(os.getenv("TIMELINE_BUCKET_FRAMES", "120"))
+TIMELINE_EMA_ALPHA = float(os.getenv("TIMELINE_EMA_ALPHA", "0.1"))
+TIMELINE_BINS = int(os.getenv("TIMELINE_BINS", "10"))
+
+# Upper end of the histogram range per group: DeepFace scores are
+# percentages, AU intensities and FACS scores are on OpenFace's 0-5 scale
+GROUP_RANGES = {"emotion": 100.0, "action_units": 5.0, "facs": 5.0}
+
+
+def to_list(values: np.ndarray, digits: int = 4):
+    """
+    Plain floats, or a list of them, for BSON/JSON with None for NaN
+    """
+    values = np.asarray(values, np.float64)
+    rounded = np.round(values, digits).tolist()
+    if values.ndim == 0:
+        return None if np.isnan(values) else rounded
+    return [None if v != v else v for v in rounded]
+
+
+class Layout:
+    """
+    Maps {group: {name: value}} onto fixed channel positions and back
+    """
+
+    def __init__(self, groups: dict):
+        self.groups = {group: list(names) for group, names in groups.items()}
+        self.slices = {}
+        start = 0
+        for group, names in self.groups.items():
+            self.slices[group] = slice(start, start + len(names))
+            start += len(names)
+        self.size = start
+        self.ranges = np.concatenate(
+            [
+                np.full(len(names), GROUP_RANGES.get(group, 1.0), np.float32)
+                for group, names in self.groups.items()
+            ]
+        )
+
+    def row(self, values: dict):
+        row = np.full(self.size, np.nan, np.float32)
+        for group, names in self.groups.items():
+            group_values = values.get(group) or {}
+            offset = self.slices[group].start
+            for i, name in enumerate(names):
+                if name in group_values:
+                    row[offset + i] = group_values[name]
+        return row
+
+    def unnest(self, nested: dict):
+        """
+        Array with channels on the last axis from {group: {name: ...}}, None
+        read as NaN
+        """
+        columns = [
+            nested[group][name]
+            for group, names in self.groups.items()
+            for name in names
+        ]
+        return np.array(columns, dtype=np.float64).T
+
+    def nest(self, array: np.ndarray, convert=to_list):
+        """
+        {group: {name: ...}} from an array with channels on the last axis
+        """
+        return {
+            group: dict(
+                zip(
+                    names,
+                    map(convert, np.moveaxis(array[..., self.slices[group]], -1, 0)),
+                )
+            )
+            for group, names in self.groups.items()
+        }
+
+
+class SessionTimeline:
+    def __init__(
+        self, layout: Layout, bucket_frames: int, alpha: float, bins: int, started
+    ):
+        self.layout = layout
+        self.bucket_frames = bucket_frames
+        self.alpha = alpha
+        self.bins = bins
+        self.started = started
+
+        # Finished buckets as (offsets, values), then the one being filled
+        self.buckets = []
+        self.offsets = np.empty(bucket_frames, np.float32)
+        self.values = np.empty((bucket_frames, layout.size), np.float32)
+        self.filled = 0
+
+        self.count = np.zeros(layout.size, np.int64)
+        self.mean = np.zeros(layout.size, np.float64)
+        self.ema = np.full(layout.size, np.nan, np.float64)
+        self.histogram = np.zeros((layout.size, bins), np.int64)
+
+    def append(self, offset: float, row: np.ndarray):
+        if self.filled == self.bucket_frames:
+            self.buckets.append((self.offsets, self.values))
+            self.offsets = np.empty(self.bucket_frames, np.float32)
+            self.values = np.empty((self.bucket_frames, self.layout.size), np.float32)
+            self.filled = 0
+
+        self.offsets[self.filled] = offset
+        self.values[self.filled] = row
+        self.filled += 1
+
+        seen = ~np.isnan(row)
+        self.count += seen
+        delta = np.where(seen, row - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.ema = np.where(
+            seen,
+            np.where(np.isnan(self.ema), row, self.ema + self.alpha * (row - self.ema)),
+            self.ema,
+        )
+        channels = np.flatnonzero(seen)
+        bins = np.clip(
+            (row[channels] / self.layout.ranges[channels] * self.bins).astype(int),
+            0,
+            self.bins - 1,
+        )
+        self.histogram[channels, bins] += 1
+
+    def all_buckets(self):
+        yield from self.buckets
+        if self.filled:
+            yield self.offsets[: self.filled], self.values[: self.filled]
+
+    def documents(self, session_id: str):
+        """
+        One document per bucket
+        """
+        documents = []
+        for i, (offsets, values) in enumerate(self.all_buckets()):
+            documents.append(
+                {
+                    "session_id": session_id,
+                    "type": "timeline",
+                    "bucket": i,
+                    "started": self.started,
+                    "start": round(float(offsets[0]), 3),
+                    "end": round(float(offsets[-1]), 3),
+                    "frames": len(offsets),
+                    "t": to_list(offsets, 3),
+                    "values": self.layout.nest(values),
+                    "mean": self.layout.nest(column_means(values)),
+                }
+            )
+        return documents
+
+    def summary(self):
+        """
+        Whole-session statistics, stored with the session result
+        """
+        mean = np.where(self.count > 0, self.mean, np.nan)
+        return {
+            "frames": sum(len(offsets) for offsets, _ in self.all_buckets()),
+            "buckets": len(self.buckets) + (1 if self.filled else 0),
+            "mean": self.layout.nest(mean),
+            "ema": self.layout.nest(self.ema),
+            "histogram": {
+                "bins": self.bins,
+                "ranges": {
+                    group: GROUP_RANGES.get(group, 1.0) for group in self.layout.groups
+                },
+                "counts": self.layout.nest(
+                    self.histogram.T, lambda counts: counts.tolist()
+                ),
+            },
+        }
+
+
+def column_means(values: np.ndarray):
+    """
+    Per-channel mean ignoring NaN, NaN for channels with no values
+    """
+    seen = ~np.isnan(values)
+    counts = seen.sum(axis=0)
+    sums = np.where(seen, values, 0.0).sum(axis=0)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+class Timelines:
+    def __init__(
+        self,
+        layout: dict,
+        bucket_frames: int = TIMELINE_BUCKET_FRAMES,
+        alpha: float = TIMELINE_EMA_ALPHA,
+        bins: int = TIMELINE_BINS,
+    ):
+        self.layout = Layout(layout)
+        self.bucket_frames = bucket_frames
+        self.alpha = alpha
+        self.bins = bins
+        # Wall clock time, then the row
+        self.dtype = np.dtype([("time", "<f8"), ("row", "<f4", (self.layout.size,))])
+
+    def record(self, values: dict):
+        """
+        The record of a frame's {group: {name: value}} analyzed now
+        """
+        record = np.empty((), self.dtype)
+        record["time"] = time.time()
+        record["row"] = self.layout.row(values)
+        return record.tobytes()
+
+    def build(self, records: bytes):
+        """
+        The timeline of a session's concatenated records, or None if there
+        are none
+        """
+        if not records:
+            return None
+
+        frames = np.frombuffer(records, self.dtype)
+        # Workers append their records in the order they finish analyzing
+        frames = frames[np.argsort(frames["time"], kind="stable")]
+        started = float(frames["time"][0])
+        timeline = SessionTimeline(
+            self.layout, self.bucket_frames, self.alpha, self.bins, started
+        )
+        for offset, row in zip(frames["time"] - started, frames["row"]):
+            timeline.append(offset, row)
+        return timeline
+
+
+def downsample(collection, session_id: str, points: int, groups: list = None):
+    """
+    At most `points` time points of a stored timeline, each the mean of the
+    frames it covers, or None if the session has no stored timeline
+    """
+    query = {"session_id": session_id, "type": "timeline"}
+    buckets = collection.count_documents(query)
+    if not buckets:
+        return None
+
+    # With no more points than buckets only the bucket means are read
+    per_bucket = points <= buckets
+    field = "mean" if per_bucket else "values"
+    projection = {"start": 1, "end": 1, "frames": 1} if per_bucket else {"t": 1}
+    if groups:
+        projection.update({f"{field}.{group}": 1 for group in groups})
+    else:
+        projection[field] = 1
+
+    layout = None
+    times, rows, weights = [], [], []
+    for document in collection.find(query, projection).sort("bucket", 1):
+        if layout is None:
+            layout = Layout(
+                {group: document[field][group] for group in groups or document[field]}
+            )
+        if per_bucket:
+            times.append([(document["start"] + document["end"]) / 2])
+            rows.append(layout.unnest(document["mean"])[np.newaxis])
+            weights.append([document["frames"]])
+        else:
+            times.append(document["t"])
+            rows.append(layout.unnest(document["values"]))
+            weights.append(np.ones(len(document["t"])))
+
+    times = np.concatenate(times)
+    rows = np.concatenate(rows)
+    weights = np.concatenate(weights)
+
+    # Consecutive entries split into `points` groups, averaged by frames
+    starts = np.linspace(0, len(times), min(points, len(times)) + 1).astype(int)[:-1]
+    w = weights[:, np.newaxis] * ~np.isnan(rows)
+    totals = np.add.reduceat(np.nan_to_num(rows) * w, starts, axis=0)
+    counts = np.add.reduceat(w, starts, axis=0)
+    values = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+    t = np.add.reduceat(times * weights, starts) / np.add.reduceat(weights, starts)
+
+    return {
+        "session_id": session_id,
+        "frames": int(weights.sum()),
+        "points": len(t),
+        "t": to_list(t, 3),
+        "values": layout.nest(values),
+    }
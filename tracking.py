@@ -0,0 +1,205 @@
+"""
+Per-session face tracking.
+
+A seated user's face box barely moves between frames, so full face detection
+only runs on a session's first frame, every FACE_DETECT_EVERY frames after
+that, and whenever tracking loses the face. In between, the face is found by
+matching the grayscale face from the last detection around its previous box.
+The resulting crop, rotated so the eyes are level, is what both the emotion
+model and OpenFace get.
+
+FACE_TRACKING=1 turns the tracker on.
+"""
+
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import models
+from metrics import stage, stage_seconds
+from session_store import SESSION_TTL, SWEEP_INTERVAL
+
+FACE_TRACKING = os.getenv("FACE_TRACKING", "0") == "1"
+FACE_DETECT_EVERY = int(os.getenv("FACE_DETECT_EVERY", "10"))
+FACE_TRACK_MIN_SCORE = float(os.getenv("FACE_TRACK_MIN_SCORE", "0.6"))
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", "0.2"))
+
+# Template matching runs at this fraction of the frame resolution
+TRACK_SCALE = 0.5
+
+
+class Face:
+    __slots__ = ("box", "angle", "template", "frames", "last_seen")
+
+    def __init__(self, box: tuple, angle: float, template: np.ndarray):
+        self.box = box
+        self.angle = angle
+        self.template = template
+        self.frames = 0
+        self.last_seen = time.monotonic()
+
+
+def eye_angle(facial_area: dict):
+    """
+    Tilt of the line between the eyes in degrees, 0 if the detector does not
+    report eyes
+    """
+    eyes = [facial_area.get("left_eye"), facial_area.get("right_eye")]
+    if None in eyes:
+        return 0.0
+    (x1, y1), (x2, y2) = sorted(eyes)
+    return math.degrees(math.atan2(y2 - y1, x2 - x1))
+
+
+def detect_face(im: np.ndarray):
+    """
+    Runs the configured DeepFace detector on the full frame and returns the
+    largest face as ((x, y, w, h), eye angle), or None
+    """
+    try:
+        faces = models.deepface().extract_faces(
+            img_path=im, detector_backend=models.DETECTOR_BACKEND, align=False
+        )
+    except ValueError:
+        return None
+
+    area = max(faces, key=lambda f: f["facial_area"]["w"] * f["facial_area"]["h"])
+    area = area["facial_area"]
+    return (area["x"], area["y"], area["w"], area["h"]), eye_angle(area)
+
+
+def small_gray(im: np.ndarray):
+    gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+    return cv2.resize(
+        gray, None, fx=TRACK_SCALE, fy=TRACK_SCALE, interpolation=cv2.INTER_AREA
+    )
+
+
+def clip_box(box: tuple, shape: tuple, margin: float):
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(shape[1], x + w + dx), min(shape[0], y + h + dy)
+    return x0, y0, x1, y1
+
+
+class FaceTracker:
+    def __init__(
+        self,
+        detect_every: int = FACE_DETECT_EVERY,
+        min_score: float = FACE_TRACK_MIN_SCORE,
+        margin: float = FACE_CROP_MARGIN,
+        ttl: float = SESSION_TTL,
+    ):
+        self.detect_every = detect_every
+        self.min_score = min_score
+        self.margin = margin
+        self.ttl = ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+        self.detections = 0
+        self.tracked = 0
+
+    def locate(self, session_id: str, im: np.ndarray):
+        """
+        Returns the session's face in `im` as an aligned BGR crop, or None if
+        there is no face
+        """
+        with self.lock:
+            face = self.sessions.get(session_id)
+
+        box = None
+        if face is not None and face.frames < self.detect_every:
+            with stage("track"):
+                box = self._track(face, im)
+
+        if box is None:
+            with stage("detect"):
+                face = self._detect(im)
+            if face is None:
+                return None
+            with self.lock:
+                self.sessions[session_id] = face
+                self.detections += 1
+        else:
+            face.box = box
+            face.frames += 1
+            face.last_seen = time.monotonic()
+            with self.lock:
+                self.tracked += 1
+
+        if time.monotonic() - self.last_sweep > SWEEP_INTERVAL:
+            self.evict_expired()
+
+        return self.crop(im, face)
+
+    def crop(self, im: np.ndarray, face: Face):
+        x0, y0, x1, y1 = clip_box(face.box, im.shape, self.margin)
+        crop = im[y0:y1, x0:x1]
+        if abs(face.angle) < 1:
+            return np.ascontiguousarray(crop)
+
+        center = ((x1 - x0) / 2, (y1 - y0) / 2)
+        rotation = cv2.getRotationMatrix2D(center, face.angle, 1.0)
+        return cv2.warpAffine(
+            crop, rotation, (x1 - x0, y1 - y0), borderMode=cv2.BORDER_REPLICATE
+        )
+
+    def pop(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            self.last_sweep = now
+            expired = [
+                session_id
+                for session_id, face in self.sessions.items()
+                if now - face.last_seen > self.ttl
+            ]
+            for session_id in expired:
+                del self.sessions[session_id]
+
+    def stats(self):
+        timings = stage_seconds.summary("stage")
+        saved = 0.0
+        if "detect" in timings and "track" in timings:
+            per_frame = timings["detect"]["mean_ms"] - timings["track"]["mean_ms"]
+            saved = self.tracked * per_frame
+        return {
+            "sessions": len(self.sessions),
+            "detections": self.detections,
+            "tracked": self.tracked,
+            "detection_ms_saved": saved,
+        }
+
+    def _detect(self, im: np.ndarray):
+        found = detect_face(im)
+        if found is None:
+            return None
+        (x, y, w, h), angle = found
+        return Face((x, y, w, h), angle, small_gray(im[y : y + h, x : x + w]))
+
+    def _track(self, face: Face, im: np.ndarray):
+        """
+        Template-matches the detected face around its last box, returning the
+        new box or None when the match is too weak
+        """
+        x, y, w, h = face.box
+        x0, y0, x1, y1 = clip_box(face.box, im.shape, 0.5)
+        window = small_gray(im[y0:y1, x0:x1])
+        th, tw = face.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            return None
+
+        scores = cv2.matchTemplate(window, face.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+        if score < self.min_score:
+            return None
+        return x0 + round(mx / TRACK_SCALE), y0 + round(my / TRACK_SCALE), w, h
@@ -0,0 +1,203 @@
+"""
+Write-behind buffer that batches MongoDB inserts on a dedicated thread, so
+request handlers never wait on a database round trip
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from logs import log_event
+
+WRITE_BEHIND_MAX_DOCS = int(os.getenv("WRITE_BEHIND_MAX_DOCS", "50"))
+WRITE_BEHIND_MAX_WAIT_MS = float(os.getenv("WRITE_BEHIND_MAX_WAIT_MS", "500"))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "3"))
+WRITE_BEHIND_BACKOFF_MS = float(os.getenv("WRITE_BEHIND_BACKOFF_MS", "100"))
+# Documents kept for a later attempt once their retries failed, at most
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+# MongoDB duplicate key error: the document was stored by an earlier attempt
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    """
+    Documents are grouped per session and written with insert_many once a
+    session has `max_docs` pending documents or the oldest one has waited
+    `max_wait` seconds. flush(session_id) writes one session immediately and
+    waits until it is stored.
+
+    A failed insert is retried `retries` times with exponential backoff from
+    `backoff` seconds. Documents still not stored go back to the front of
+    their session's queue for a later attempt, as long as fewer than
+    `max_pending` documents are waiting; beyond that they are dropped and
+    counted in `dropped`.
+    """
+
+    def __init__(
+        self,
+        collection,
+        max_docs: int = 50,
+        max_wait: float = 0.5,
+        retries: int = 3,
+        backoff: float = 0.1,
+        max_pending: int = 10000,
+    ):
+        self.collection = collection
+        self.max_docs = max_docs
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff = backoff
+        self.max_pending = max_pending
+        self.pending = defaultdict(list)
+        self.oldest = {}
+        self.inserted = 0
+        self.errors = 0
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.closed = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True
+            )
+            self.thread.start()
+
+    def add(self, key: str, document: dict):
+        self.start()
+        with self.condition:
+            self.pending[key].append(document)
+            self.oldest.setdefault(key, time.monotonic())
+            if len(self.pending[key]) >= self.max_docs:
+                self.condition.notify()
+
+    def flush(self, key: str = None):
+        """
+        Writes the pending documents of one key, or of every key, right away.
+        Returns how many of them could not be stored; those stay queued.
+        """
+        # Holding the write lock means no batch taken earlier is still in flight
+        with self.write_lock:
+            with self.condition:
+                keys = [key] if key is not None else list(self.pending)
+                batches = [(k, self._take(k)) for k in keys]
+
+            return sum(self._store(k, documents) for k, documents in batches)
+
+    def close(self):
+        """
+        Stops the writer thread and flushes everything; returns how many
+        documents could not be stored
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        unwritten = self.flush()
+        if unwritten:
+            log_event("write_behind_unwritten", logging.ERROR, documents=unwritten)
+        return unwritten
+
+    def _take(self, key: str):
+        self.oldest.pop(key, None)
+        return self.pending.pop(key, [])
+
+    def _due(self):
+        now = time.monotonic()
+        return [
+            key
+            for key, documents in self.pending.items()
+            if len(documents) >= self.max_docs
+            or now - self.oldest[key] >= self.max_wait
+        ]
+
+    def _store(self, key: str, documents: list):
+        unwritten = self._write(documents)
+        if unwritten:
+            self._requeue(key, unwritten)
+        return len(unwritten)
+
+    def _write(self, documents: list):
+        """
+        Inserts `documents`, retrying with backoff; returns those not stored
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if not documents:
+                return []
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                self.collection.insert_many(documents, ordered=False)
+                self.inserted += len(documents)
+                return []
+            except Exception as e:
+                error = e
+                documents = self._unwritten(documents, e)
+
+        self.errors += 1
+        log_event(
+            "write_behind_failed",
+            logging.ERROR,
+            documents=len(documents),
+            error=str(error),
+        )
+        return documents
+
+    def _unwritten(self, documents: list, error: Exception):
+        """
+        The documents an unordered insert_many that raised `error` did not store
+        """
+        # BulkWriteError lists the failed documents; anything else, assume none
+        # were stored
+        write_errors = (getattr(error, "details", None) or {}).get("writeErrors")
+        if write_errors is None:
+            return documents
+        # insert_many set their _id, so a retry of a stored one is a duplicate
+        failed = {
+            write_error["index"]
+            for write_error in write_errors
+            if write_error.get("code") != DUPLICATE_KEY
+        }
+        self.inserted += len(documents) - len(failed)
+        return [documents[i] for i in sorted(failed)]
+
+    def _requeue(self, key: str, documents: list):
+        with self.condition:
+            waiting = sum(len(queued) for queued in self.pending.values())
+            kept = documents[: max(self.max_pending - waiting, 0)]
+            if kept:
+                self.pending[key][:0] = kept
+                self.oldest[key] = time.monotonic()
+        dropped = len(documents) - len(kept)
+        if dropped:
+            self.dropped += dropped
+            log_event("write_behind_dropped", logging.ERROR, documents=dropped)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self._due():
+                    if self.oldest:
+                        timeout = self.max_wait - (
+                            time.monotonic() - min(self.oldest.values())
+                        )
+                    else:
+                        timeout = None
+                    self.condition.wait(timeout if timeout is None else max(timeout, 0))
+                if self.closed:
+                    return
+
+            with self.write_lock:
+                with self.condition:
+                    batches = [(key, self._take(key)) for key in self._due()]
+
+                for key, documents in batches:
+                    self._store(key, documents)